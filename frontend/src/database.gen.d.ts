@@ -43,6 +43,25 @@ export interface Assemblies {
   name: string;
 }
 
+export interface BallotGroupResults {
+  abstain: number;
+  absent: number;
+  ballot_id: number;
+  mode_vote: Vote;
+  no: number;
+  pg_id: string;
+  yes: number;
+}
+
+export interface BallotResults {
+  abstain: number;
+  absent: number;
+  ballot_id: number;
+  no: number;
+  outcome: Vote | null;
+  yes: number;
+}
+
 export interface Ballots {
   id: number;
   minutes_url: string | null;
@@ -73,6 +92,7 @@ export interface CommitteeReports {
 export interface CommitteeReportSignatures {
   committee_report_id: string;
   person_id: number;
+  pg_id: string | null;
 }
 
 export interface ElectionBudgets {
@@ -175,6 +195,7 @@ export interface Objections {
   committee_report_id: string | null;
   id: Generated<number>;
   motion: string | null;
+  objection_index: number;
   reasoning: string | null;
 }
 
@@ -239,6 +260,7 @@ export interface Proposals {
 export interface ProposalSignatures {
   first: boolean | null;
   person_id: number;
+  pg_id: string | null;
   proposal_id: string;
 }
 
@@ -255,6 +277,7 @@ export interface Speeches {
   agenda_item_parliament_id: string | null;
   id: string;
   person_id: number;
+  pg_id: string | null;
   record_assembly_code: string | null;
   record_number: number | null;
   record_year: number | null;
@@ -272,6 +295,7 @@ export interface Topics {
 export interface Votes {
   ballot_id: number;
   person_id: number;
+  pg_id: string | null;
   vote: Vote | null;
 }
 
@@ -279,6 +303,8 @@ export interface DB {
   absences: Absences;
   agenda_items: AgendaItems;
   assemblies: Assemblies;
+  ballot_group_results: BallotGroupResults;
+  ballot_results: BallotResults;
   ballots: Ballots;
   committee_budget_reports: CommitteeBudgetReports;
   committee_report_signatures: CommitteeReportSignatures;
@@ -1,9 +1,14 @@
-import pandas as pd
-from lxml import etree
-from io import StringIO
+import hashlib
+import functools
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 from xml.dom import minidom
+from typing import ClassVar
+from render_cache import cached_render
+
+# Bump this whenever a change to the parsers changes the rendered markdown, so
+# that the renders cached by earlier versions are not used anymore
+RENDERER_VERSION = 5
 
 
 def prettify(elem):
@@ -57,108 +62,344 @@ NS = {
 }
 
 
+# Clark tags of the law text elements saados_to_md handles
+TABLE_TAG = f"{{{NS['tau']}}}table"
+_SAA = f"{{{NS['saa']}}}"
+_SAADOS_TITLE_TAGS = {
+    f"{_SAA}LakiehdotusNumeroKooste": "num",
+    f"{_SAA}SaadostyyppiKooste": "stype",
+    f"{_SAA}SaadosNimekeKooste": "sname",
+}
+
+
+@functools.cache
+def _clark(tag):
+    """Clark name of a `prefix:name` tag"""
+    prefix, name = tag.split(":")
+    return f"{{{NS[prefix]}}}{name}"
+
+
+# Sections and elements that the extractors look up from whole documents
+INDEXED_TAGS = tuple(
+    _clark(tag)
+    for tag in (
+        "jme:JulkaisuMetatieto",
+        "asi:EduskuntaTunniste",
+        "met:Nimeke",
+        "met1:NimekeTeksti",
+        "met:Toimija",
+        "org:Henkilo",
+        "he:HallituksenEsitys",
+        "eka:Lakialoite",
+        "eka:EduskuntaAloite",
+        "kys:Kysymys",
+        "vml:Mietinto",
+        "vas:JasenMielipideOsa",
+        "asi:PerusteluOsa",
+        "asi:SisaltoKuvaus",
+        "asi:AsiaKuvaus",
+        "vsk:AsiaKuvaus",
+        "asi:PaatosOsa",
+        "vsk:PaatosOsa",
+        "asi:PonsiOsa",
+        "saa:Saados",
+        "asi:Allekirjoittaja",
+        "vsk:OsallistujaOsa",
+        "ptk:KokousPoytakirja",
+        "ptk:Poytakirja",
+        "vsk:Asiakohta",
+        "vsk:MuuAsiakohta",
+        "vsk:KohtaAsiakirja",
+        "vsk:PuheenvuoroToimenpide",
+    )
+)
+
+
+class DocumentIndex:
+    """
+    Buckets the elements of a VASKI document that the extractors look up by
+    their Clark tag, in document order, with a single walk over the tree.
+
+    Lookups return the elements below `root`, like `.//` searches from it
+    would. `scoped(element)` gives a view of the same index rooted at one of
+    its elements, e.g. the proposal inside a document, so sections are found
+    without searching the tree again.
+    """
+
+    def __init__(self, root, buckets=None, positions=None):
+        self.root = root
+        if buckets is None:
+            buckets = {tag: [] for tag in INDEXED_TAGS}
+            positions = {}
+            for position, element in enumerate(root.iter(*INDEXED_TAGS)):
+                buckets[element.tag].append(element)
+                positions[element] = position
+        self.buckets = buckets
+        self.positions = positions
+        self.whole = root.getparent() is None
+
+    @classmethod
+    def of(cls, root):
+        """`root` itself if it already is an index, otherwise a new index of it"""
+        return root if isinstance(root, cls) else cls(root)
+
+    def scoped(self, element):
+        """A view of the index that only sees the elements below `element`"""
+        return DocumentIndex(element, self.buckets, self.positions)
+
+    def _below_root(self, element):
+        if self.whole:
+            return element is not self.root
+        return any(a is self.root for a in element.iterancestors(self.root.tag))
+
+    def _inside(self, element, tag):
+        """Whether `element` has an ancestor of `tag` below the root"""
+        for ancestor in element.iterancestors():
+            if ancestor is self.root:
+                return False
+            if ancestor.tag == tag:
+                return True
+        return False
+
+    def findall(self, *tags, inside=None):
+        """
+        The elements of any of `tags` below the root in document order. With
+        `inside`, only those that are within an element of that tag.
+        """
+        if len(tags) == 1:
+            elements = self.buckets[_clark(tags[0])]
+        else:
+            elements = sorted(
+                (e for tag in tags for e in self.buckets[_clark(tag)]),
+                key=self.positions.__getitem__,
+            )
+        elements = [e for e in elements if self._below_root(e)]
+        if inside is not None:
+            elements = [e for e in elements if self._inside(e, _clark(inside))]
+        return elements
+
+    def find(self, tag):
+        """The first element of `tag` below the root, or None"""
+        for element in self.buckets[_clark(tag)]:
+            if self._below_root(element):
+                return element
+        return None
+
+    def children(self, tag, parent):
+        """The elements of `tag` whose parent is an element of tag `parent`"""
+        parent = _clark(parent)
+        return [
+            e
+            for e in self.findall(tag)
+            if e.getparent() is not self.root and e.getparent().tag == parent
+        ]
+
+    def group_by_ancestor(self, tag, ancestor):
+        """Maps every `ancestor` element to the elements of `tag` inside it"""
+        groups = {}
+        ancestor = _clark(ancestor)
+        for element in self.findall(tag):
+            for parent in element.iterancestors(ancestor):
+                groups.setdefault(parent, []).append(element)
+        return groups
+
+
 def _txt(node):
     """Collapse all text from an element; return '' if node is None."""
     if node is None:
         return ""
-    elif node.tag == "{http://www.vn.fi/skeemat/taulukkokooste/2010/04/27}table":
+    elif node.tag == TABLE_TAG:
         return tau_to_md(node)
     return " ".join("".join(node.itertext()).split())
 
 
+def _txt_without_tables(node):
+    """Like `_txt`, but leaves out the text of the tables inside `node`"""
+    parts = []
+
+    def collect(element):
+        if element.text and isinstance(element.tag, str):
+            parts.append(element.text)
+        for child in element:
+            if child.tag != TABLE_TAG:
+                collect(child)
+            if child.tail:
+                parts.append(child.tail)
+
+    collect(node)
+    return " ".join("".join(parts).split())
+
+
+@cached_render(RENDERER_VERSION)
 def saados_to_md(saados, NS):
-    title_bits = []
-    stype = _txt(saados.find(".//saa:SaadostyyppiKooste", namespaces=NS))
-    sname = _txt(saados.find(".//saa:SaadosNimekeKooste", namespaces=NS))
-    num = _txt(saados.find(".//saa:LakiehdotusNumeroKooste", namespaces=NS))
-    if num:
-        title_bits.append(num)
-    if stype:
-        title_bits.append(stype)
-    if sname:
-        title_bits.append(sname)
-    header = " ".join(title_bits).strip()
+    """
+    Renders a <Saados> in a single walk over its tree: the title, the preamble
+    (Johtolause) and the sections (Pykälä) with their moments and items. Every
+    table is rendered once, where it occurs.
+    """
+    title = {}
     out = []
-    if header:
-        out.append(f"# {header}\n")
-
-    # Johtolause (preamble)
-    for jl in saados.findall(".//saa:Johtolause", namespaces=NS):
-        for p in jl.findall(".//saa:SaadosKappaleKooste", namespaces=NS):
-            table_md = ""
-            for table in saados.findall(".//tau:table", NS):
-                table_md = tau_to_md(table)
-            txt = _txt(p) + table_md
-            if txt:
-                out.append(txt)
-
-    # Pykälät
-    for pyk in saados.findall(".//saa:Pykala", namespaces=NS):
-        pykno = _txt(pyk.find(".//saa:PykalaTunnusKooste", namespaces=NS))
-        ots = _txt(pyk.find(".//saa:SaadosOtsikkoKooste", namespaces=NS))
-        head = f"**{pykno} {ots}**".strip()
-        if head and head != "** **":
-            out.append(head)
-
-        for mom in pyk.findall(".//saa:MomenttiKooste", namespaces=NS):
-            mtxt = _txt(mom)
-            if mtxt:
-                out.append(mtxt)
-
-        for km in pyk.findall(".//saa:KohdatMomentti", namespaces=NS):
-            johd = _txt(km.find(".//saa:MomenttiJohdantoKooste", namespaces=NS))
-            if johd:
-                out.append(johd)
-                for table in saados.findall(".//tau:table", namespaces=NS):
-                    table_md = tau_to_md(table)
-                    out.append(table_md)
 
-            for k in km.findall(".//saa:MomenttiKohtaKooste", namespaces=NS):
-                kt = _txt(k)
-                if kt:
-                    out.append(f"- {kt}")
-                    for table in saados.findall(".//tau:table", namespaces=NS):
-                        table_md = tau_to_md(table)
-                        out.append(table_md)
+    def walk(element, johtolause, pykala, kohdat):
+        for child in element:
+            tag = child.tag
+            if tag == TABLE_TAG:
+                table_md = tau_to_md(child)
+                if table_md:
+                    out.append(table_md)
+                continue
+            if tag in _SAADOS_TITLE_TAGS:
+                title.setdefault(_SAADOS_TITLE_TAGS[tag], _txt(child))
+                continue
+            if not isinstance(tag, str) or not tag.startswith(_SAA):
+                walk(child, johtolause, pykala, kohdat)
+                continue
 
+            match tag[len(_SAA) :]:
+                case "Johtolause":
+                    walk(child, True, pykala, kohdat)
+                    continue
+                case "Pykala":
+                    # The heading goes before the contents, once they are known
+                    heading = {}
+                    position = len(out)
+                    walk(child, johtolause, heading, kohdat)
+                    pykno = heading.get("PykalaTunnusKooste", "")
+                    ots = heading.get("SaadosOtsikkoKooste", "")
+                    head = f"**{pykno} {ots}**".strip()
+                    if head and head != "** **":
+                        out.insert(position, head)
+                    continue
+                case "PykalaTunnusKooste" | "SaadosOtsikkoKooste" if pykala is not None:
+                    pykala.setdefault(tag[len(_SAA) :], _txt(child))
+                    continue
+                case "KohdatMomentti" if pykala is not None:
+                    walk(child, johtolause, pykala, True)
+                    continue
+                case "SaadosKappaleKooste" if johtolause:
+                    text = _txt_without_tables(child)
+                case "MomenttiKooste" if pykala is not None:
+                    text = _txt_without_tables(child)
+                case "MomenttiJohdantoKooste" if kohdat:
+                    text = _txt_without_tables(child)
+                case "MomenttiKohtaKooste" if kohdat:
+                    text = _txt_without_tables(child)
+                    text = f"- {text}" if text else text
+                case _:
+                    walk(child, johtolause, pykala, kohdat)
+                    continue
+
+            if text:
+                out.append(text)
+            # Tables inside the text follow it
+            walk(child, johtolause, pykala, kohdat)
+
+    walk(saados, False, None, False)
+
+    title_bits = [title[key] for key in ("num", "stype", "sname") if title.get(key)]
+    header = " ".join(title_bits).strip()
+    if header:
+        out.insert(0, f"# {header}\n")
     return "\n\n".join(out)
 
 
+_TAU = f"{{{NS['tau']}}}"
+# Paragraphs whose text makes up the contents of a table cell
+_CELL_TEXT_TAGS = (
+    f"{{{NS['sis']}}}KappaleKooste",
+    f"{{{NS['saa']}}}SaadosKappaleKooste",
+    f"{{{NS['sis1']}}}LihavaTeksti",
+)
+
+
+def _entry_text(entry):
+    """The text of a table cell, its paragraphs separated by line breaks"""
+    values = [
+        k.text.strip()
+        for k in entry.iter(*_CELL_TEXT_TAGS)
+        if k.text and k.text.strip()
+    ]
+    if not values and entry.text and entry.text.strip():
+        values.append(entry.text.strip())
+    return " <br> ".join(values).replace("|", "\\|")
+
+
+def _tgroup_rows(tgroup, colspecs):
+    """
+    Lays the entries of a tau:tgroup out on a grid of rows and columns. An entry
+    goes to the column of its `colname`, or the first free one after the previous
+    entry. Spans over columns (`namest`-`nameend`) and rows (`morerows`) are
+    reserved, so the entries after them land in the right columns, and the
+    contents of a spanning entry are shown in its first cell.
+    """
+    columns = {
+        colspec.get("colname"): i
+        for i, colspec in enumerate(colspecs)
+        if colspec.get("colname")
+    }
+    width = len(colspecs)
+    rows = []
+    spanned = {}  # column -> rows it is still spanned over from above
+    for row in tgroup.iter(f"{_TAU}row"):
+        cells = [""] * width
+        taken = set(spanned)
+        below = {}
+        column = 0
+        for entry in row.iterchildren(f"{_TAU}entry"):
+            start = columns.get(entry.get("namest") or entry.get("colname"))
+            if start is None:
+                start = column
+                while start in taken:
+                    start += 1
+            end = max(columns.get(entry.get("nameend"), start), start)
+            if end >= len(cells):
+                cells.extend([""] * (end + 1 - len(cells)))
+            cells[start] = _entry_text(entry)
+            taken.update(range(start, end + 1))
+            morerows = int(entry.get("morerows") or 0)
+            if morerows > 0:
+                below.update(dict.fromkeys(range(start, end + 1), morerows))
+            column = end + 1
+        rows.append(cells)
+        spanned = {col: left - 1 for col, left in spanned.items() if left > 1}
+        spanned.update(below)
+    return rows
+
+
+def _markdown_table(rows):
+    """
+    Renders the rows as a markdown pipe table, the first row as its header, laid
+    out like the pipe tables of tabulate: headers get two characters of padding,
+    and the columns are marked left-aligned only when there are rows below them.
+    """
+    width = max(len(row) for row in rows)
+    header, *body = [row + [""] * (width - len(row)) for row in rows]
+    widths = [
+        max(len(header[i]) + 2, max((len(row[i]) for row in body), default=0))
+        for i in range(width)
+    ]
+    lines = [
+        "| " + " | ".join(c.ljust(w) for c, w in zip(row, widths, strict=True)) + " |"
+        for row in [header, *body]
+    ]
+    rules = (":" + "-" * (w + 1) if body else "-" * (w + 2) for w in widths)
+    lines.insert(1, "|" + "|".join(rules) + "|")
+    return "\n".join(lines)
+
+
 def tau_to_md(root):
-    dfs = []
-    for tgroup in root.findall(".//tau:tgroup", NS):
+    """Renders every tau:tgroup of a table with more than one column"""
+    tables = []
+    for tgroup in root.iter(f"{_TAU}tgroup"):
         # Skip if it looks like a title block (only 1 column)
-        colspecs = tgroup.findall("tau:colspec", NS)
+        colspecs = tgroup.findall(f"{_TAU}colspec")
         if len(colspecs) <= 1:
             continue
+        rows = _tgroup_rows(tgroup, colspecs)
+        if rows:
+            tables.append(_markdown_table(rows))
 
-        columns = {}
-        for row in tgroup.findall(".//tau:row", NS):
-            entries = row.findall("tau:entry", NS)
-            for entry in entries:
-                col_n = entry.get("colname", "")
-                kappale_list = entry.xpath(
-                    ".//sis:KappaleKooste | "
-                    ".//saa:SaadosKappaleKooste | "
-                    ".//sis1:LihavaTeksti",
-                    namespaces=NS,
-                )
-                values = [
-                    k.text.strip() for k in kappale_list if k.text and k.text.strip()
-                ]
-                if not values and entry.text and entry.text.strip():
-                    values.append(entry.text.strip())
-                if col_n in columns.keys():
-                    columns[col_n].append(" <br> ".join(values) if values else "")
-                else:
-                    columns[col_n] = [(" <br> ".join(values) if values else "")]
-
-        df = pd.DataFrame({k: pd.Series(v) for k, v in columns.items()})
-        df.columns = df.iloc[0]  # first row becomes header
-        df = df.drop(df.index[0])  # remove that row from data
-        dfs.append(df.to_markdown(index=False))
-
-    return "\n\n".join(dfs)
+    return "\n\n".join(tables)
 
 
 def get_tag_type(element: Element) -> str:
@@ -196,90 +437,253 @@ def LihavaKursiiviTeksti_parse(element: Element):
     return f"***{element.text.strip()}*** "
 
 
+def footnote_id_of(text, paragraph, ordinal):
+    """
+    Deterministic identifier for a footnote, derived from its text, the text of
+    its paragraph and its ordinal among the footnotes of the paragraph, so that
+    the same footnote in different places gets different identifiers
+    """
+    key = f"{text}\0{paragraph}\0{ordinal}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def _italic(value, out, citations):
+    out.append(KursiiviTeksti_parse(value))
+
+
+def _bold(value, out, citations):
+    out.append(LihavaTeksti_parse(value))
+
+
+def _bold_italic(value, out, citations):
+    out.append(LihavaKursiiviTeksti_parse(value))
+
+
+_SUPERSCRIPTS = {"2": "²", "3": "³"}
+_SUBSCRIPTS = {"1": "₁", "2": "₂", "3": "₃", "10": "₁₀"}  # for example "PM10"
+
+
+def _superscript(value, out, citations):
+    if value.text is None:
+        return  # Some documents have empty XML nodes like this
+    out.append(_SUPERSCRIPTS.get(value.text.strip(), f"<sup>{value.text}</sup>"))
+
+
+def _subscript(value, out, citations):
+    out.append(_SUBSCRIPTS.get(value.text.strip(), f"<sub>{value.text}</sub>"))
+
+
+def _footnote(value, out, citations):
+    paragraph = "".join(value.getparent().itertext())
+    footnote_id = footnote_id_of(value.text, paragraph, len(citations))
+    out.append(f"[^{footnote_id}]")
+    citations.append(f"[^{footnote_id}]: {value.text}")
+
+
+def _link(value, out, citations):
+    out.append(f"[{value[0].text}]({value.get(f'{{{NS["ns1"]}}}viiteURL')})")
+
+
+def _footnote_block(value, out, citations):
+    out.append(f"({KappaleKooste_parse(value).strip()})")
+
+
+def _line_break(value, out, citations):
+    # TODO: this is not a good solution, the documents look like there
+    # would be a better way to parse these than to force a line break
+    out.append("  \n")
+
+
+def _gap(value, out, citations):
+    # TODO: might be unnecessary? extra whitespace isn't too bad, though
+    out.append(" ")
+
+
+def _reference(value, out, citations):
+    # No special meaning (yet)
+    # TODO: we could use these to add hyperlinks to the related documents
+    out.append(value.text)
+
+
+def _heading(element, level):
+    return OtsikkoTeksti_parse(element, level)
+
+
+def _paragraph(element, level):
+    return KappaleKooste_parse(element)
+
+
+def _indented_paragraph(element, level):
+    return f"> {KappaleKooste_parse(element)}"
+
+
+def _table(element, level):
+    return tau_to_md(element)
+
+
+def _image(element, level):
+    return Kuva_parse(element)
+
+
+def _list(element, level):
+    return Lista_parse(element)
+
+
+def _shallow_list(element, level):
+    return SuppeaLista_parse(element)
+
+
+def _nothing(element, level):
+    return ""
+
+
+def _by_clark_tag(handlers):
+    """`handlers` keyed by the Clark tags of their local names in every namespace"""
+    return {
+        f"{{{uri}}}{name}": handler
+        for uri in dict.fromkeys(NS.values())
+        for name, handler in handlers.items()
+    }
+
+
+class MarkdownRenderer:
+    """
+    Renders Vaski XML to markdown.
+
+    Handlers are registered by the local name of a tag, and looked up from
+    tables keyed by the Clark tags of those names in every namespace of NS,
+    which are built once with the class. Tags of other namespaces fall back to
+    their local name. The tree is walked with an explicit stack instead of
+    recursion, and all output is collected into lists that are joined once at
+    the end.
+    """
+
+    # Inline elements of a paragraph, `(handler(element, out, citations),
+    # skip_empty)`. Formatting with skip_empty is dropped when there is no
+    # text to format.
+    INLINE: ClassVar[dict] = {
+        "KursiiviTeksti": (_italic, True),
+        "HarvaKursiiviTeksti": (_italic, True),
+        "LihavaTeksti": (_bold, True),
+        "LihavaKursiiviTeksti": (_bold_italic, True),
+        "YlaindeksiTeksti": (_superscript, False),
+        "AlaindeksiTeksti": (_subscript, False),
+        "AlaviiteTeksti": (_footnote, False),
+        "YleinenViite": (_link, False),
+        "AlaviiteKooste": (_footnote_block, False),
+        "Rivivaihto": (_line_break, False),
+        "Aukko": (_gap, False),
+        "SaadoskokoelmaViiteTunnus": (_reference, False),
+        "AsiakirjaViiteTunnus": (_reference, False),
+        "SopimussarjaViiteTunnus": (_reference, False),
+    }
+
+    # Block elements with contents, `handler(element, level) -> str`
+    BLOCK: ClassVar[dict] = {
+        "OtsikkoTeksti": _heading,
+        "ValiotsikkoTeksti": _heading,
+        "LihavaKursiiviOtsikkoTeksti": _heading,
+        "RiviotsikkoTeksti": _heading,
+        "KappaleKooste": _paragraph,
+        "JohdantoTeksti": _paragraph,
+        "ViiteTeksti": _paragraph,
+        "SisennettyKappaleKooste": _indented_paragraph,
+        "table": _table,
+        "Kuva": _image,
+        "Lista": _list,
+        "SuppeaLista": _shallow_list,
+        # these tags have no contents or we dont care about them
+        "OtsikkoNroTeksti": _nothing,
+        "Tyhja": _nothing,
+        "NeljannesTyhja": _nothing,
+        "AsiantuntijatToimenpide": _nothing,
+        "Valiokuntakasittely": _nothing,
+        "MuuAsiaKuvaus": _nothing,
+        "YhdistettyAsia": _nothing,  # committee reports pipe
+    }
+    # Block elements whose children are rendered, by how much they deepen the
+    # heading level. PerusteluLuku and VireilletuloAsia denote subchapters.
+    CONTAINER: ClassVar[dict] = {
+        "LukuOtsikko": 0,
+        "PerusteluOsa": 0,
+        "SisaltoKuvaus": 0,
+        "AsiaKuvaus": 0,
+        "PaatosOsa": 0,
+        "PaatosToimenpide": 0,
+        "PonsiOsa": 0,
+        "PykalaViite": 0,
+        "PerusteluLuku": 1,
+        "VireilletuloAsia": 1,
+    }
+
+    # The same tables keyed by Clark tag
+    INLINE_TAGS: ClassVar[dict] = _by_clark_tag(INLINE)
+    BLOCK_TAGS: ClassVar[dict] = _by_clark_tag(BLOCK | CONTAINER)
+
+    def _inline_handler(self, value):
+        try:
+            return self.INLINE_TAGS[value.tag]
+        except KeyError:
+            tag_type = get_tag_type(value)
+            if tag_type not in self.INLINE:
+                raise ParserError(
+                    f"Unknown tag: {tag_type}", value.text, value
+                ) from None
+            return self.INLINE[tag_type]
+
+    def _block_handler(self, element):
+        try:
+            return self.BLOCK_TAGS[element.tag]
+        except KeyError:
+            tag_type = get_tag_type(element)
+            if tag_type in self.BLOCK:
+                return self.BLOCK[tag_type]
+            if tag_type in self.CONTAINER:
+                return self.CONTAINER[tag_type]
+            raise ParserError(f"Unknown tag: {tag_type}", element) from None
+
+    def paragraph(self, element):
+        """Renders the text and inline elements of a paragraph"""
+        out = []
+        citations = []
+        if element.text:
+            out.append(element.text)
+        for value in element:
+            handler, skip_empty = self._inline_handler(value)
+            if not (skip_empty and value.text is None):
+                handler(value, out, citations)
+            if value.tail:
+                out.append(value.tail)
+
+        out.append("\n\n")
+        if citations:
+            out.append("\n\n".join(citations))
+            out.append("\n\n")
+        return "".join(out)
+
+    def render(self, element, level=1):
+        """Renders a block element and everything inside it"""
+        out = []
+        stack = [(element, level)]
+        while stack:
+            element, level = stack.pop()
+            handler = self._block_handler(element)
+            if type(handler) is int:
+                stack.extend((child, level + handler) for child in reversed(element))
+            else:
+                out.append(handler(element, level))
+        return "".join(out)
+
+
+renderer = MarkdownRenderer()
+
+
 def KappaleKooste_parse(element: Element):
     """
     The main XML parsing function, handling all of the different leaf nodes of
     the XML tree.
     """
-
-    def _iter_kappale_content(elem: Element):
-        if elem.text:
-            yield ("text", elem.text)
-        for child in elem:
-            yield ("element", child)
-            if child.tail:
-                yield ("text", child.tail)
-
-    out = ""
-    citations = []
-    for type, value in _iter_kappale_content(element):
-        match type:
-            case "text":
-                out += value
-            case "element":
-                match get_tag_type(value):
-                    case (
-                        "KursiiviTeksti"
-                        | "HarvaKursiiviTeksti"
-                        | "LihavaTeksti"
-                        | "LihavaKursiiviTeksti"
-                    ) if value.text is None:
-                        continue  # sometimes there just isn't any content
-                    case "KursiiviTeksti" | "HarvaKursiiviTeksti":
-                        out += KursiiviTeksti_parse(value)
-                    case "LihavaTeksti":
-                        out += LihavaTeksti_parse(value)
-                    case "LihavaKursiiviTeksti":
-                        out += LihavaKursiiviTeksti_parse(value)
-
-                    case "YlaindeksiTeksti" if value.text is None:
-                        pass  # Some documents have empty XML nodes like this
-                    case "YlaindeksiTeksti" if value.text.strip() == "2":
-                        out += "²"
-                    case "YlaindeksiTeksti" if value.text.strip() == "3":
-                        out += "³"
-                    case "YlaindeksiTeksti":
-                        out += f"<sup>{value.text}</sup>"
-                    case "AlaindeksiTeksti" if value.text.strip() == "1":
-                        out += "₁"
-                    case "AlaindeksiTeksti" if value.text.strip() == "2":
-                        out += "₂"
-                    case "AlaindeksiTeksti" if value.text.strip() == "3":
-                        out += "₃"
-                    case "AlaindeksiTeksti" if value.text.strip() == "10":
-                        out += "₁₀"  # for example "PM10"
-                    case "AlaindeksiTeksti":
-                        out += f"<sub>{value.text}</sub>"
-                    case "AlaviiteTeksti":
-                        out += f"[^{id(value.text)}]"
-                        citations.append(f"[^{id(value.text)}]: {value.text}")
-                    case "YleinenViite":
-                        out += f"[{value[0].text}]({value.get(f'{{{NS["ns1"]}}}viiteURL')})"
-                    case "AlaviiteKooste":
-                        out += f"({KappaleKooste_parse(value).strip()})"
-                    case "Rivivaihto":
-                        # TODO: this is not a good solution, the documents look like there
-                        # would be a better way to parse these than to force a line break
-                        out += "  \n"
-                    case "Aukko":
-                        # TODO: might be unnecessary? extra whitespace isn't too bad, though
-                        out += " "
-                    case (
-                        "SaadoskokoelmaViiteTunnus"
-                        | "AsiakirjaViiteTunnus"
-                        | "SopimussarjaViiteTunnus"
-                    ):
-                        # No special meaning (yet)
-                        # TODO: we could use these to add hyperlinks to the related documents
-                        out += value.text
-
-                    case unknown:
-                        raise ParserError(f"Unknown tag: {unknown}", value.text, value)
-
-    if len(citations) > 0:
-        return out + "\n\n" + "\n\n".join(citations) + "\n\n"
-    else:
-        return out + "\n\n"
+    return renderer.paragraph(element)
 
 
 def Kuva_parse(element: Element):
@@ -369,100 +773,56 @@ def SuppeaLista_parse(element: Element):
 def xml_to_markdown(element: Element, level: int = 1):
     """
     Generic Vaski XML parser aiming to handle all text formatting cases and nested
-    heading levels via recursion.
+    heading levels.
     """
-    match get_tag_type(element):
-        # parse actual contents
-        case (
-            "OtsikkoTeksti"
-            | "ValiotsikkoTeksti"
-            | "LihavaKursiiviOtsikkoTeksti"
-            | "RiviotsikkoTeksti"
-        ):
-            return OtsikkoTeksti_parse(element, level)
-        case "KappaleKooste" | "JohdantoTeksti" | "ViiteTeksti":
-            return KappaleKooste_parse(element)
-        case "SisennettyKappaleKooste":
-            return f"> {KappaleKooste_parse(element)}"
-        case "table":
-            return tau_to_md(element)
-        case "Kuva":
-            return Kuva_parse(element)
-        case "Lista":
-            return Lista_parse(element)
-        case "SuppeaLista":
-            return SuppeaLista_parse(element)
-
-        # skip these tags and recurse deeper
-        case (
-            "LukuOtsikko"
-            | "PerusteluOsa"
-            | "SisaltoKuvaus"
-            | "AsiaKuvaus"
-            | "PaatosOsa"
-            | "PaatosToimenpide"
-            | "PonsiOsa"
-            | "PykalaViite"
-        ):
-            return "".join(xml_to_markdown(el, level) for el in element)
-        # this denotes a subchapter so we increment level and recurse
-        case "PerusteluLuku" | "VireilletuloAsia":
-            return "".join(xml_to_markdown(el, level + 1) for el in element)
+    return renderer.render(element, level)
 
-        # these tags have no contents or we dont care about them, end this tail of recursion
-        case (
-            "OtsikkoNroTeksti"
-            | "Tyhja"
-            | "NeljannesTyhja"
-            | "AsiantuntijatToimenpide"
-            | "Valiokuntakasittely"
-            | "MuuAsiaKuvaus"
-            | "YhdistettyAsia"
-        ):  # committee reports pipe
-            return ""
 
-        case unknown_tag:
-            raise ParserError(f"Unknown tag: {unknown_tag}", element)
+# Cached entry point for rendering whole sections, xml_to_markdown itself recurses
+# uncached
+cached_xml_to_markdown = cached_render(RENDERER_VERSION)(xml_to_markdown)
 
 
 def PerusteluOsa_parse_to_markdown(root: Element, NS):
     """Finds and recursively parses `PerusteluOsa` from a root xml node"""
-    reasoning_part = root.find(".//asi:PerusteluOsa", namespaces=NS)
+    reasoning_part = DocumentIndex.of(root).find("asi:PerusteluOsa")
     if reasoning_part is None:
         return None
-    return xml_to_markdown(reasoning_part)
+    return cached_xml_to_markdown(reasoning_part)
 
 
 def AsiaSisaltoKuvaus_parse_to_markdown(root: Element, NS):
     """Finds all `AsiaKuvaus` and `SisaltoKuvaus` nodes and parses them to markdown"""
     # TODO: are all of these relevant?
-    summary_parts = root.xpath(
-        ".//vsk:AsiaKuvaus | .//asi:SisaltoKuvaus | .//asi:AsiaKuvaus", namespaces=NS
+    summary_parts = DocumentIndex.of(root).findall(
+        "vsk:AsiaKuvaus", "asi:SisaltoKuvaus", "asi:AsiaKuvaus"
     )
-    return "\n\n".join(xml_to_markdown(part) for part in summary_parts)
+    return "\n\n".join(cached_xml_to_markdown(part) for part in summary_parts)
 
 
 def PaatosOsa_parse_to_markdown(root: Element, NS):
     """Finds and recursively parses `PaatosOsa` from a root xml node"""
-    opinion_parts = root.xpath(".//vsk:PaatosOsa | .//asi:PaatosOsa", namespaces=NS)
-    return "\n\n".join(xml_to_markdown(part) for part in opinion_parts)
+    opinion_parts = DocumentIndex.of(root).findall("vsk:PaatosOsa", "asi:PaatosOsa")
+    return "\n\n".join(cached_xml_to_markdown(part) for part in opinion_parts)
 
 
 def Ponsi_parse_to_markdown(root: Element, NS):
     """Finds and recursively parses `Ponsi` from a root xml node"""
-    ponsi_part = root.find(".//asi:PonsiOsa", namespaces=NS)
-    return xml_to_markdown(ponsi_part)
+    ponsi_part = DocumentIndex.of(root).find("asi:PonsiOsa")
+    return cached_xml_to_markdown(ponsi_part)
 
 
 def date_parse(root, NS):
-    metadata = root.find(".//jme:JulkaisuMetatieto", namespaces=NS)
+    metadata = DocumentIndex.of(root).find("jme:JulkaisuMetatieto")
     date = metadata.get(f"{{{NS['met1']}}}laadintaPvm", "").strip()
 
     return date
 
 
 def Nimeke_parse(root, NS):
-    title_nodes = root.xpath(".//met:Nimeke//met1:NimekeTeksti", namespaces=NS)
+    title_nodes = DocumentIndex.of(root).findall(
+        "met1:NimekeTeksti", inside="met:Nimeke"
+    )
     title = "\n\n".join([_txt(n) for n in title_nodes])
 
     return title
@@ -470,7 +830,7 @@ def Nimeke_parse(root, NS):
 
 def Saados_parse(root, NS):
     law_md_blocks = []
-    for saados in root.findall(".//saa:SaadosOsa/saa:Saados", namespaces=NS):
+    for saados in DocumentIndex.of(root).children("saa:Saados", "saa:SaadosOsa"):
         law_md = saados_to_md(saados, NS)
         if law_md:
             law_md_blocks.append(law_md)
@@ -480,16 +840,13 @@ def Saados_parse(root, NS):
     return law_changes
 
 
-def status_parse(handling_root, handling_xml_str, NS):
-    handling_root = etree.parse(StringIO(handling_xml_str)).getroot()
-    if (
-        handling_root.find(".//vsk:EduskuntakasittelyPaatosKuvaus", namespaces=NS)
-        is None
-    ):
-        return "open"
-    status = handling_root.find(
+def status_parse(handling_root, NS):
+    decision = handling_root.find(
         ".//vsk:EduskuntakasittelyPaatosKuvaus", namespaces=NS
-    ).attrib.get(f"{{{NS['vsk1']}}}eduskuntakasittelyPaatosKoodi")
+    )
+    if decision is None:
+        return "open"
+    status = decision.attrib.get(f"{{{NS['vsk1']}}}eduskuntakasittelyPaatosKoodi")
     match status:
         case None:
             status = "open"
@@ -514,21 +871,23 @@ def status_parse(handling_root, handling_xml_str, NS):
 
 
 def rollcall_id_parse(root):
-    rollcall_id_node = root.xpath(
-        ".//vsk:MuuAsiakohta//vsk:KohtaAsiakirja[met1:AsiakirjatyyppiNimi[contains(., 'Nimenhuutoraportti')]]/@vsk1:hyperlinkkiKoodi",
-        namespaces=NS,
+    documents = DocumentIndex.of(root).findall(
+        "vsk:KohtaAsiakirja", inside="vsk:MuuAsiakohta"
     )
-
-    if rollcall_id_node:
-        return rollcall_id_node[0]
-    else:
-        return
+    for document in documents:
+        rollcall_id = document.get(f"{{{NS['vsk1']}}}hyperlinkkiKoodi")
+        if rollcall_id is None:
+            continue
+        for type_name in document.iterchildren(_clark("met1:AsiakirjatyyppiNimi")):
+            if "Nimenhuutoraportti" in "".join(type_name.itertext()):
+                return rollcall_id
+    return
 
 
 def absentee_parse(root):
     absentees = []
 
-    for absentee in root.xpath(".//met:Toimija/org:Henkilo", namespaces=NS):
+    for absentee in DocumentIndex.of(root).children("org:Henkilo", "met:Toimija"):
         person_id = int(absentee.get(f"{{{NS['met1']}}}muuTunnus"))
 
         # Collect all lisatieto texts
@@ -542,9 +901,9 @@ def absentee_parse(root):
     return absentees
 
 
-def Allekirjoittaja_parse(root, NS, eid, cursor=None):
+def Allekirjoittaja_parse(root, NS, eid, resolver):
     sgn_records = []
-    for signer in root.findall(".//asi:Allekirjoittaja", namespaces=NS):
+    for signer in DocumentIndex.of(root).findall("asi:Allekirjoittaja"):
         if (
             signer.find(".//org:Henkilo/org1:EtuNimi", namespaces=NS) is None
         ):  # Joskus nää on vaan jostain syystä tyhjiä
@@ -562,24 +921,8 @@ def Allekirjoittaja_parse(root, NS, eid, cursor=None):
             if not first_name or not last_name:  # Joskus nääki voi puuttua huoh
                 continue
 
-            # Joskus sukunimen yhteydessä on puolue
-            if len(last_name.split()) > 1 and last_name.split()[-1].endswith(
-                ("ps", "kok", "vihr", "sd", "r", "liik", "kesk", "vas")
-            ):
-                last_name = "".join(last_name.split()[:-1]).strip()
-
-            cursor.execute(
-                """
-                SELECT id 
-                FROM persons
-                WHERE LOWER(first_name) = %s AND LOWER(last_name) = %s""",
-                (first_name.strip().lower(), last_name.strip().lower()),
-            )
-
-            person_id = cursor.fetchone()
-            if person_id is not None:
-                person_id = person_id[0]
-            else:
+            person_id = resolver.resolve(first_name, last_name)
+            if person_id is None:
                 # Tänne menee sihteerit yms. jotka on joskus allekirjoittamassa esityksiä
                 continue
 
@@ -603,7 +946,9 @@ def Allekirjoittaja_parse(root, NS, eid, cursor=None):
 
 def Osallistuja_parse(root, NS, eid):
     sgn_records = []
-    for person in root.findall(".//vsk:OsallistujaOsa//org:Henkilo", namespaces=NS):
+    for person in DocumentIndex.of(root).findall(
+        "org:Henkilo", inside="vsk:OsallistujaOsa"
+    ):
         person_id = person.get(f"{{{NS['met1']}}}muuTunnus", "").strip()
         if person_id.isdigit():
             sgn_records.append(
@@ -614,7 +959,7 @@ def Osallistuja_parse(root, NS, eid):
 
 
 def id_parse(root, NS):
-    metadata = root.find(".//jme:JulkaisuMetatieto", namespaces=NS)
+    metadata = DocumentIndex.of(root).find("jme:JulkaisuMetatieto")
     eid = metadata.get(f"{{{NS['met1']}}}eduskuntaTunnus", "").strip()
 
     return eid
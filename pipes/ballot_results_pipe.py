@@ -0,0 +1,65 @@
+from db import bulk_load
+
+# The vote counts of every ballot and of every parliamentary group in it, kept
+# in tables so that a ballot page reads a few rows instead of the votes
+
+# Counts of the four votes, by the grouping of the query
+vote_counts = """
+    COUNT(*) FILTER (WHERE vote = 'yes') AS yes,
+    COUNT(*) FILTER (WHERE vote = 'no') AS no,
+    COUNT(*) FILTER (WHERE vote = 'abstain') AS abstain,
+    COUNT(*) FILTER (WHERE vote = 'absent') AS absent
+"""
+
+
+def import_data():
+    with bulk_load(
+        "ballot_results",
+        "ballot_group_results",
+        replace=("ballot_results", "ballot_group_results"),
+    ) as cursor:
+        # Both the ballot totals and the group counts in one pass over the votes
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE vote_counts ON COMMIT DROP AS
+            SELECT ballot_id, pg_id, GROUPING(pg_id) = 1 AS total, {vote_counts}
+            FROM votes
+            GROUP BY GROUPING SETS ((ballot_id, pg_id), (ballot_id));
+            """
+        )
+        # The outcome is the more popular of yes and no, none on a tie
+        cursor.execute(
+            """
+            INSERT INTO ballot_results (ballot_id, yes, no, abstain, absent, outcome)
+            SELECT ballot_id, yes, no, abstain, absent,
+                CASE WHEN yes > no THEN 'yes' WHEN no > yes THEN 'no' END::vote
+            FROM vote_counts
+            WHERE total;
+            """
+        )
+        # Ties of the mode go to the vote first in the order of the vote type
+        cursor.execute(
+            """
+            INSERT INTO ballot_group_results
+                (ballot_id, pg_id, yes, no, abstain, absent, mode_vote)
+            SELECT ballot_id, pg_id, yes, no, abstain, absent,
+                CASE GREATEST(yes, no, abstain, absent)
+                    WHEN yes THEN 'yes'
+                    WHEN no THEN 'no'
+                    WHEN abstain THEN 'abstain'
+                    ELSE 'absent'
+                END::vote
+            FROM vote_counts
+            WHERE NOT total AND pg_id IS NOT NULL;
+            """
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="counts the votes of every ballot and parliamentary group"
+    )
+    parser.parse_args()
+    import_data()
@@ -1,19 +1,39 @@
 import os.path
 import csv
 import argparse
+import polars as pl
 
-from db import get_connection
+from db import delete_keys, bulk_load
+from incremental import HashManifest, content_hash, add_full_argument
+from raw_parquet import scan
+from sinks import copy_frames, read_frames
 
 csv_path = "data/preprocessed/ballots.csv"
+columns = [
+    "id",
+    "title",
+    "session_item_title",
+    "start_time",
+    "parliament_id",
+    "minutes_url",
+    "results_url",
+]
 
 
-def preprocess_data():
-    with open(os.path.join("data", "raw", "SaliDBAanestys.tsv")) as f:
-        ballot_data = list(csv.reader(f, delimiter="\t", quotechar='"'))
+def preprocess_data(full=False):
+    # Only the Finnish ballots are read, KieliId == 1
+    ballot_data = (
+        scan(os.path.join("data", "raw", "SaliDBAanestys.tsv"))
+        .filter(pl.col("KieliId") == 1)
+        .collect()
+    )
+
+    # Only the new and changed ballots are written
+    manifest = HashManifest("ballots", full)
 
     rows = []
-    for ballot in ballot_data[1:]:
-        if ballot[1] == "1":  # KieliId == 1
+    for ballot in ballot_data.iter_rows():
+        if manifest.changed(ballot[0], content_hash(*ballot)):
             row = {
                 "id": ballot[0],
                 "title": ballot[12],
@@ -26,23 +46,33 @@ def preprocess_data():
             rows.append(row)
 
     with open(csv_path, "w") as f:
-        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer = csv.DictWriter(f, fieldnames=columns)
         writer.writerows(rows)
+    manifest.save_pending()
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
+    manifest = HashManifest("ballots")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed ballots waiting to be imported")
+        return
+    _, deleted = pending
+    deleted = [int(ballot_id) for ballot_id in deleted]
+
+    with bulk_load("ballots") as cursor:
+        delete_keys(cursor, "votes", "ballot_id", deleted)
+        delete_keys(cursor, "ballots", "id", deleted)
 
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY ballots(id, title, session_item_title, start_time, parliament_id, minutes_url, results_url) FROM stdin DELIMITERS ',' CSV QUOTE '\"';",
-            f,
+        copy_frames(
+            cursor,
+            "ballots",
+            columns,
+            read_frames(csv_path, has_header=False),
+            ["id"],
         )
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -53,11 +83,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", help="import preprocessed data", action="store_true"
     )
+    add_full_argument(parser)
     args = parser.parse_args()
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.full)
         import_data()
@@ -0,0 +1,207 @@
+import struct
+from datetime import UTC, date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import polars as pl
+
+# Encodes polars frames in the binary format of COPY, which postgres reads
+# without parsing integers and timestamps from text or unquoting long texts
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+
+header = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+trailer = struct.pack("!h", -1)
+
+epoch_date = date(2000, 1, 1)
+epoch = datetime(2000, 1, 1, tzinfo=UTC)
+microsecond = timedelta(microseconds=1)
+# The epochs of postgres in the days and microseconds of the unix epoch
+epoch_days = (epoch_date - date(1970, 1, 1)).days
+epoch_micros = epoch_days * 86400 * 10**6
+
+# Texts longer than this on average are copied row by row, as scattering them
+# byte by byte would need an index of eight bytes for every byte
+scatter_bytes = 64
+
+
+def _localize(naive, zone):
+    """
+    Places a wall clock time in `zone` as postgres does: an ambiguous time gets
+    the offset after the shift, a skipped one the offset before it
+    """
+    later = naive.replace(tzinfo=zone, fold=1)
+    if later.astimezone(UTC).astimezone(zone).replace(tzinfo=None) == naive:
+        return later
+    return naive.replace(tzinfo=zone)
+
+
+def parse_timestamp(value):
+    """
+    Parses the timestamps of the pipes, ISO 8601 with an optional offset or an
+    IANA zone name after a space ("2015-02-10 14:03:17 Europe/Helsinki").
+    Times without either are taken as UTC.
+    """
+    text, _, zone = value.strip().rpartition(" ")
+    if "/" in zone or zone.isalpha():
+        timestamp = datetime.fromisoformat(text)
+        if timestamp.tzinfo is None:
+            return _localize(timestamp, ZoneInfo(zone))
+        return timestamp
+    timestamp = datetime.fromisoformat(value.strip())
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=UTC)
+    return timestamp
+
+
+def _micros(value):
+    """The microseconds from the postgres epoch to the timestamp `value`"""
+    return (parse_timestamp(value) - epoch) // microsecond
+
+
+def _blank_to_null(series):
+    """Empty strings are NULL, as in the CSV files of the pipes"""
+    if series.dtype == pl.Null:
+        return series.cast(pl.String)
+    if series.dtype == pl.String:
+        return pl.select(pl.when(series != "").then(series)).to_series()
+    return series
+
+
+def _integers(series):
+    return series.cast(pl.Int64)
+
+
+def _bools(series):
+    if series.dtype == pl.String:
+        lowered = series.str.to_lowercase()
+        series = pl.select(
+            pl.when(lowered.is_not_null()).then(lowered.is_in(["t", "true", "1"]))
+        ).to_series()
+    return series.cast(pl.Int64)
+
+
+def _dates(series):
+    if series.dtype == pl.String:
+        series = series.str.slice(0, 10).str.to_date("%Y-%m-%d")
+    elif series.dtype != pl.Date:
+        series = series.dt.date()
+    return series.cast(pl.Int64) - epoch_days
+
+
+def _timestamps(series):
+    if series.dtype == pl.String:
+        # Timestamps repeat, and each distinct one is parsed once
+        values = series.unique().drop_nulls().to_list()
+        if not values:
+            return series.cast(pl.Int64)
+        return series.replace_strict(
+            values, [_micros(value) for value in values], return_dtype=pl.Int64
+        )
+    if series.dtype.time_zone is None:
+        series = series.dt.replace_time_zone("UTC")
+    return series.dt.epoch("us") - epoch_micros
+
+
+# The fixed size types by postgres type name: the conversion of a series to
+# integers and the big-endian type they are sent as
+fixed_types = {
+    "int2": (_integers, ">i2"),
+    "int4": (_integers, ">i4"),
+    "int8": (_integers, ">i8"),
+    "bool": (_bools, "u1"),
+    "date": (_dates, ">i4"),
+    "timestamptz": (_timestamps, ">i8"),
+}
+# The text types and enums share the binary format of text
+text_types = {"text", "varchar", "bpchar"}
+
+
+def _field(series, type_name, is_enum):
+    """The lengths of the values of `series`, -1 for NULL, and their data"""
+    series = _blank_to_null(series)
+    if is_enum or type_name in text_types:
+        series = series.cast(pl.String)
+        lengths = series.str.len_bytes().fill_null(-1).to_numpy().astype(np.int64)
+        return lengths, series.str.join("").item().encode("utf-8")
+
+    convert, dtype = fixed_types[type_name]
+    integers = convert(series)
+    nulls = integers.is_null().to_numpy()
+    integers = integers.fill_null(0).to_numpy()
+    values = integers.astype(dtype)
+    if (values.astype(np.int64) != integers).any():
+        raise ValueError(f"A value of {series.name} is out of range for {type_name}")
+    lengths = np.where(nulls, -1, values.dtype.itemsize).astype(np.int64)
+    return lengths, values
+
+
+def _put(out, positions, values):
+    """Writes the big-endian `values` into the bytes of `out` at `positions`"""
+    width = values.dtype.itemsize
+    out[positions[:, None] + np.arange(width)] = values.view(np.uint8).reshape(
+        -1, width
+    )
+
+
+def _put_texts(out, positions, lengths, data):
+    sizes = np.maximum(lengths, 0)
+    if not len(data):
+        return
+    starts = np.cumsum(sizes) - sizes
+    if len(data) <= scatter_bytes * len(sizes):
+        source = np.frombuffer(data, np.uint8)
+        out[np.repeat(positions - starts, sizes) + np.arange(len(source))] = source
+        return
+    buffer = memoryview(out)
+    for position, start, size in zip(
+        positions.tolist(), starts.tolist(), sizes.tolist(), strict=True
+    ):
+        buffer[position : position + size] = data[start : start + size]
+
+
+def frame_encoder(columns, types):
+    """
+    Returns a function that encodes the rows of a polars frame, whose columns
+    are `columns` in order, given `types` as column -> (type name, is enum).
+    Values are converted from strings, as read from the CSV files of the
+    pipes, or from the matching polars types. None and empty strings are NULL.
+    """
+    column_types = []
+    for column in columns:
+        type_name, is_enum = types[column]
+        if not is_enum and type_name not in text_types | set(fixed_types):
+            raise ValueError(
+                f"No binary COPY encoding for {column} of type {type_name}"
+            )
+        column_types.append((type_name, is_enum))
+
+    def encode(frame):
+        if frame.width != len(column_types):
+            raise ValueError(
+                f"A frame of {frame.width} columns for {len(column_types)} columns"
+            )
+        fields = [
+            _field(series, *column_type)
+            for series, column_type in zip(
+                frame.get_columns(), column_types, strict=True
+            )
+        ]
+        sizes = np.full(frame.height, 2, np.int64)
+        for lengths, _ in fields:
+            sizes += 4 + np.maximum(lengths, 0)
+        out = np.empty(int(sizes.sum()), np.uint8)
+        positions = np.cumsum(sizes) - sizes
+        _put(out, positions, np.full(frame.height, len(fields), ">i2"))
+        positions += 2
+        for lengths, data in fields:
+            _put(out, positions, lengths.astype(">i4"))
+            positions += 4
+            if isinstance(data, bytes):
+                _put_texts(out, positions, lengths, data)
+            else:
+                present = lengths >= 0
+                _put(out, positions[present], data[present])
+            positions += np.maximum(lengths, 0)
+        return out.data
+
+    return encode
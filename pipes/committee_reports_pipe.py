@@ -1,9 +1,9 @@
 import os
-import csv
 import pandas as pd
 from lxml import etree
 from io import StringIO
 from XML_parsing_help_functions import (
+    RENDERER_VERSION,
     AsiaSisaltoKuvaus_parse_to_markdown,
     PaatosOsa_parse_to_markdown,
     PerusteluOsa_parse_to_markdown,
@@ -13,9 +13,21 @@ from XML_parsing_help_functions import (
     date_parse,
     Saados_parse,
     Osallistuja_parse,
+    DocumentIndex,
     NS,
 )
-from db import get_connection
+from group_attribution import GroupAttribution
+from incremental import HashManifest, add_full_argument
+from db import (
+    upsert_csv,
+    delete_keys,
+    create_staging,
+    merge_staging,
+    copy_csv,
+    bulk_load,
+)
+from vaski_pipeline import map_documents, read_tsv, add_workers_argument
+from person_resolver import PersonResolver
 
 # Paths
 tsv_path = os.path.join("data", "raw", "vaski", "CommitteeReport_fi.tsv")
@@ -29,147 +41,164 @@ objection_signatures_csv = os.path.join(
 )
 
 
-def preprocess_data():
-    conn = get_connection()
-    cur = conn.cursor()
+# Per process state of the document parser, set up by `init_worker`
+worker_state = {}
 
-    os.makedirs(os.path.dirname(committee_reports_csv), exist_ok=True)
-    df_tsv = pd.read_csv(tsv_path, sep="\t")
 
-    cr_records = []  # committee_reports rows
+def init_worker(resolver):
+    worker_state["resolver"] = resolver
+
+
+def parse_document(xml_str):
+    """
+    Parses one committee report document into its report row and the rows of
+    its signatures, objections and objection signatures.
+    """
+    resolver = worker_state["resolver"]
+
     cr_sgn_records = []  # committee_report_signatures rows
     objection_records = []  # objections rows
     objection_sgn_records = []  # objection_signatures rows (includes local objection_index)
 
-    for xml_str in df_tsv.get("XmlData", []):
-        root = etree.parse(StringIO(xml_str)).getroot()
+    root = etree.parse(StringIO(xml_str)).getroot()
+    doc = DocumentIndex(root)
 
-        mietinto = root.find(".//vml:Mietinto", namespaces=NS)
-        if mietinto is None:
-            # Talousarviomietinnöt (TalousarvioMietinto) skipataan vielä tässä vaiheessa, koska ne on niin erilaisia
-            # NE PITÄÄ IMPLEMENTOIDA
-            continue
+    mietinto = doc.find("vml:Mietinto")
+    if mietinto is None:
+        # Talousarviomietinnöt (TalousarvioMietinto) skipataan vielä tässä vaiheessa, koska ne on niin erilaisia
+        # NE PITÄÄ IMPLEMENTOIDA
+        return None, [], [], []
+    report = doc.scoped(mietinto)
 
-        # --- committee_report id (eid) ---
-        eid = id_parse(root, NS)
+    # --- committee_report id (eid) ---
+    eid = id_parse(doc, NS)
 
-        date = date_parse(root, NS)
+    date = date_parse(doc, NS)
 
-        # --- proposal_id ---
-        proposal_id = _txt(
-            mietinto.find(
-                ".//asi:IdentifiointiOsa/asi:Vireilletulo/met1:EduskuntaTunnus",
-                namespaces=NS,
-            )
-        ).lower()
+    # --- proposal_id ---
+    proposal_id = _txt(
+        mietinto.find(
+            ".//asi:IdentifiointiOsa/asi:Vireilletulo/met1:EduskuntaTunnus",
+            namespaces=NS,
+        )
+    ).lower()
 
-        # --- committee_name ---
+    # --- committee_name ---
+    node = mietinto.find(
+        ".//asi:IdentifiointiOsa/met:Toimija[@met1:rooliKoodi='Laatija']/met1:YhteisoTeksti",
+        namespaces=NS,
+    )
+    if node is None:
         node = mietinto.find(
-            ".//asi:IdentifiointiOsa/met:Toimija[@met1:rooliKoodi='Laatija']/met1:YhteisoTeksti",
-            namespaces=NS,
+            ".//asi:IdentifiointiOsa/met:Toimija/met1:YhteisoTeksti", namespaces=NS
         )
-        if node is None:
-            node = mietinto.find(
-                ".//asi:IdentifiointiOsa/met:Toimija/met1:YhteisoTeksti", namespaces=NS
-            )
-        committee_name = _txt(node)
+    committee_name = _txt(node)
 
-        # --- proposal_summary (restrict to content NOT under objections) ---
-        # Using XPath to exclude any descendants that live inside vas:JasenMielipideOsa
-        proposal_summary = AsiaSisaltoKuvaus_parse_to_markdown(mietinto, NS)
+    # --- proposal_summary (restrict to content NOT under objections) ---
+    proposal_summary = AsiaSisaltoKuvaus_parse_to_markdown(report, NS)
 
-        # --- opinion (vsk:PaatosOsa), excluding any objection subtrees ---
-        opinion = PaatosOsa_parse_to_markdown(root, NS)
+    # --- opinion (vsk:PaatosOsa), excluding any objection subtrees ---
+    opinion = PaatosOsa_parse_to_markdown(doc, NS)
 
-        # --- report-level reasoning (exclude objection reasoning) ---
-        reasoning = PerusteluOsa_parse_to_markdown(mietinto, NS)
+    # --- report-level reasoning (exclude objection reasoning) ---
+    reasoning = PerusteluOsa_parse_to_markdown(report, NS)
 
-        # --- law changes (saa:SaadosOsa -> Markdown) ---
-        law_changes = Saados_parse(root, NS)
+    # --- law changes (saa:SaadosOsa -> Markdown) ---
+    law_changes = Saados_parse(doc, NS)
 
-        # --- committee_report_signatures (vsk:OsallistujaOsa)
-        cr_sgn_records.extend(Osallistuja_parse(root, NS, eid))
+    # --- committee_report_signatures (vsk:OsallistujaOsa)
+    cr_sgn_records.extend(Osallistuja_parse(doc, NS, eid))
 
-        # --- objections (vas:JasenMielipideOsa) + objection signatures
-        obj_idx = 0
-        for objection in mietinto.findall(".//vas:JasenMielipideOsa", namespaces=NS):
-            obj_idx += 1  # 1-based index per report
+    # --- objections (vas:JasenMielipideOsa) + objection signatures
+    obj_idx = 0
+    for objection in report.findall("vas:JasenMielipideOsa"):
+        obj_idx += 1  # 1-based index per report
+        objection = doc.scoped(objection)
 
-            # Reasoning = asi:PerusteluOsa -> headers + paragraphs (both sis: and sis1:)
-            obj_reasoning = PerusteluOsa_parse_to_markdown(objection, NS)
+        # Reasoning = asi:PerusteluOsa -> headers + paragraphs (both sis: and sis1:)
+        obj_reasoning = PerusteluOsa_parse_to_markdown(objection, NS)
 
-            # Motion = asi:PonsiOsa -> johdanto + paragraphs (both sis: and sis1:)
-            obj_motion = Ponsi_parse_to_markdown(objection, NS)
+        # Motion = asi:PonsiOsa -> johdanto + paragraphs (both sis: and sis1:)
+        obj_motion = Ponsi_parse_to_markdown(objection, NS)
+
+        objection_records.append(
+            {
+                "committee_report_id": eid.lower(),
+                "objection_index": obj_idx,
+                "reasoning": obj_reasoning,
+                "motion": obj_motion,
+            }
+        )
 
-            objection_records.append(
+        # objection signatures under this JasenMielipideOsa
+        for signer in objection.findall("asi:Allekirjoittaja"):
+            person_id = signer.find(".//org:Henkilo", namespaces=NS).attrib.get(
+                f"{{{NS['met1']}}}muuTunnus"
+            )
+            if person_id is None:
+                first_name = signer.find(
+                    ".//org:Henkilo/org1:EtuNimi", namespaces=NS
+                ).text
+                last_name = signer.find(
+                    ".//org:Henkilo/org1:SukuNimi", namespaces=NS
+                ).text
+                if not first_name or not last_name:  # Joskus nääki voi puuttua huoh
+                    continue
+                person_id = resolver.resolve(first_name, last_name)
+                if person_id is None:
+                    # Tänne menee sihteerit yms. jotka on joskus allekirjoittamassa esityksiä
+                    continue
+            objection_sgn_records.append(
                 {
                     "committee_report_id": eid.lower(),
                     "objection_index": obj_idx,
-                    "reasoning": obj_reasoning,
-                    "motion": obj_motion,
+                    "person_id": int(person_id),
                 }
             )
 
-            # objection signatures under this JasenMielipideOsa
-            for signer in objection.findall(".//asi:Allekirjoittaja", namespaces=NS):
-                if signer is None:
-                    continue
-                person_id = signer.find(".//org:Henkilo", namespaces=NS).attrib.get(
-                    f"{{{NS['met1']}}}muuTunnus"
-                )
-                if person_id is None:
-                    first_name = signer.find(
-                        ".//org:Henkilo/org1:EtuNimi", namespaces=NS
-                    ).text
-                    last_name = signer.find(
-                        ".//org:Henkilo/org1:SukuNimi", namespaces=NS
-                    ).text
-                    if not first_name or not last_name:  # Joskus nääki voi puuttua huoh
-                        continue
-                    # Joskus sukunimen yhteydessä on puolue
-                    if len(last_name.split()) > 1 and last_name.split()[-1].endswith(
-                        ("ps", "kok", "vihr", "sd", "r", "liik", "kesk", "vas")
-                    ):
-                        last_name = "".join(last_name.split()[:-1]).strip()
-                    cur.execute(
-                        """
-                        SELECT id 
-                        FROM public.persons 
-                        WHERE LOWER(first_name) = %s AND LOWER(last_name) = %s""",
-                        (first_name.strip().lower(), last_name.strip().lower()),
-                    )
-
-                    person_id = cur.fetchone()
-                    if person_id is not None:
-                        person_id = person_id[0]
-                    else:
-                        # Tänne menee sihteerit yms. jotka on joskus allekirjoittamassa esityksiä
-                        continue
-                objection_sgn_records.append(
-                    {
-                        "committee_report_id": eid,
-                        "objection_index": obj_idx,
-                        "person_id": int(person_id),
-                    }
-                )
-
-        # --- collect committee report row (check for duplicates)
-        cr_records.append(
-            {
-                "id": eid.lower(),
-                "proposal_id": proposal_id,
-                "date": date,
-                "committee_name": committee_name,
-                "proposal_summary": proposal_summary,
-                "opinion": opinion,
-                "reasoning": reasoning,  # report-level reasoning (not objection reasoning)
-                "law_changes": law_changes,
-            }
-        )
+    # --- collect committee report row (check for duplicates)
+    cr_record = {
+        "id": eid.lower(),
+        "proposal_id": proposal_id,
+        "date": date,
+        "committee_name": committee_name,
+        "proposal_summary": proposal_summary,
+        "opinion": opinion,
+        "reasoning": reasoning,  # report-level reasoning (not objection reasoning)
+        "law_changes": law_changes,
+    }
+
+    return cr_record, cr_sgn_records, objection_records, objection_sgn_records
 
-    conn.commit()
-    cur.close()
-    conn.close()
+
+def preprocess_data(workers=1, full=False):
+    os.makedirs(os.path.dirname(committee_reports_csv), exist_ok=True)
+
+    # Only the new and changed reports are parsed
+    manifest = HashManifest("committee_reports", full, RENDERER_VERSION)
+    changed = manifest.select_changed(read_tsv(tsv_path))
+
+    cr_records = []  # committee_reports rows
+    cr_sgn_records = []  # committee_report_signatures rows
+    objection_records = []  # objections rows
+    objection_sgn_records = []  # objection_signatures rows (includes local objection_index)
+
+    groups = GroupAttribution.load()
+    for cr_record, cr_sgns, objections, objection_sgns in map_documents(
+        parse_document,
+        (xml for _, xml in read_tsv(tsv_path, keys=changed)),
+        workers,
+        initializer=init_worker,
+        initargs=(PersonResolver.from_database(),),
+        total=sum(manifest.row_counts[eid] for eid in changed),
+    ):
+        if cr_record is not None:
+            cr_records.append(cr_record)
+            # Signers are attributed to their group on the day of the report
+            groups.attribute(cr_sgns, [cr_record["date"]] * len(cr_sgns))
+        cr_sgn_records.extend(cr_sgns)
+        objection_records.extend(objections)
+        objection_sgn_records.extend(objection_sgns)
 
     # Write CSVs
     pd.DataFrame(cr_records).to_csv(
@@ -184,9 +213,9 @@ def preprocess_data():
     # kirjattu väärällä person_idllä. Virheen mittakaavan huomioiden jätetään tässä kohtaa
     # virheellinen data korjaamatta, vaikka nimitietoja hyödyntäen se olisi teoriassa
     # mahdollista. Sen sijaan poistetaan duplikaatit ja säilytetään vain ensimmäinen löytö.
-    df_cr_sgns = pd.DataFrame(cr_sgn_records).drop_duplicates(
-        subset=["committee_report_id", "person_id"]
-    )
+    df_cr_sgns = pd.DataFrame(
+        cr_sgn_records, columns=["committee_report_id", "person_id", "pg_id"]
+    ).drop_duplicates(subset=["committee_report_id", "person_id"])
     if not df_cr_sgns.empty:
         df_cr_sgns["person_id"] = pd.to_numeric(
             df_cr_sgns["person_id"], errors="coerce"
@@ -212,79 +241,134 @@ def preprocess_data():
         df_obj_sgns = df_obj_sgns.dropna(subset=["person_id"])
         df_obj_sgns["person_id"] = df_obj_sgns["person_id"].astype(int)
     df_obj_sgns.to_csv(objection_signatures_csv, index=False, encoding="utf-8")
+    manifest.save_pending()
 
 
 def import_data():
-    conn = get_connection()
-    cur = conn.cursor()
+    manifest = HashManifest("committee_reports")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed committee reports waiting to be imported")
+        return
+    changed, deleted = pending
+    report_ids = [eid.lower() for eid in changed + deleted]
+
+    with bulk_load(
+        "committee_reports",
+        "committee_report_signatures",
+        "objections",
+        "objection_signatures",
+    ) as cur:
+        # 0) Signatures of changed reports are replaced as a whole. Their objections
+        # are merged by index below, so the objections that remain keep their ids.
+        if report_ids:
+            cur.execute(
+                """
+                DELETE FROM objection_signatures
+                WHERE objection_id IN (
+                    SELECT id FROM objections WHERE committee_report_id = ANY(%s)
+                );
+                """,
+                (report_ids,),
+            )
+        deleted_ids = [eid.lower() for eid in deleted]
+        delete_keys(cur, "objections", "committee_report_id", deleted_ids)
+        delete_keys(
+            cur, "committee_report_signatures", "committee_report_id", report_ids
+        )
+        delete_keys(cur, "committee_reports", "id", deleted_ids)
+
+        # 1) committee_reports
+        with open(committee_reports_csv, "r", encoding="utf-8") as f:
+            upsert_csv(
+                cur,
+                "committee_reports",
+                [
+                    "id",
+                    "proposal_id",
+                    "date",
+                    "committee_name",
+                    "proposal_summary",
+                    "opinion",
+                    "reasoning",
+                    "law_changes",
+                ],
+                f,
+                ["id"],
+            )
 
-    # 1) committee_reports
-    with open(committee_reports_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY committee_reports(id, proposal_id, date, committee_name, proposal_summary, opinion, reasoning, law_changes)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
+        # 2) committee_report_signatures
+        with open(committee_report_signatures_csv, "r", encoding="utf-8") as f:
+            copy_csv(
+                cur,
+                "committee_report_signatures",
+                ["committee_report_id", "person_id", "pg_id"],
+                f,
+            )
+
+        # 3) objections — upserted on their (committee_report_id, objection_index)
+        # natural key. Empty texts stay empty strings instead of NULLs.
+        staging = create_staging(cur, "objections")
+        with open(objections_csv, "r", encoding="utf-8") as f:
+            copy_csv(
+                cur,
+                staging,
+                ["committee_report_id", "objection_index", "reasoning", "motion"],
+                f,
+                force_not_null=["reasoning", "motion"],
+            )
+        merge_staging(
+            cur,
+            "objections",
+            ["committee_report_id", "objection_index", "reasoning", "motion"],
+            ["committee_report_id", "objection_index"],
+        )
+        # Objections that are no longer in their changed report
+        cur.execute(
+            f"""
+            DELETE FROM objections o
+            WHERE o.committee_report_id = ANY(%s)
+            AND NOT EXISTS (
+                SELECT 1 FROM {staging} s
+                WHERE s.committee_report_id = o.committee_report_id
+                AND s.objection_index = o.objection_index
+            );
             """,
-            f,
+            (report_ids,),
         )
+        cur.execute(f"DROP TABLE {staging};")
 
-    # 2) committee_report_signatures
-    with open(committee_report_signatures_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
+        # 4) objection_signatures — joined to their objections by the natural key
+        cur.execute(
+            """
+            CREATE TEMP TABLE objection_signatures_staging (
+                committee_report_id VARCHAR(20),
+                objection_index INT,
+                person_id INT
+            );
             """
-            COPY committee_report_signatures(committee_report_id, person_id)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
         )
-
-    # 3) objections — insert row-by-row to get SERIAL id and map via (committee_report_id, objection_index)
-    obj_id_map = {}  # (committee_report_id, objection_index) -> objection_id
-
-    with open(objections_csv, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            cr_id = row["committee_report_id"]
-            ob_idx = int(row["objection_index"])
-            reasoning = row.get("reasoning", "")
-            motion = row.get("motion", "")
-            cur.execute(
-                """
-                INSERT INTO objections (committee_report_id, reasoning, motion)
-                VALUES (%s, %s, %s)
-                RETURNING id;
-                """,
-                (cr_id, reasoning, motion),
-            )
-            new_id = cur.fetchone()[0]
-            obj_id_map[(cr_id, ob_idx)] = new_id
-
-    # 4) objection_signatures — map each to its correct objection via the local index
-    with open(objection_signatures_csv, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        seen = set()
-        for row in reader:
-            cr_id = row["committee_report_id"].lower()
-            ob_idx = int(row["objection_index"])
-            person_id = int(row["person_id"])
-            key = (cr_id, ob_idx, person_id)
-            if key in seen:
-                continue
-            seen.add(key)
-            ob_id = obj_id_map.get((cr_id, ob_idx))
-            if ob_id is None:
-                continue  # safety guard
-            cur.execute(
-                """
-                INSERT INTO objection_signatures (objection_id, person_id)
-                VALUES (%s, %s);
-                """,
-                (ob_id, person_id),
+        with open(objection_signatures_csv, "r", encoding="utf-8") as f:
+            copy_csv(
+                cur,
+                "objection_signatures_staging",
+                ["committee_report_id", "objection_index", "person_id"],
+                f,
             )
+        cur.execute(
+            """
+            INSERT INTO objection_signatures (objection_id, person_id)
+            SELECT DISTINCT o.id, s.person_id
+            FROM objection_signatures_staging s
+            JOIN objections o
+                ON o.committee_report_id = s.committee_report_id
+                AND o.objection_index = s.objection_index
+            ON CONFLICT DO NOTHING;
+            """
+        )
+        cur.execute("DROP TABLE objection_signatures_staging;")
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -297,12 +381,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", action="store_true", help="Import CSVs into Postgres"
     )
+    add_workers_argument(parser)
+    add_full_argument(parser)
     args = parser.parse_args()
 
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
         import_data()
@@ -1,13 +1,302 @@
 import psycopg2
+import psycopg2.extensions
 import os
+from contextlib import contextmanager
+from instrumentation import count_written_rows
+
+# Session settings of the bulk loads
+bulk_load_settings = {
+    "synchronous_commit": "off",
+    "maintenance_work_mem": os.environ.get("BULK_LOAD_MAINTENANCE_WORK_MEM", "1GB"),
+    "max_parallel_maintenance_workers": os.environ.get(
+        "BULK_LOAD_MAINTENANCE_WORKERS", "4"
+    ),
+}
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Reports the rows written by COPY and INSERT to the running stage"""
+
+    # Tables truncated by the bulk load of this transaction, which can be
+    # copied into with FREEZE
+    freezable = frozenset()
+
+    def execute(self, query, vars=None):
+        result = super().execute(query, vars)
+        count_written_rows(query, self.rowcount)
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        result = super().copy_expert(sql, file, size)
+        count_written_rows(sql, self.rowcount)
+        return result
 
 
 def get_connection():
-    """Connects to a postgres database"""
+    """
+    Connects to a postgres database. The tables are looked up in the schema
+    `DATABASE_SCHEMA` if it is set, which is how the pipes load a shadow schema.
+    """
+    schema = os.environ.get("DATABASE_SCHEMA")
     return psycopg2.connect(
         host=os.environ.get("DATABASE_HOST", "db"),
         port=os.environ.get("DATABASE_PORT", "5432"),
         database=os.environ.get("DATABASE_NAME", "postgres"),
         user=os.environ.get("DATABASE_USER", "postgres"),
         password=os.environ.get("DATABASE_PASSWORD", "postgres"),
+        options=f"-c search_path={schema}" if schema else None,
+        cursor_factory=CountingCursor,
+    )
+
+
+def _copy(cursor, table, columns, f, options, size=8192):
+    if table in cursor.freezable:
+        options.append("FREEZE")
+    cursor.copy_expert(
+        f"COPY {table}({', '.join(columns)}) FROM STDIN WITH ({', '.join(options)});",
+        f,
+        size,
+    )
+
+
+def copy_csv(cursor, table, columns, f, header=True, force_not_null=()):
+    """
+    Copies a CSV file into the `columns` of `table`, with FREEZE if the bulk
+    load of the transaction truncated the table
+    """
+    options = ["FORMAT CSV", f"HEADER {header}", "QUOTE '\"'"]
+    if force_not_null:
+        options.append(f"FORCE_NOT_NULL ({', '.join(force_not_null)})")
+    _copy(cursor, table, columns, f, options)
+
+
+def copy_binary(cursor, table, columns, f, size=8192):
+    """
+    Like copy_csv, for a file in the binary format of COPY, read `size` bytes
+    at a time
+    """
+    _copy(cursor, table, columns, f, ["FORMAT BINARY"], size)
+
+
+def column_types(cursor, table):
+    """The columns of `table` as column -> (type name, is enum)"""
+    cursor.execute(
+        """
+        SELECT a.attname, t.typname, t.typtype = 'e'
+        FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped;
+        """,
+        (table,),
+    )
+    return {column: (type_name, is_enum) for column, type_name, is_enum in cursor}
+
+
+def create_staging(cursor, table):
+    """Creates an empty temporary table shaped like `table` and returns its name"""
+    staging = f"{table}_staging"
+    cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS);")
+    return staging
+
+
+def merge_staging(cursor, table, columns, key_columns):
+    """
+    Merges the staging table of `table` into it with a single
+    INSERT ... ON CONFLICT on `key_columns`
+    """
+    column_list = ", ".join(columns)
+    key_list = ", ".join(key_columns)
+    updates = ", ".join(
+        f"{column} = EXCLUDED.{column}"
+        for column in columns
+        if column not in key_columns
     )
+    cursor.execute(
+        f"""
+        INSERT INTO {table}({column_list})
+        SELECT DISTINCT ON ({key_list}) {column_list} FROM {table}_staging
+        ON CONFLICT ({key_list}) DO {f"UPDATE SET {updates}" if updates else "NOTHING"};
+        """
+    )
+
+
+def upsert_csv(cursor, table, columns, f, key_columns, header=True):
+    """
+    Copies a CSV file into a temporary staging table and merges it into
+    `table` with a single INSERT ... ON CONFLICT on `key_columns`
+    """
+    staging = create_staging(cursor, table)
+    copy_csv(cursor, staging, columns, f, header)
+    merge_staging(cursor, table, columns, key_columns)
+    cursor.execute(f"DROP TABLE {staging};")
+
+
+def delete_keys(cursor, table, columns, keys):
+    """
+    Deletes the rows of `table` whose `columns` match any of `keys` in a single
+    statement. `columns` is either one column name or a tuple of them.
+    """
+    if not keys:
+        return
+    if isinstance(columns, str):
+        cursor.execute(f"DELETE FROM {table} WHERE {columns} = ANY(%s);", (list(keys),))
+    else:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE ({', '.join(columns)}) IN %s;",
+            (tuple(tuple(key) for key in keys),),
+        )
+
+
+class BulkLoad:
+    """
+    Prepares `tables` for loading in one transaction and puts them back in
+    order in `finish`.
+
+    Tables that are empty, or in `replace` and emptied here, are loaded without
+    their secondary indexes and with their triggers, foreign key checks among
+    them, disabled. The ones no foreign key points to are truncated, so they can
+    be copied into with FREEZE. `finish` rebuilds the indexes, with parallel
+    workers where postgres can use them, and checks every foreign key of the
+    table once with a single query, unless `validate` is off.
+    """
+
+    def __init__(self, cursor, tables, replace=(), validate=True):
+        self.cursor = cursor
+        self.validate = validate
+        self.loaded = []  # Tables loaded from empty
+        self.indexes = []  # (table, definition) of the dropped indexes
+
+        self.configure()
+        for table in tables:
+            if table in replace:
+                self.empty(table)
+            elif not self._is_empty(table):
+                continue
+            elif not self._is_referenced(table):
+                self._truncate(table)
+            self._prepare(table)
+
+    def configure(self):
+        """Applies the bulk load settings to the transaction of the cursor"""
+        for name, value in bulk_load_settings.items():
+            self.cursor.execute(f"SET LOCAL {name} = %s;", (value,))
+
+    def empty(self, table):
+        """Deletes the rows of `table`, with TRUNCATE if no foreign key stops it"""
+        if self._is_referenced(table):
+            self.cursor.execute(f"DELETE FROM {table};")
+        else:
+            self._truncate(table)
+
+    def _is_empty(self, table):
+        self.cursor.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table});")
+        return self.cursor.fetchone()[0]
+
+    def _is_referenced(self, table):
+        self.cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE contype = 'f' AND confrelid = %s::regclass);",
+            (table,),
+        )
+        return self.cursor.fetchone()[0]
+
+    def _truncate(self, table):
+        self.cursor.execute(f"TRUNCATE {table};")
+        self.cursor.freezable = self.cursor.freezable | {table}
+
+    def _prepare(self, table):
+        # Indexes that are not behind a primary key or unique constraint
+        self.cursor.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(x.indexrelid)
+            FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = %s::regclass
+            AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint c
+                WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid
+            );
+            """,
+            (table,),
+        )
+        for name, definition in self.cursor.fetchall():
+            self.cursor.execute(f"DROP INDEX {name};")
+            self.indexes.append((table, definition))
+        self.cursor.execute(f"ALTER TABLE {table} DISABLE TRIGGER ALL;")
+        self.loaded.append(table)
+
+    def _foreign_keys(self, table):
+        """The (name, columns, referenced table, referenced columns) of `table`"""
+        self.cursor.execute(
+            """
+            SELECT
+                c.conname,
+                ARRAY(
+                    SELECT a.attname
+                    FROM unnest(c.conkey) WITH ORDINALITY k(attnum, n)
+                    JOIN pg_attribute a
+                        ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+                    ORDER BY k.n
+                ),
+                c.confrelid::regclass::text,
+                ARRAY(
+                    SELECT a.attname
+                    FROM unnest(c.confkey) WITH ORDINALITY k(attnum, n)
+                    JOIN pg_attribute a
+                        ON a.attrelid = c.confrelid AND a.attnum = k.attnum
+                    ORDER BY k.n
+                )
+            FROM pg_constraint c
+            WHERE c.conrelid = %s::regclass AND c.contype = 'f';
+            """,
+            (table,),
+        )
+        return self.cursor.fetchall()
+
+    def _check_foreign_key(self, table, name, columns, referenced, referenced_columns):
+        matches = " AND ".join(
+            f"p.{referenced_column} = r.{column}"
+            for column, referenced_column in zip(
+                columns, referenced_columns, strict=True
+            )
+        )
+        self.cursor.execute(
+            f"""
+            SELECT {", ".join(f"r.{column}" for column in columns)} FROM {table} r
+            WHERE {" AND ".join(f"r.{column} IS NOT NULL" for column in columns)}
+            AND NOT EXISTS (SELECT 1 FROM {referenced} p WHERE {matches})
+            LIMIT 1;
+            """
+        )
+        row = self.cursor.fetchone()
+        if row is not None:
+            raise psycopg2.IntegrityError(
+                f"{table} violates foreign key {name}: {dict(zip(columns, row, strict=True))} is not in {referenced}"
+            )
+
+    def finish(self):
+        for table in self.loaded:
+            self.cursor.execute(f"ALTER TABLE {table} ENABLE TRIGGER ALL;")
+            if self.validate:
+                for foreign_key in self._foreign_keys(table):
+                    self._check_foreign_key(table, *foreign_key)
+        for _, definition in self.indexes:
+            self.cursor.execute(f"{definition};")
+        for table in self.loaded:
+            self.cursor.execute(f"ANALYZE {table};")
+
+
+@contextmanager
+def bulk_load(*tables, replace=(), validate=True):
+    """
+    Opens a connection for loading `tables` in one transaction and yields its
+    cursor. The transaction is committed when the block finishes and rolled
+    back if it raises. See BulkLoad for how the tables are loaded.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        load = BulkLoad(cursor, tables, replace, validate)
+        yield cursor
+        load.finish()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
@@ -1,14 +1,15 @@
 import os
 import polars as pl
 
-from db import get_connection
+from db import get_connection, upsert_csv, bulk_load
+from raw_parquet import scan
 
 raw_path = os.path.join("data", "raw", "election23_budgets.csv")
 csv_path = os.path.join("data", "preprocessed", "election_budgets.csv")
 
 
 def preprocess_data():
-    budgets_df = pl.read_csv(raw_path, infer_schema_length=10000, separator=";")
+    budgets_df = scan(raw_path).collect()
 
     budgets_df = budgets_df.with_columns(
         pl.col("'Etunimet'").str.strip_chars("'").alias("first_name"),
@@ -102,8 +103,8 @@ def preprocess_data():
                         person_id,
                         first_name,
                         last_name
-                    FROM (public.mp_parliamentary_group_memberships
-                    INNER JOIN public.persons ON persons.id = person_id)
+                    FROM (mp_parliamentary_group_memberships
+                    INNER JOIN persons ON persons.id = person_id)
                     WHERE end_date is null 
                     ;""")
 
@@ -132,20 +133,29 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY election_budgets(person_id, support_group, election_year, expenses_total, incomes_total, income_own, income_loan, income_person, income_company, "
-            "income_party, income_party_union, income_forwarded, income_other) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
+    with bulk_load("election_budgets") as cursor, open(csv_path) as f:
+        upsert_csv(
+            cursor,
+            "election_budgets",
+            [
+                "person_id",
+                "support_group",
+                "election_year",
+                "expenses_total",
+                "incomes_total",
+                "income_own",
+                "income_loan",
+                "income_person",
+                "income_company",
+                "income_party",
+                "income_party_union",
+                "income_forwarded",
+                "income_other",
+            ],
             f,
+            ["person_id", "election_year"],
         )
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-
 
 if __name__ == "__main__":
     import argparse
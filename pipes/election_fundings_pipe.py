@@ -1,7 +1,8 @@
 import os
 import polars as pl
 
-from db import get_connection
+from db import get_connection, copy_csv, bulk_load
+from raw_parquet import scan
 
 raw_path = os.path.join("data", "raw", "election23_fundings.csv")
 csv_path = os.path.join("data", "preprocessed", "election_fundings.csv")
@@ -19,7 +20,7 @@ funding_type_map = {
 
 
 def preprocess_data():
-    fundings_df = pl.read_csv(raw_path, infer_schema_length=10000, separator=";")
+    fundings_df = scan(raw_path).collect()
 
     fundings_df = fundings_df.with_columns(
         pl.lit(2023).alias("election_year"),
@@ -58,8 +59,8 @@ def preprocess_data():
                         person_id,
                         first_name,
                         last_name
-                    FROM (public.mp_parliamentary_group_memberships
-                    INNER JOIN public.persons ON persons.id = person_id)
+                    FROM (mp_parliamentary_group_memberships
+                    INNER JOIN persons ON persons.id = person_id)
                     WHERE end_date is null 
                     ;""")
 
@@ -90,20 +91,29 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY election_fundings(person_id, election_year, ftype, funder_organization, funder_company_id, funder_first_name, "
-            "funder_last_name, loan_title, loan_schedule, amount) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
+    # Election fundings have no natural key, so they are always refreshed in full
+    with (
+        bulk_load("election_fundings", replace=("election_fundings",)) as cursor,
+        open(csv_path) as f,
+    ):
+        copy_csv(
+            cursor,
+            "election_fundings",
+            [
+                "person_id",
+                "election_year",
+                "ftype",
+                "funder_organization",
+                "funder_company_id",
+                "funder_first_name",
+                "funder_last_name",
+                "loan_title",
+                "loan_schedule",
+                "amount",
+            ],
             f,
         )
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-
 
 if __name__ == "__main__":
     import argparse
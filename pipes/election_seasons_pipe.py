@@ -1,7 +1,7 @@
 import os.path
 import pandas as pd
 
-from db import get_connection
+from db import upsert_csv, bulk_load
 
 
 csv_path = "data/preprocessed/election_seasons.csv"
@@ -19,19 +19,15 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY election_seasons(start_date, end_date) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
+    with bulk_load("election_seasons") as cursor, open(csv_path) as f:
+        upsert_csv(
+            cursor,
+            "election_seasons",
+            ["start_date", "end_date"],
             f,
+            ["start_date"],
         )
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-
 
 if __name__ == "__main__":
     import argparse
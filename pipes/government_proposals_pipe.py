@@ -3,17 +3,25 @@ import pandas as pd
 from lxml import etree
 from io import StringIO
 from XML_parsing_help_functions import (
+    RENDERER_VERSION,
     AsiaSisaltoKuvaus_parse_to_markdown,
     PerusteluOsa_parse_to_markdown,
     id_parse,
     date_parse,
     Nimeke_parse,
     Saados_parse,
-    status_parse,
     Allekirjoittaja_parse,
+    DocumentIndex,
     NS,
 )
-from db import get_connection
+from handling_index import load_handling_index
+from vaski_pipeline import map_documents, read_tsv, add_workers_argument
+from vaski_index import VaskiIndex
+from person_resolver import PersonResolver
+from group_attribution import GroupAttribution
+from incremental import HashManifest, add_full_argument
+from instrumentation import note
+from db import upsert_csv, delete_keys, copy_csv, bulk_load
 
 # Paths
 gp_tsv_path = os.path.join("data", "raw", "vaski", "GovernmentProposal_fi.tsv")
@@ -23,81 +31,102 @@ government_proposals_csv = os.path.join(
 government_proposal_signatures_csv = os.path.join(
     "data", "preprocessed", "government_proposal_signatures.csv"
 )
-handling_tsv_path = os.path.join(
-    "data", "raw", "vaski", "KasittelytiedotValtiopaivaasia_fi.tsv"
-)
 
 
-def preprocess_data():
-    os.makedirs(os.path.dirname(government_proposals_csv), exist_ok=True)
-    gp_df = pd.read_csv(gp_tsv_path, sep="\t")
-    handling_df = pd.read_csv(handling_tsv_path, sep="\t")
+# Per process state of the document parser, set up by `init_worker`
+worker_state = {}
 
-    gp_records = []  # government_proposals rows
-    sgn_records = []
 
-    conn = get_connection()
-    cur = conn.cursor()
+def init_worker(handling_index, resolver):
+    worker_state["resolver"] = resolver
+    worker_state["handling_index"] = handling_index
 
-    for gp_xml_str in gp_df.get("XmlData", []):
-        gp_root = etree.parse(StringIO(gp_xml_str)).getroot()
 
-        # ID
-        eid = id_parse(gp_root, NS)
-        if eid[:2] == "RP":  # Joskus tänne on sattunu ruotsinkielisiä versioita
-            if (
-                gp_df.loc[gp_df["Eduskuntatunnus"] == f"HE{eid[2:-2]}vp"] is not None
-            ):  # Tsekataan löytyykö sama suomeksi
-                continue  # Jos löytyy niin skipataan ruotsinkielinen versio ja
-            else:  # oletetaan että suomenkielinen on tulossa/mennyt
-                raise Exception
+def parse_document(gp_xml_str):
+    """Parses one proposal document into its proposal row and signature rows"""
+    gp_root = etree.parse(StringIO(gp_xml_str)).getroot()
+    doc = DocumentIndex(gp_root)
 
-        date = date_parse(gp_root, NS)
+    # ID
+    eid = id_parse(doc, NS)
+    if eid[:2] == "RP":  # Joskus tänne on sattunu ruotsinkielisiä versioita
+        # Skipataan ruotsinkielinen versio, suomenkielisen pitäisi löytyä samasta tiedostosta
+        return None, []
 
-        proposal = gp_root.find(".//he:HallituksenEsitys", namespaces=NS)
-        if proposal is None:
-            continue
+    date = date_parse(doc, NS)
 
-        # TITLE
-        title = Nimeke_parse(proposal, NS)
+    proposal = doc.find("he:HallituksenEsitys")
+    if proposal is None:
+        return None, []
+    proposal = doc.scoped(proposal)
 
-        # SUMMARY
-        summary = AsiaSisaltoKuvaus_parse_to_markdown(proposal, NS)
+    # TITLE
+    title = Nimeke_parse(proposal, NS)
 
-        # REASONING
-        reasoning = PerusteluOsa_parse_to_markdown(proposal, NS)
+    # SUMMARY
+    summary = AsiaSisaltoKuvaus_parse_to_markdown(proposal, NS)
 
-        # LAW_CHANGES
-        law_changes = Saados_parse(proposal, NS)
+    # REASONING
+    reasoning = PerusteluOsa_parse_to_markdown(proposal, NS)
 
-        # STATUS
-        handling_xml_str = (
-            handling_df.loc[handling_df["Eduskuntatunnus"] == eid]
-            .get("XmlData", "")
-            .tolist()[0]
-        )
-        handling_root = etree.parse(StringIO(handling_xml_str)).getroot()
-        status = status_parse(handling_root, handling_xml_str, NS)
-
-        gp_records.append(
-            {
-                "id": eid.lower(),
-                "ptype": "government",
-                "date": date,
-                "title": title,
-                "summary": summary,
-                "reasoning": reasoning,
-                "law_changes": law_changes,
-                "status": status,
-            }
-        )
+    # LAW_CHANGES
+    law_changes = Saados_parse(proposal, NS)
 
-        # SIGNATURES
-        sgn_records.extend(Allekirjoittaja_parse(proposal, NS, eid, cur))
+    # STATUS
+    # A matter without a handling document is still open, as status_parse has it
+    status = worker_state["handling_index"].get(eid, "open")
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    gp_record = {
+        "id": eid.lower(),
+        "ptype": "government",
+        "date": date,
+        "title": title,
+        "summary": summary,
+        "reasoning": reasoning,
+        "law_changes": law_changes,
+        "status": status,
+    }
+
+    # SIGNATURES
+    sgn_records = Allekirjoittaja_parse(proposal, NS, eid, worker_state["resolver"])
+
+    return gp_record, sgn_records
+
+
+def preprocess_data(workers=1, full=False):
+    os.makedirs(os.path.dirname(government_proposals_csv), exist_ok=True)
+
+    # Only the new and changed proposals are parsed
+    handling_index = load_handling_index()
+    manifest = HashManifest("government_proposals", full, RENDERER_VERSION)
+    changed = manifest.select_changed(
+        read_tsv(gp_tsv_path), lambda eid: handling_index.get(eid)
+    )
+
+    # Swedish versions are skipped, so a missing Finnish one loses the proposal
+    documents = VaskiIndex(gp_tsv_path)
+    for eid in changed:
+        finnish_eid = "HE" + eid[2:].replace(" rd", " vp")
+        if eid[:2] == "RP" and finnish_eid not in documents:
+            note(f"{eid} has no Finnish version {finnish_eid}")
+
+    gp_records = []  # government_proposals rows
+    sgn_records = []
+
+    groups = GroupAttribution.load()
+    for gp_record, gp_sgn_records in map_documents(
+        parse_document,
+        (xml for _, xml in read_tsv(gp_tsv_path, keys=changed)),
+        workers,
+        initializer=init_worker,
+        initargs=(handling_index, PersonResolver.from_database()),
+        total=sum(manifest.row_counts[eid] for eid in changed),
+    ):
+        if gp_record is not None:
+            gp_records.append(gp_record)
+            # Signers are attributed to their group on the day of the proposal
+            groups.attribute(gp_sgn_records, [gp_record["date"]] * len(gp_sgn_records))
+        sgn_records.extend(gp_sgn_records)
 
     pd.DataFrame(gp_records).to_csv(
         government_proposals_csv, index=False, encoding="utf-8"
@@ -105,33 +134,55 @@ def preprocess_data():
     pd.DataFrame(sgn_records).to_csv(
         government_proposal_signatures_csv, index=False, encoding="utf-8"
     )
+    manifest.save_pending()
 
 
 def import_data():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    with open(government_proposals_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY proposals(id, ptype, date, title, summary, reasoning, law_changes, status)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
+    manifest = HashManifest("government_proposals")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed government proposals waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("proposals", "proposal_signatures") as cur:
+        # Signatures of changed proposals are replaced as a whole
+        delete_keys(
+            cur,
+            "proposal_signatures",
+            "proposal_id",
+            [eid.lower() for eid in changed + deleted],
         )
-
-    with open(government_proposal_signatures_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY proposal_signatures(proposal_id, person_id, first)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
-        )
-
-    conn.commit()
-    cur.close()
-    conn.close()
+        delete_keys(cur, "proposals", "id", [eid.lower() for eid in deleted])
+
+        if changed:
+            with open(government_proposals_csv, "r", encoding="utf-8") as f:
+                upsert_csv(
+                    cur,
+                    "proposals",
+                    [
+                        "id",
+                        "ptype",
+                        "date",
+                        "title",
+                        "summary",
+                        "reasoning",
+                        "law_changes",
+                        "status",
+                    ],
+                    f,
+                    ["id"],
+                )
+
+            with open(government_proposal_signatures_csv, "r", encoding="utf-8") as f:
+                copy_csv(
+                    cur,
+                    "proposal_signatures",
+                    ["proposal_id", "person_id", "first", "pg_id"],
+                    f,
+                )
+
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -144,12 +195,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", action="store_true", help="Import CSVs into Postgres"
     )
+    add_workers_argument(parser)
+    add_full_argument(parser)
     args = parser.parse_args()
 
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
         import_data()
@@ -0,0 +1,122 @@
+from functools import cache
+
+import polars as pl
+from db import get_connection
+
+# Votes, speeches and signatures carry the parliamentary group their person
+# belonged to on the day of the row, so that the groups of a person who
+# switched groups do not share each other's rows.
+#
+# Which group that is, the membership that started last by the day if it had
+# not ended, is decided by the SQL function group_on_day of
+# postgres-init-scripts/01_create_tables.sql alone. The pipes look the groups
+# of their rows up with it before the rows are written, and reattribute_groups
+# of the same file updates the rows in the database when memberships change.
+
+
+def _day(value):
+    """The `yyyy-mm-dd` day of a date or timestamp, or None"""
+    if value is None:
+        return None
+    day = str(value)[:10]
+    return day if len(day) == 10 else None
+
+
+def _person(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GroupAttribution:
+    """Looks up the groups of persons on days with group_on_day"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @classmethod
+    @cache
+    def load(cls):
+        """
+        Connects once per process. The pipes that attribute their rows are
+        preprocessed after the import of the memberships.
+        """
+        conn = get_connection()
+        conn.autocommit = True  # Each lookup is a query of its own
+        return cls(conn)
+
+    def _look_up(self, person_ids, days):
+        """
+        The `(person_id, day, pg_id)` rows of the matching persons and
+        `yyyy-mm-dd` days, in a single query
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT pairs.person_id, pairs.day::text, g.pg_id
+                FROM unnest(%s::int[], %s::date[]) AS pairs(person_id, day)
+                LEFT JOIN LATERAL group_on_day(pairs.person_id, pairs.day)
+                    AS g(pg_id) ON true;
+                """,
+                (person_ids, days),
+            )
+            return cursor.fetchall()
+
+    def groups(self, pairs):
+        """
+        The groups of distinct `(person_id, day)` pairs as a dict keyed by them.
+        Days are `yyyy-mm-dd` texts.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return {}
+        person_ids, days = zip(*pairs, strict=True)
+        rows = self._look_up(list(person_ids), list(days))
+        return {(person_id, day): pg_id for person_id, day, pg_id in rows}
+
+    def attribute(self, rows, days, person_key="person_id"):
+        """
+        Sets the pg_id of the dicts `rows` to the group of their person on the
+        matching date or timestamp of `days`
+        """
+        keys = [
+            (_person(row[person_key]), _day(day))
+            for row, day in zip(rows, days, strict=True)
+        ]
+        groups = self.groups({key for key in keys if None not in key})
+        for row, key in zip(rows, keys, strict=True):
+            row["pg_id"] = groups.get(key)
+
+    def attribute_frame(self, frame, person_column="person_id", day_column="date"):
+        """Adds the pg_id of every row of the polars `frame`, keeping their order"""
+        keys = frame.select(
+            pl.col(person_column).cast(pl.Int64, strict=False).alias("_person"),
+            pl.col(day_column)
+            .cast(pl.String)
+            .str.slice(0, 10)
+            .str.to_date(strict=False)
+            .alias("_day"),
+        )
+        pairs = keys.unique().drop_nulls()
+        looked_up = pl.DataFrame(
+            self._look_up(
+                pairs["_person"].to_list(), pairs["_day"].cast(pl.String).to_list()
+            ),
+            schema={"_person": pl.Int64, "_day": pl.String, "pg_id": pl.String},
+            orient="row",
+        ).with_columns(pl.col("_day").str.to_date())
+        return (
+            frame.with_columns(keys)
+            .join(looked_up, on=["_person", "_day"], how="left", maintain_order="left")
+            .drop("_person", "_day")
+        )
+
+
+def reattribute(cursor, person_ids):
+    """
+    Attributes the rows of `person_ids` in every table with a pg_id anew, after
+    their memberships have changed. Only the rows whose group changes are
+    updated.
+    """
+    cursor.execute("SELECT reattribute_groups(%s::int[]);", (list(person_ids),))
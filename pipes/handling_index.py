@@ -0,0 +1,49 @@
+import csv
+import os
+from io import StringIO
+
+from instrumentation import progress
+from lxml import etree
+from vaski_pipeline import read_tsv
+from XML_parsing_help_functions import NS, status_parse
+
+# Paths
+handling_tsv_path = os.path.join(
+    "data", "raw", "vaski", "KasittelytiedotValtiopaivaasia_fi.tsv"
+)
+handling_index_csv = os.path.join("data", "preprocessed", "handling_index.csv")
+
+
+def build_handling_index():
+    """
+    Parses every handling document (käsittelytiedot) exactly once and writes a
+    compact `eid -> status` index that the document pipes can look statuses up
+    from.
+    """
+    os.makedirs(os.path.dirname(handling_index_csv), exist_ok=True)
+
+    seen = set()
+    with open(handling_index_csv, "w", encoding="utf-8", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=["eid", "status"])
+        writer.writeheader()
+        for eid, xml_str in progress(read_tsv(handling_tsv_path)):
+            # Only the first handling document of each matter counts
+            if eid in seen:
+                continue
+            seen.add(eid)
+
+            handling_root = etree.parse(StringIO(xml_str)).getroot()
+            writer.writerow({"eid": eid, "status": status_parse(handling_root, NS)})
+
+
+def load_handling_index():
+    """
+    Loads the handling index as a dict of `eid -> status`. Matters without a
+    handling document are not in it, and have not been decided on.
+    """
+    with open(handling_index_csv, "r", encoding="utf-8", newline="") as f:
+        return {row["eid"]: row["status"] for row in csv.DictReader(f)}
+
+
+if __name__ == "__main__":
+    build_handling_index()
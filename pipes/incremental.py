@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+from collections import Counter
+
+# Content hashes of everything that has been imported, one manifest per pipe
+hashes_dir = os.environ.get("HASHES_DIR", os.path.join("data", ".hashes"))
+
+
+def _update(digest, parts):
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+
+
+def content_hash(*parts):
+    """Hex digest of the string forms of `parts`"""
+    digest = hashlib.blake2b(digest_size=16)
+    _update(digest, parts)
+    return digest.hexdigest()
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class HashManifest:
+    """
+    Content hashes of the source documents of one pipe, keyed by their natural
+    key (Eduskuntatunnus, personId, AanestysId...).
+
+    Preprocessing compares the current hashes with the ones of the last import
+    and only hands the new or changed documents on. The outcome is saved as a
+    pending manifest, which `commit` promotes once the delta has been imported,
+    so a failed import gets retried on the next run.
+
+    `version` is the version of the code that turns the documents into rows,
+    such as RENDERER_VERSION of the markdown renderer. The hashes of another
+    version say nothing of the rows the current code would produce, so every
+    document counts as changed until a manifest of this version is committed.
+    """
+
+    def __init__(self, name, full=False, version=0):
+        self.path = os.path.join(hashes_dir, f"{name}.json")
+        self.pending_path = os.path.join(hashes_dir, f"{name}.pending.json")
+        self.version = version
+        manifest = _read_json(self.path, {"hashes": {}})
+        self.hashes = manifest["hashes"]
+        # Treat every document as changed
+        self.full = full or manifest.get("version", 0) != version
+        self.current = {}
+        self.digests = {}  # key -> hash of the rows streamed with `add` so far
+        self.row_counts = Counter()
+
+    def _is_changed(self, key, digest):
+        return self.full or self.hashes.get(key) != digest
+
+    def changed(self, key, digest):
+        """Records the hash of `key` and tells whether it is new or has changed"""
+        key = str(key)
+        self.current[key] = digest
+        return self._is_changed(key, digest)
+
+    def add(self, key, *parts):
+        """
+        Streams one row of the document `key` into its hash. A document may span
+        several rows, which are hashed in the order they are added.
+        """
+        if key not in self.digests:
+            self.digests[key] = hashlib.blake2b(digest_size=16)
+        _update(self.digests[key], parts)
+        self.row_counts[key] += 1
+
+    def changed_keys(self, salt=None):
+        """
+        Finishes the hashes of the rows streamed with `add` and returns the set
+        of keys that are new or changed. `salt(key)` can mix in inputs that live
+        outside the documents, e.g. the handling status of a proposal.
+        """
+        changed_keys = set()
+        for key, digest in self.digests.items():
+            if salt is not None:
+                _update(digest, [salt(key)])
+            if self.changed(key, digest.hexdigest()):
+                changed_keys.add(key)
+        self.digests = {}
+        return changed_keys
+
+    def select_changed(self, rows, salt=None):
+        """
+        Hashes a stream of `(key, content, ...)` rows, such as the documents of
+        a VASKI TSV, and returns the set of keys that are new or changed
+        """
+        for key, *parts in rows:
+            self.add(key, *parts)
+        return self.changed_keys(salt)
+
+    def delta(self):
+        """The `(changed, deleted)` keys of the current hashes"""
+        changed = [
+            key for key, digest in self.current.items() if self._is_changed(key, digest)
+        ]
+        deleted = [key for key in self.hashes if key not in self.current]
+        return changed, deleted
+
+    def save_pending(self):
+        os.makedirs(hashes_dir, exist_ok=True)
+        changed, deleted = self.delta()
+        pending = {
+            "version": self.version,
+            "hashes": self.current,
+            "changed": changed,
+            "deleted": deleted,
+        }
+        with open(self.pending_path, "w", encoding="utf-8") as f:
+            json.dump(pending, f)
+
+    def pending(self):
+        """
+        Returns the `(changed, deleted)` keys of the preprocessed delta, or None
+        if there is nothing waiting to be imported
+        """
+        pending = _read_json(self.pending_path, None)
+        if pending is None:
+            return None
+        return pending["changed"], pending["deleted"]
+
+    def commit(self):
+        """Marks the pending delta as imported"""
+        if os.path.exists(self.pending_path):
+            os.replace(self.pending_path, self.path)
+
+
+def add_full_argument(parser):
+    """Adds the `--full` flag shared by the incremental pipes"""
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the hashes of earlier imports and preprocess everything",
+    )
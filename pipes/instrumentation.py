@@ -0,0 +1,225 @@
+import contextlib
+import cProfile
+import json
+import os
+import re
+import resource
+import threading
+import time
+from datetime import datetime
+
+import polars as pl
+from tqdm import tqdm
+
+# One directory of JSON reports per pipeline run
+reports_dir = os.path.join("data", ".reports")
+
+# Staging tables of upserts are not counted as written rows
+copy_target = re.compile(r"^\s*COPY\s+(\w+)", re.IGNORECASE)
+insert_target = re.compile(r"^\s*INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+
+
+def run_id():
+    """
+    The id of the current pipeline run. The orchestrator exports it to all of its
+    stages, a pipe run on its own gets a new one.
+    """
+    if "PIPELINE_RUN_ID" not in os.environ:
+        os.environ["PIPELINE_RUN_ID"] = datetime.now().strftime("%Y%m%dT%H%M%S")
+    return os.environ["PIPELINE_RUN_ID"]
+
+
+def run_dir():
+    path = os.path.join(reports_dir, run_id())
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process alone"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _process_tree(pid):
+    """`pid` and all of its descendants, read from /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The fields after the command, which may contain spaces
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, ()))
+    return tree
+
+
+def _memory_kb(pid):
+    """
+    Proportional set size of `pid`, which counts the pages forked processes
+    share once between them rather than once per process
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def tree_memory_mb(pid=None):
+    """Memory of the process `pid`, this one by default, and its descendants"""
+    return sum(map(_memory_kb, _process_tree(pid or os.getpid()))) / 1024
+
+
+class MemorySampler:
+    """
+    Samples the memory of this process and its descendants, such as the workers
+    of a process pool, every `interval` seconds in a background thread and keeps
+    the peak of their sum
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        if os.path.exists("/proc"):
+            self.peak_mb = max(self.peak_mb, tree_memory_mb())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+class StageMetrics:
+    """Counters of a running stage, reported once it finishes"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.start = time.monotonic()
+        self.seconds = None
+        self.documents = 0
+        self.rows = {}  # table or file -> rows written
+        self.notes = []  # Things about the input worth a look, in the report
+        self.memory = MemorySampler()
+
+    def add_rows(self, target, count):
+        if count > 0:
+            self.rows[target] = self.rows.get(target, 0) + count
+
+    def report(self):
+        seconds = self.seconds or time.monotonic() - self.start
+        rows = sum(self.rows.values())
+        return {
+            "stage": self.stage,
+            "started_at": self.started_at,
+            "seconds": seconds,
+            "documents": self.documents,
+            "documents_per_second": self.documents / seconds if seconds else None,
+            "rows": rows,
+            "rows_per_second": rows / seconds if seconds else None,
+            "rows_by_target": self.rows,
+            "peak_rss_mb": max(self.memory.peak_mb, peak_rss_mb()),
+            "notes": self.notes,
+        }
+
+
+current = None  # StageMetrics of the stage running in this process
+
+
+def _count_csv_rows(path):
+    """The rows of the CSV file `path` below its header"""
+    try:
+        rows = pl.scan_csv(path, infer_schema=False)
+        return rows.select(pl.len()).collect().item()
+    except pl.exceptions.NoDataError:
+        return 0
+
+
+@contextlib.contextmanager
+def instrument(stage, outputs=(), profile=False):
+    """
+    Measures the stage run in the `with` block: wall time, peak memory of the
+    process and its children together, the documents counted by `progress` and
+    the rows written, either into the database through `db.get_connection` or as
+    the CSV files in `outputs`.
+    The report is written to `data/.reports/<run id>/<stage>.json`.
+
+    With `profile`, a cProfile of this process is dumped next to the report.
+    Documents parsed in a process pool are not part of the profile.
+    """
+    global current
+    current = metrics = StageMetrics(stage)
+    profiler = cProfile.Profile() if profile else None
+    filename = stage.replace(":", ".")
+
+    metrics.memory.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(run_dir(), f"{filename}.prof"))
+        metrics.seconds = time.monotonic() - metrics.start
+        metrics.memory.stop()
+        current = None
+
+    for path in outputs:
+        if path.endswith(".csv") and os.path.exists(path):
+            # The preprocessed CSV files all start with a header
+            metrics.add_rows(os.path.basename(path), _count_csv_rows(path))
+
+    with open(os.path.join(run_dir(), f"{filename}.json"), "w") as f:
+        json.dump(metrics.report(), f, indent=2)
+
+
+def progress(documents, total=None, desc=None, unit="doc"):
+    """
+    Iterates `documents` with a live progress bar and ETA, counting them as the
+    documents processed by the current stage
+    """
+    if total is None and hasattr(documents, "__len__"):
+        total = len(documents)
+    if desc is None and current is not None:
+        desc = current.stage
+    for document in tqdm(documents, total=total, desc=desc, unit=unit, mininterval=1):
+        if current is not None:
+            current.documents += 1
+        yield document
+
+
+def note(message):
+    """Records `message` in the report of the current stage"""
+    if current is not None:
+        current.notes.append(message)
+
+
+def count_written_rows(sql, rowcount):
+    """Counts the rows a COPY or INSERT into a table wrote for the current stage"""
+    if current is None or not isinstance(sql, str) or rowcount < 0:
+        return
+    match = copy_target.match(sql) or insert_target.match(sql)
+    if match and not match.group(1).endswith("_staging"):
+        current.add_rows(match.group(1), rowcount)
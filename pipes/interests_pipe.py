@@ -1,66 +1,42 @@
-import os.path
-import csv
-import xmltodict
-import pandas as pd
+import mp_extractor
 
-from db import get_connection
+from db import delete_keys, copy_csv, bulk_load
+from incremental import HashManifest, add_full_argument
 
-csv_path = "data/preprocessed/interests.csv"
+csv_path = mp_extractor.csv_paths["interests"]
 
 
-def preprocess_data():
-    with open(os.path.join("data", "raw", "MemberOfParliament.tsv"), "r") as f:
-        MoP = pd.read_csv(f, sep="\t")
-
-    xml_dicts = MoP.XmlDataFi.apply(xmltodict.parse)
-    rows = []
-    for henkilo in xml_dicts:
-        person_id = henkilo["Henkilo"]["HenkiloNro"]
-
-        if henkilo["Henkilo"]["Sidonnaisuudet"] is None:
-            continue
-
-        interest = henkilo["Henkilo"]["Sidonnaisuudet"]["Sidonnaisuus"]
-
-        if isinstance(interest, dict):
-            interest = [interest]
-
-        rows.extend(
-            [
-                {
-                    "person_id": person_id,
-                    "category": x["RyhmaOtsikko"],
-                    "interest": x["Sidonta"],
-                }
-                for x in interest
-                if "Sidonta" in x
-                and x["Sidonta"]
-                not in [
-                    None,
-                    "Ei ilmoitettavia sidonnaisuuksia",
-                    "Ei ilmoitettavia tuloja",
-                ]
-            ]
-        )
-
-    with open(csv_path, "w") as f:
-        writer = csv.DictWriter(f, fieldnames=["person_id", "category", "interest"])
-        writer.writerows(rows)
+def preprocess_data(full=False):
+    mp_extractor.preprocess_data(["interests"], full)
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY interests(person_id, category, interest) FROM stdin DELIMITERS ',' CSV QUOTE '\"';",
-            f,
+    manifest = HashManifest("interests")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed interests waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("interests") as cursor:
+        # Rows of changed persons are replaced as a whole
+        delete_keys(
+            cursor,
+            "interests",
+            "person_id",
+            [int(person_id) for person_id in changed + deleted],
         )
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+        with open(csv_path) as f:
+            copy_csv(
+                cursor,
+                "interests",
+                ["person_id", "category", "interest"],
+                f,
+                header=False,
+            )
+
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -73,11 +49,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", help="import preprocessed data", action="store_true"
     )
+    add_full_argument(parser)
     args = parser.parse_args()
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.full)
         import_data()
@@ -3,16 +3,21 @@ import pandas as pd
 from lxml import etree
 from io import StringIO
 from XML_parsing_help_functions import (
+    RENDERER_VERSION,
     PerusteluOsa_parse_to_markdown,
     Ponsi_parse_to_markdown,
     id_parse,
     date_parse,
     Nimeke_parse,
-    status_parse,
     Allekirjoittaja_parse,
+    DocumentIndex,
     NS,
 )
-from db import get_connection
+from handling_index import load_handling_index
+from vaski_pipeline import map_documents, read_tsv, add_workers_argument
+from person_resolver import PersonResolver
+from incremental import HashManifest, add_full_argument
+from db import upsert_csv, delete_keys, copy_csv, bulk_load
 
 # Paths
 interpellations_tsv_path = os.path.join("data", "raw", "vaski", "Interpellation_fi.tsv")
@@ -20,63 +25,82 @@ interpellations_csv = os.path.join("data", "preprocessed", "interpellations.csv"
 interpellation_signatures_csv = os.path.join(
     "data", "preprocessed", "interpellation_signatures.csv"
 )
-handling_tsv_path = os.path.join(
-    "data", "raw", "vaski", "KasittelytiedotValtiopaivaasia_fi.tsv"
-)
 
 
-def preprocess_data():
-    os.makedirs(os.path.dirname(interpellations_csv), exist_ok=True)
-    interpellation_df = pd.read_csv(interpellations_tsv_path, sep="\t")
-    handling_df = pd.read_csv(handling_tsv_path, sep="\t")
+# Per process state of the document parser, set up by `init_worker`
+worker_state = {}
 
-    interpellation_records = []
-    sgn_records = []
 
-    conn = get_connection()
-    cur = conn.cursor()
+def init_worker(handling_index, eid_counts, resolver):
+    worker_state["resolver"] = resolver
+    worker_state["handling_index"] = handling_index
+    worker_state["eid_counts"] = eid_counts
+
 
-    for interpellation_xml_str in interpellation_df.get("XmlData", []):
-        interpellation_root = etree.parse(StringIO(interpellation_xml_str)).getroot()
+def parse_document(interpellation_xml_str):
+    """Parses one interpellation document into its row and signature rows"""
+    interpellation_root = etree.parse(StringIO(interpellation_xml_str)).getroot()
+    doc = DocumentIndex(interpellation_root)
 
-        eid = id_parse(interpellation_root, NS)
+    eid = id_parse(doc, NS)
 
-        interpellation = interpellation_root.find(".//kys:Kysymys", namespaces=NS)
+    interpellation = doc.find("kys:Kysymys")
 
+    if (
+        interpellation is None
+    ):  # Joskus oikean välikysymyksen lisäksi on tyhjä välikysymys samalla id:llä
         if (
-            interpellation is None
-        ):  # Joskus oikean välikysymyksen lisäksi on tyhjä välikysymys samalla id:llä
-            if (
-                len(interpellation_df.loc[interpellation_df["Eduskuntatunnus"] == eid])
-                > 1
-            ):  # Tarkistetaan että samalla id:llä löytyy toinenkin (oikea) välikysymys
-                continue
-            else:
-                raise Exception
-
-        handling_xml_str = (
-            handling_df.loc[handling_df["Eduskuntatunnus"] == eid]
-            .get("XmlData", "")
-            .tolist()[0]
-        )
-        handling_root = etree.parse(StringIO(handling_xml_str)).getroot()
-
-        interpellation_records.append(
-            {
-                "id": eid.lower(),
-                "date": date_parse(interpellation_root, NS),
-                "title": Nimeke_parse(interpellation, NS),
-                "reasoning": PerusteluOsa_parse_to_markdown(interpellation, NS),
-                "motion": Ponsi_parse_to_markdown(interpellation, NS),
-                "status": status_parse(handling_root, handling_xml_str, NS),
-            }
-        )
+            worker_state["eid_counts"][eid] > 1
+        ):  # Tarkistetaan että samalla id:llä löytyy toinenkin (oikea) välikysymys
+            return None, []
+        else:
+            raise Exception
+
+    interpellation = doc.scoped(interpellation)
+
+    interpellation_record = {
+        "id": eid.lower(),
+        "date": date_parse(doc, NS),
+        "title": Nimeke_parse(interpellation, NS),
+        "reasoning": PerusteluOsa_parse_to_markdown(interpellation, NS),
+        "motion": Ponsi_parse_to_markdown(interpellation, NS),
+        "status": worker_state["handling_index"].get(eid, "open"),
+    }
+
+    return interpellation_record, Allekirjoittaja_parse(
+        interpellation, NS, eid, worker_state["resolver"]
+    )
 
-        sgn_records.extend(Allekirjoittaja_parse(interpellation, NS, eid, cur))
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def preprocess_data(workers=1, full=False):
+    os.makedirs(os.path.dirname(interpellations_csv), exist_ok=True)
+
+    # Only the new and changed interpellations are parsed
+    handling_index = load_handling_index()
+    manifest = HashManifest("interpellations", full, RENDERER_VERSION)
+    changed = manifest.select_changed(
+        read_tsv(interpellations_tsv_path), lambda eid: handling_index.get(eid)
+    )
+    eid_counts = manifest.row_counts
+
+    interpellation_records = []
+    sgn_records = []
+
+    for interpellation_record, interpellation_sgn_records in map_documents(
+        parse_document,
+        (xml for _, xml in read_tsv(interpellations_tsv_path, keys=changed)),
+        workers,
+        initializer=init_worker,
+        initargs=(
+            handling_index,
+            eid_counts,
+            PersonResolver.from_database(),
+        ),
+        total=sum(eid_counts[eid] for eid in changed),
+    ):
+        if interpellation_record is not None:
+            interpellation_records.append(interpellation_record)
+        sgn_records.extend(interpellation_sgn_records)
 
     pd.DataFrame(interpellation_records).to_csv(
         interpellations_csv, index=False, encoding="utf-8"
@@ -84,33 +108,46 @@ def preprocess_data():
     pd.DataFrame(sgn_records).drop_duplicates().to_csv(
         interpellation_signatures_csv, index=False, encoding="utf-8"
     )
+    manifest.save_pending()
 
 
 def import_data():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    with open(interpellations_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY interpellations(id, date, title, reasoning, motion, status)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
+    manifest = HashManifest("interpellations")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed interpellations waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("interpellations", "interpellation_signatures") as cur:
+        # Signatures of changed interpellations are replaced as a whole
+        delete_keys(
+            cur,
+            "interpellation_signatures",
+            "interpellation_id",
+            [eid.lower() for eid in changed + deleted],
         )
+        delete_keys(cur, "interpellations", "id", [eid.lower() for eid in deleted])
 
-    with open(interpellation_signatures_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY interpellation_signatures(interpellation_id, person_id, first)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
-        )
+        if changed:
+            with open(interpellations_csv, "r", encoding="utf-8") as f:
+                upsert_csv(
+                    cur,
+                    "interpellations",
+                    ["id", "date", "title", "reasoning", "motion", "status"],
+                    f,
+                    ["id"],
+                )
+
+            with open(interpellation_signatures_csv, "r", encoding="utf-8") as f:
+                copy_csv(
+                    cur,
+                    "interpellation_signatures",
+                    ["interpellation_id", "person_id", "first"],
+                    f,
+                )
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -123,12 +160,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", action="store_true", help="Import CSVs into Postgres"
     )
+    add_workers_argument(parser)
+    add_full_argument(parser)
     args = parser.parse_args()
 
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
         import_data()
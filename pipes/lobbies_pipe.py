@@ -1,14 +1,15 @@
 import os
 import polars as pl
 
-from db import get_connection
+from db import upsert_csv, bulk_load
+from raw_parquet import scan
 
 json_path = os.path.join("data", "raw", "lobby_actions.json")
 csv_path = "data/preprocessed/lobbies.csv"
 
 
 def preprocess_data():
-    lobbies_df = pl.read_json(json_path, infer_schema_length=10000)
+    lobbies_df = scan(json_path).collect()
 
     lobbies_df = lobbies_df.with_columns(
         pl.when(pl.col("companyId").is_not_null())  # Lobbies have a "companyId"
@@ -38,18 +39,8 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY lobbies(id, name, industry) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with bulk_load("lobbies") as cursor, open(csv_path) as f:
+        upsert_csv(cursor, "lobbies", ["id", "name", "industry"], f, ["id"])
 
 
 if __name__ == "__main__":
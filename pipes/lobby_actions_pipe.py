@@ -2,7 +2,8 @@ import os
 import polars as pl
 from matching_help_functions import match_target_mp
 
-from db import get_connection
+from db import upsert_csv, copy_csv, bulk_load
+from raw_parquet import scan
 
 json_path = os.path.join("data", "raw", "lobby_actions.json")
 topics_csv_path = "data/preprocessed/lobby_topics.csv"
@@ -10,7 +11,7 @@ actions_csv_path = "data/preprocessed/lobby_actions.csv"
 
 
 def preprocess_data():
-    df = pl.read_json(json_path, infer_schema_length=10000)
+    df = scan(json_path).collect()
 
     df = df.explode("topics")
 
@@ -78,24 +79,20 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(topics_csv_path) as f:
-        cursor.copy_expert(
-            "COPY lobby_topics(id, topic, project) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-
-    with open(actions_csv_path) as f:
-        cursor.copy_expert(
-            "COPY lobby_actions(lobby_id, term_id, person_id, topic_id, contact_method) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    # Lobby actions have no natural key, so they are always refreshed in full
+    with bulk_load(
+        "lobby_topics", "lobby_actions", replace=("lobby_actions",)
+    ) as cursor:
+        with open(topics_csv_path) as f:
+            upsert_csv(cursor, "lobby_topics", ["id", "topic", "project"], f, ["id"])
+
+        with open(actions_csv_path) as f:
+            copy_csv(
+                cursor,
+                "lobby_actions",
+                ["lobby_id", "term_id", "person_id", "topic_id", "contact_method"],
+                f,
+            )
 
 
 if __name__ == "__main__":
@@ -1,14 +1,15 @@
 import os
 import polars as pl
 
-from db import get_connection
+from db import upsert_csv, bulk_load
+from raw_parquet import scan
 
 json_path = os.path.join("data", "raw", "lobby_terms.json")
 csv_path = "data/preprocessed/lobby_terms.csv"
 
 
 def preprocess_data():
-    terms_df = pl.read_json(json_path, infer_schema_length=10000)
+    terms_df = scan(json_path).collect()
 
     terms_df = terms_df.with_columns(
         pl.col("reportingStartDate")
@@ -27,18 +28,8 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY lobby_terms(id, start_date, end_date) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with bulk_load("lobby_terms") as cursor, open(csv_path) as f:
+        upsert_csv(cursor, "lobby_terms", ["id", "start_date", "end_date"], f, ["id"])
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import os
 import polars as pl
 from db import get_connection
+from raw_parquet import scan
 
 json_path = os.path.join("data", "raw", "lobby_targets.json")
 
@@ -8,8 +9,10 @@ json_path = os.path.join("data", "raw", "lobby_targets.json")
 def match_target_mp(target_ids):
     # Creating a dataframe for all targets
 
-    targets_df = pl.read_json(json_path).drop(
-        ["createdAt", "id", "fiId", "svId", "enId", "termId", "hash", "sv", "en"]
+    targets_df = (
+        scan(json_path)
+        .collect()
+        .drop(["createdAt", "id", "fiId", "svId", "enId", "termId", "hash", "sv", "en"])
     )
     targets_df = targets_df.unnest("fi").drop("createdAt")
 
@@ -33,8 +36,8 @@ def match_target_mp(target_ids):
                         person_id,
                         first_name,
                         last_name
-                    FROM (public.mp_parliamentary_group_memberships
-                    INNER JOIN public.persons ON persons.id = person_id)
+                    FROM (mp_parliamentary_group_memberships
+                    INNER JOIN persons ON persons.id = person_id)
                     WHERE end_date is null OR end_date > '2024-01-01'    
                     ;""")  # Filter out people who have retired from the parliament before the implementation of avoimuusrekisteri
 
@@ -0,0 +1,442 @@
+import csv
+import os
+
+import pandas as pd
+from harmonize import harmonize_parliamentary_group
+from incremental import HashManifest, add_full_argument, content_hash
+from instrumentation import progress
+from lxml import etree
+from raw_parquet import scan
+
+# Paths
+mop_tsv_path = os.path.join("data", "raw", "MemberOfParliament.tsv")
+photos_path = os.path.join("frontend", "src", "assets")
+csv_paths = {
+    "mps": "data/preprocessed/mps.csv",
+    "ministers": "data/preprocessed/ministers.csv",
+    "minister_positions": "data/preprocessed/minister_positions.csv",
+    "mp_committee_memberships": "data/preprocessed/mp_committee_memberships.csv",
+    "interests": "data/preprocessed/interests.csv",
+    "assemblies": os.path.join("data", "preprocessed", "assemblies.csv"),
+    "parliamentary_groups": "data/preprocessed/parliamentary_groups.csv",
+    "mp_parliamentary_group_memberships": "data/preprocessed/mp_parliamentary_group_memberships.csv",
+}
+
+# Comments would shift the positional children that `mps` relies on
+xml_parser = etree.XMLParser(remove_comments=True, remove_pis=True)
+
+committee_roles = {
+    "jäsen": "member",
+    "varajäsen": "associate",
+    "lisäjäsen": "additional",
+    "puheenjohtaja": "chair",
+    "varapuheenjohtaja": "first vice",
+    "ensimmäinen varapuheenjohtaja": "first vice",
+    "toinen varapuheenjohtaja": "second vice",
+}
+
+# Due to lack of proper API for assemblies and their respective abbreviations,
+# These common committees that have records associated with them are hard coded
+# to the procedure.
+known_assemblies = [
+    {"code": "HaV", "name": "Hallintovaliokunta"},
+    {"code": "LaV", "name": "Lakivaliokunta"},
+    {"code": "LiV", "name": "Liikenne- ja viestintävaliokunta"},
+    {"code": "MmV", "name": "Maa- ja metsätalousvaliokunta"},
+    {"code": "PeV", "name": "Perustuslakivaliokunta"},
+    {"code": "PmN", "name": "Puhemiesneuvosto"},
+    {"code": "EK", "name": "Eduskunnan täysistunto"},
+    {"code": "PuV", "name": "Puolustusvaliokunta"},
+    {"code": "SiV", "name": "Sivistysvaliokunta"},
+    {"code": "StV", "name": "Sosiaali- ja terveysvaliokunta"},
+    {"code": "SuV", "name": "Suuri valiokunta"},
+    {"code": "TaV", "name": "Talousvaliokunta"},
+    {"code": "TrV", "name": "Tarkastusvaliokunta"},
+    {"code": "TuV", "name": "Tulevaisuusvaliokunta"},
+    {"code": "TyV", "name": "Työelämä- ja tasa-arvovaliokunta"},
+    {"code": "UaV", "name": "Ulkoasiainvaliokunta"},
+    {"code": "VaV", "name": "Valtiovarainvaliokunta"},
+    {"code": "YmV", "name": "Ympäristövaliokunta"},
+    {"code": "SuVtJ", "name": "Suuren valiokunnan jaosto"},
+    {"code": "TiV", "name": "Tiedusteluvalvontavaliokunta"},
+]
+
+
+def _text(element, path):
+    """Returns the stripped text of the node at `path`, or None if it is empty."""
+    text = element.findtext(path)
+    if text is None or not text.strip():
+        return None
+    return text.strip()
+
+
+def _iso_date(date):
+    """Turns a `dd.mm.yyyy` date into `yyyy-mm-dd`"""
+    return "-".join(reversed(date.split(".")))
+
+
+def _committees(henkilo):
+    """Current and previous committees of a person, in that order"""
+    return henkilo.findall("NykyisetToimielinjasenyydet/Toimielin") + henkilo.findall(
+        "AiemmatToimielinjasenyydet/Toimielin"
+    )
+
+
+############################
+# Per table row extractors #
+############################
+
+
+def extract_mps(person, henkilo, photo_filename_dict):
+    id = person["personId"]
+    return [
+        {
+            "id": id,
+            "first_name": person["firstname"].strip(),
+            "last_name": person["lastname"].strip(),
+            "full_name": f"{henkilo[1].text} {henkilo[2].text}",
+            "phone_number": henkilo[6].text,
+            "email": henkilo[7].text,
+            "occupation": henkilo[9].text,
+            "year_of_birth": henkilo[10].text,
+            "place_of_birth": henkilo[11].text,
+            "place_of_residence": henkilo[15].text,
+            "photo": photo_filename_dict.get(str(id)),
+        }
+    ]
+
+
+def extract_ministers(person, henkilo):
+    rows = []
+    for jasenyys in henkilo.findall(".//ValtioneuvostonJasenyydet/Jasenyys"):
+        ministry = jasenyys.findtext("Ministeriys")
+
+        if ministry:  # Only include if minister position exists
+            start = _iso_date(jasenyys.findtext("AlkuPvm"))
+            end = _iso_date(jasenyys.findtext("LoppuPvm"))
+            if "-" not in start:
+                start = start + "-01-01"
+                end = end + "-12-31"
+
+            rows.append(
+                {
+                    "person_id": person["personId"],
+                    "minister_position": jasenyys.findtext("Nimi"),
+                    "cabinet_id": jasenyys.findtext("Hallitus"),
+                    "start_date": start,
+                    "end_date": end,
+                }
+            )
+    return rows
+
+
+def extract_mp_committee_memberships(person, henkilo):
+    earliest_retirement_date = "2010-01-01"
+
+    retirement_date = _text(henkilo, "KansanedustajuusPaattynytPvm")
+    if retirement_date and _iso_date(retirement_date) < earliest_retirement_date:
+        return []
+
+    person_id = int(henkilo.findtext("HenkiloNro"))
+    rows = []
+    for committee in _committees(henkilo):
+        committee_name = _text(committee, "Nimi")
+        if not committee_name or committee.get("OnkoValiokunta") != "true":
+            continue
+
+        for membership in committee.findall("Jasenyys"):
+            start_date = _text(membership, "AlkuPvm")
+            if not start_date:
+                continue
+            start_date = _iso_date(start_date)
+            if len(start_date) < 10:
+                start_date = f"{start_date[:4]}-01-01"
+
+            end_date = _text(membership, "LoppuPvm")
+            if end_date:
+                end_date = _iso_date(end_date)
+                if len(end_date) < 10:
+                    end_date = f"{end_date[:4]}-12-31"
+
+            rows.append(
+                {
+                    "person_id": person_id,
+                    "committee_name": committee_name,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "role": committee_roles[_text(membership, "Rooli").lower()],
+                }
+            )
+    return rows
+
+
+def extract_interests(person, henkilo):
+    person_id = _text(henkilo, "HenkiloNro")
+    return [
+        {
+            "person_id": person_id,
+            "category": _text(interest, "RyhmaOtsikko"),
+            "interest": _text(interest, "Sidonta"),
+        }
+        for interest in henkilo.findall("Sidonnaisuudet/Sidonnaisuus")
+        if _text(interest, "Sidonta")
+        not in [
+            None,
+            "Ei ilmoitettavia sidonnaisuuksia",
+            "Ei ilmoitettavia tuloja",
+        ]
+    ]
+
+
+def extract_assemblies(person, henkilo):
+    earliest_retirement_date = "2000-01-01"
+
+    retirement_date = _text(henkilo, "KansanedustajuusPaattynytPvm")
+    if not retirement_date or _iso_date(retirement_date) < earliest_retirement_date:
+        return []
+
+    return [
+        _text(committee, "Nimi")
+        for committee in _committees(henkilo)
+        if _text(committee, "Nimi") and committee.get("OnkoValiokunta") == "true"
+    ]
+
+
+def extract_parliamentary_groups(person, henkilo):
+    return [
+        name
+        for name in (
+            _text(group, "Nimi")
+            for group in henkilo.findall("Eduskuntaryhmat/NykyinenEduskuntaryhma")
+            + henkilo.findall("Eduskuntaryhmat/EdellisetEduskuntaryhmat/Eduskuntaryhma")
+        )
+        if name is not None
+    ]
+
+
+def extract_mp_parliamentary_group_memberships(person, henkilo):
+    person_id = int(person["personId"])
+    rows = []
+
+    # Current group
+    cur_group = henkilo.find("./Eduskuntaryhmat/NykyinenEduskuntaryhma")
+    if cur_group is not None and len(cur_group) and cur_group[0].text is not None:
+        rows.append(
+            {
+                "person_id": person_id,
+                "pg_id": harmonize_parliamentary_group(cur_group[0].text),
+                "start_date": _iso_date(cur_group.findtext("./AlkuPvm")),
+                "end_date": None,
+            }
+        )
+
+    for group in henkilo.find("./Eduskuntaryhmat/EdellisetEduskuntaryhmat"):
+        if group[0].text:
+            parliamentary_group = harmonize_parliamentary_group(group[0].text)
+
+            for membership in group.findall("./Jasenyys"):
+                rows.append(
+                    {
+                        "person_id": person_id,
+                        "pg_id": parliamentary_group,
+                        "start_date": _iso_date(membership.findtext("./AlkuPvm")),
+                        "end_date": _iso_date(membership.findtext("./LoppuPvm")),
+                    }
+                )
+    return rows
+
+
+#################
+# Table writers #
+#################
+
+
+def write_mps(rows):
+    with open(csv_paths["mps"], "w") as f:
+        writer = csv.DictWriter(
+            f,
+            fieldnames=[
+                "id",
+                "first_name",
+                "last_name",
+                "full_name",
+                "phone_number",
+                "email",
+                "occupation",
+                "year_of_birth",
+                "place_of_birth",
+                "place_of_residence",
+                "photo",
+            ],
+        )
+        writer.writerows(rows)
+
+
+def write_ministers(rows):
+    minister_positions = {row["minister_position"] for row in rows}
+    pd.DataFrame(list(minister_positions), columns=["title"]).to_csv(
+        csv_paths["minister_positions"], index=False, header=False
+    )
+    pd.DataFrame(
+        rows,
+        columns=[
+            "person_id",
+            "minister_position",
+            "cabinet_id",
+            "start_date",
+            "end_date",
+        ],
+    ).to_csv(csv_paths["ministers"], index=False, header=False)
+
+
+def write_mp_committee_memberships(rows):
+    pd.DataFrame(
+        rows, columns=["person_id", "committee_name", "start_date", "end_date", "role"]
+    ).to_csv(csv_paths["mp_committee_memberships"], index=False)
+
+
+def write_interests(rows):
+    with open(csv_paths["interests"], "w") as f:
+        writer = csv.DictWriter(f, fieldnames=["person_id", "category", "interest"])
+        writer.writerows(rows)
+
+
+def write_assemblies(committees):
+    df_assemblies = pd.DataFrame(known_assemblies)
+    other_committees = [
+        c for c in set(committees) if c not in df_assemblies.name.values
+    ]
+    other_committees = pd.DataFrame(
+        {"name": other_committees, "code": [None] * len(other_committees)}
+    )
+    df_assemblies = pd.concat([df_assemblies, other_committees])
+    df_assemblies.to_csv(csv_paths["assemblies"], index=False)
+
+
+def write_parliamentary_groups(names):
+    parliamentary_groups = list(set(names))
+    pd.DataFrame(
+        {
+            "id": [harmonize_parliamentary_group(p) for p in parliamentary_groups],
+            "name": parliamentary_groups,
+        }
+    ).to_csv(csv_paths["parliamentary_groups"], index=False)
+
+
+def write_mp_parliamentary_group_memberships(rows):
+    with open(csv_paths["mp_parliamentary_group_memberships"], "w") as f:
+        writer = csv.DictWriter(
+            f, fieldnames=["person_id", "pg_id", "start_date", "end_date"]
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# table name -> (row extractor, writer)
+TABLES = {
+    "mps": (extract_mps, write_mps),
+    "ministers": (extract_ministers, write_ministers),
+    "mp_committee_memberships": (
+        extract_mp_committee_memberships,
+        write_mp_committee_memberships,
+    ),
+    "interests": (extract_interests, write_interests),
+    "assemblies": (extract_assemblies, write_assemblies),
+    "parliamentary_groups": (
+        extract_parliamentary_groups,
+        write_parliamentary_groups,
+    ),
+    "mp_parliamentary_group_memberships": (
+        extract_mp_parliamentary_group_memberships,
+        write_mp_parliamentary_group_memberships,
+    ),
+}
+
+
+# Tables aggregated over every person rather than made of rows of their own.
+# Their extractors run on all the persons, so that the preprocessed table is
+# complete even when only a few persons have changed.
+aggregate_tables = {"assemblies", "parliamentary_groups"}
+
+
+def extract(tables=None, full=False):
+    """
+    Reads MemberOfParliament.tsv and parses each person's <Henkilo> document
+    at most once, running the row extractors of all the requested tables, or
+    of every table, on it.
+
+    Every table keeps its own hash manifest keyed by personId, and a table's
+    extractor only runs on the persons that are new or changed for it, except
+    for the `aggregate_tables`, whose extractors run on everyone.
+    Returns a dict of `table -> rows` and a dict of `table -> HashManifest`.
+    """
+    if tables is None:
+        tables = TABLES.keys()
+    extractors = {table: TABLES[table][0] for table in tables}
+    manifests = {table: HashManifest(table, full) for table in tables}
+    photo_filename_dict = {}
+
+    if "mps" in extractors:
+        photo_filename_dict = {
+            filename.split(".")[0].split("-")[-1]: filename
+            for filename in os.listdir(photos_path)
+        }
+        extractors["mps"] = lambda person, henkilo: extract_mps(
+            person, henkilo, photo_filename_dict
+        )
+
+    rows = {table: [] for table in extractors}
+    persons = (
+        scan(mop_tsv_path)
+        .select("personId", "firstname", "lastname", "XmlDataFi")
+        .collect()
+    )
+    for person in progress(persons.iter_rows(named=True), len(persons), unit="person"):
+        digest = content_hash(
+            person["firstname"], person["lastname"], person["XmlDataFi"]
+        )
+        photo_digest = content_hash(digest, photo_filename_dict.get(person["personId"]))
+        changed_tables = [
+            table
+            for table in extractors
+            if manifests[table].changed(
+                person["personId"], photo_digest if table == "mps" else digest
+            )
+            or table in aggregate_tables
+        ]
+        if not changed_tables:
+            continue
+
+        henkilo = etree.fromstring(person["XmlDataFi"], xml_parser)
+        for table in changed_tables:
+            rows[table].extend(extractors[table](person, henkilo))
+
+    return rows, manifests
+
+
+def preprocess_data(tables=None, full=False):
+    """
+    Writes the preprocessed CSVs of the given MP derived tables, or of all of
+    them, in a single pass
+    """
+    os.makedirs(os.path.join("data", "preprocessed"), exist_ok=True)
+    rows, manifests = extract(tables, full)
+    for table, table_rows in rows.items():
+        TABLES[table][1](table_rows)
+        manifests[table].save_pending()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        choices=TABLES.keys(),
+        default=TABLES.keys(),
+        help="tables to preprocess, all of them by default",
+    )
+    add_full_argument(parser)
+    args = parser.parse_args()
+    preprocess_data(args.tables, args.full)
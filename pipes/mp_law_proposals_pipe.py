@@ -3,17 +3,23 @@ import pandas as pd
 from lxml import etree
 from io import StringIO
 from XML_parsing_help_functions import (
+    RENDERER_VERSION,
     AsiaSisaltoKuvaus_parse_to_markdown,
     PerusteluOsa_parse_to_markdown,
     id_parse,
     date_parse,
     Nimeke_parse,
     Saados_parse,
-    status_parse,
     Allekirjoittaja_parse,
+    DocumentIndex,
     NS,
 )
-from db import get_connection
+from handling_index import load_handling_index
+from vaski_pipeline import map_documents, read_tsv, add_workers_argument
+from person_resolver import PersonResolver
+from group_attribution import GroupAttribution
+from incremental import HashManifest, add_full_argument
+from db import upsert_csv, delete_keys, copy_csv, bulk_load
 
 # Paths
 mp_proposal_tsv_path = os.path.join("data", "raw", "vaski", "LegislativeMotion_fi.tsv")
@@ -21,101 +27,148 @@ mp_proposals_csv = os.path.join("data", "preprocessed", "mp_law_proposals.csv")
 mp_proposal_signatures_csv = os.path.join(
     "data", "preprocessed", "mp_law_proposal_signatures.csv"
 )
-handling_tsv_path = os.path.join(
-    "data", "raw", "vaski", "KasittelytiedotValtiopaivaasia_fi.tsv"
-)
 
 
-def preprocess_data():
-    os.makedirs(os.path.dirname(mp_proposals_csv), exist_ok=True)
-    mpp_df = pd.read_csv(mp_proposal_tsv_path, sep="\t")
-    handling_df = pd.read_csv(handling_tsv_path, sep="\t")
+# Per process state of the document parser, set up by `init_worker`
+worker_state = {}
 
-    mpp_records = []
-    sgn_records = []
 
-    conn = get_connection()
-    cur = conn.cursor()
+def init_worker(handling_index, eid_counts, resolver):
+    worker_state["resolver"] = resolver
+    worker_state["handling_index"] = handling_index
+    worker_state["eid_counts"] = eid_counts
+
 
-    for mpp_xml_str in mpp_df.get("XmlData", []):
-        mpp_root = etree.parse(StringIO(mpp_xml_str)).getroot()
+def parse_document(mpp_xml_str):
+    """Parses one law proposal document into its proposal row and signature rows"""
+    mpp_root = etree.parse(StringIO(mpp_xml_str)).getroot()
+    doc = DocumentIndex(mpp_root)
 
-        eid = id_parse(mpp_root, NS)
+    eid = id_parse(doc, NS)
 
-        date = date_parse(mpp_root, NS)
+    date = date_parse(doc, NS)
 
-        proposal = mpp_root.find(".//eka:Lakialoite", namespaces=NS)
+    proposal = doc.find("eka:Lakialoite")
+    if (
+        proposal is None
+    ):  # Joskus oikean aloitteen lisäksi on tyhjä aloite samalla id:llä
         if (
-            proposal is None
-        ):  # Joskus oikean aloitteen lisäksi on tyhjä aloite samalla id:llä
-            if (
-                len(mpp_df.loc[mpp_df["Eduskuntatunnus"] == eid]) > 1
-            ):  # Tarkistetaan että samalla id:llä löytyy toinenkin (oikea) aloite
-                continue  # Skipataan tämä
-            elif (
-                eid == "LA 78/2017 vp"
-            ):  # 2017 itsenäisyyspäivänä perustettu Itsenäisyyden juhlavuoden lastensäätiö perustettiin lakialoitteena
-                continue
-            else:
-                raise Exception
-
-        handling_xml_str = (
-            handling_df.loc[handling_df["Eduskuntatunnus"] == eid]
-            .get("XmlData", "")
-            .tolist()[0]
-        )
-        handling_root = etree.parse(StringIO(handling_xml_str)).getroot()
-
-        mpp_records.append(
-            {
-                "id": eid.lower(),
-                "ptype": "mp_law",
-                "date": date,
-                "title": Nimeke_parse(proposal, NS),
-                "summary": AsiaSisaltoKuvaus_parse_to_markdown(proposal, NS),
-                "reasoning": PerusteluOsa_parse_to_markdown(proposal, NS),
-                "law_changes": Saados_parse(proposal, NS),
-                "status": status_parse(handling_root, handling_xml_str, NS),
-            }
-        )
+            worker_state["eid_counts"][eid] > 1
+        ):  # Tarkistetaan että samalla id:llä löytyy toinenkin (oikea) aloite
+            return None, []  # Skipataan tämä
+        elif (
+            eid == "LA 78/2017 vp"
+        ):  # 2017 itsenäisyyspäivänä perustettu Itsenäisyyden juhlavuoden lastensäätiö perustettiin lakialoitteena
+            return None, []
+        else:
+            raise Exception
+
+    proposal = doc.scoped(proposal)
+
+    mpp_record = {
+        "id": eid.lower(),
+        "ptype": "mp_law",
+        "date": date,
+        "title": Nimeke_parse(proposal, NS),
+        "summary": AsiaSisaltoKuvaus_parse_to_markdown(proposal, NS),
+        "reasoning": PerusteluOsa_parse_to_markdown(proposal, NS),
+        "law_changes": Saados_parse(proposal, NS),
+        "status": worker_state["handling_index"].get(eid, "open"),
+    }
+
+    return mpp_record, Allekirjoittaja_parse(
+        proposal, NS, eid, worker_state["resolver"]
+    )
+
 
-        sgn_records.extend(Allekirjoittaja_parse(proposal, NS, eid, cur))
+def preprocess_data(workers=1, full=False):
+    os.makedirs(os.path.dirname(mp_proposals_csv), exist_ok=True)
+
+    # Only the new and changed proposals are parsed
+    handling_index = load_handling_index()
+    manifest = HashManifest("mp_law_proposals", full, RENDERER_VERSION)
+    changed = manifest.select_changed(
+        read_tsv(mp_proposal_tsv_path), lambda eid: handling_index.get(eid)
+    )
+    eid_counts = manifest.row_counts
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    mpp_records = []
+    sgn_records = []
+
+    groups = GroupAttribution.load()
+    for mpp_record, mpp_sgn_records in map_documents(
+        parse_document,
+        (xml for _, xml in read_tsv(mp_proposal_tsv_path, keys=changed)),
+        workers,
+        initializer=init_worker,
+        initargs=(
+            handling_index,
+            eid_counts,
+            PersonResolver.from_database(),
+        ),
+        total=sum(eid_counts[eid] for eid in changed),
+    ):
+        if mpp_record is not None:
+            mpp_records.append(mpp_record)
+            # Signers are attributed to their group on the day of the proposal
+            groups.attribute(
+                mpp_sgn_records, [mpp_record["date"]] * len(mpp_sgn_records)
+            )
+        sgn_records.extend(mpp_sgn_records)
 
     pd.DataFrame(mpp_records).to_csv(mp_proposals_csv, index=False, encoding="utf-8")
     pd.DataFrame(sgn_records).drop_duplicates().to_csv(
         mp_proposal_signatures_csv, index=False, encoding="utf-8"
     )
+    manifest.save_pending()
 
 
 def import_data():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    with open(mp_proposals_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY proposals(id, ptype, date, title, summary, reasoning, law_changes, status)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
-        )
-
-    with open(mp_proposal_signatures_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY proposal_signatures(proposal_id, person_id, first)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
+    manifest = HashManifest("mp_law_proposals")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed MP law proposals waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("proposals", "proposal_signatures") as cur:
+        # Signatures of changed proposals are replaced as a whole
+        delete_keys(
+            cur,
+            "proposal_signatures",
+            "proposal_id",
+            [eid.lower() for eid in changed + deleted],
         )
-
-    conn.commit()
-    cur.close()
-    conn.close()
+        delete_keys(cur, "proposals", "id", [eid.lower() for eid in deleted])
+
+        if changed:
+            with open(mp_proposals_csv, "r", encoding="utf-8") as f:
+                upsert_csv(
+                    cur,
+                    "proposals",
+                    [
+                        "id",
+                        "ptype",
+                        "date",
+                        "title",
+                        "summary",
+                        "reasoning",
+                        "law_changes",
+                        "status",
+                    ],
+                    f,
+                    ["id"],
+                )
+
+            with open(mp_proposal_signatures_csv, "r", encoding="utf-8") as f:
+                copy_csv(
+                    cur,
+                    "proposal_signatures",
+                    ["proposal_id", "person_id", "first", "pg_id"],
+                    f,
+                )
+
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -128,12 +181,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", action="store_true", help="Import CSVs into Postgres"
     )
+    add_workers_argument(parser)
+    add_full_argument(parser)
     args = parser.parse_args()
 
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
         import_data()
@@ -1,88 +1,46 @@
-import os.path
-from lxml import etree
-import csv
-from harmonize import harmonize_parliamentary_group
-from db import get_connection
+import mp_extractor
 
-csv_path = "data/preprocessed/mp_parliamentary_group_memberships.csv"
+from db import delete_keys, copy_csv, bulk_load
+from group_attribution import reattribute
+from incremental import HashManifest, add_full_argument
 
+csv_path = mp_extractor.csv_paths["mp_parliamentary_group_memberships"]
 
-def preprocess_data():
-    rows = []
-    with open(os.path.join("data", "raw", "MemberOfParliament.tsv")) as f:
-        mp_data = [row for row in csv.reader(f, delimiter="\t", quotechar='"')]
 
-    for mp in mp_data[1:]:
-        person_id = int(mp[0])
+def preprocess_data(full=False):
+    mp_extractor.preprocess_data(["mp_parliamentary_group_memberships"], full)
 
-        xml = mp[7]
-        root = etree.fromstring(xml)
-        namespaces = root[0].nsmap
 
-        # Current group
-        cur_group = root.find("./Eduskuntaryhmat/NykyinenEduskuntaryhma", namespaces)
-        if (
-            cur_group is not None
-            and cur_group[0] is not None
-            and cur_group[0].text is not None
-        ):
-            parliamentary_group = harmonize_parliamentary_group(cur_group[0].text)
-            AlkuPvm = cur_group.find("./AlkuPvm", namespaces)
-            start_date = "-".join(list(reversed((AlkuPvm.text).split("."))))
-            end_date = None
-
-            rows.append(
-                {
-                    "person_id": person_id,
-                    "pg_id": parliamentary_group,
-                    "start_date": start_date,
-                    "end_date": end_date,
-                }
-            )
-
-        for group in root.find(
-            "./Eduskuntaryhmat/EdellisetEduskuntaryhmat", namespaces
-        ):
-            if group[0].text:
-                parliamentary_group = harmonize_parliamentary_group(group[0].text)
-
-                for membership in group.findall("./Jasenyys", namespaces):
-                    AlkuPvm = membership.find("./AlkuPvm", namespaces)
-                    start_date = "-".join(list(reversed((AlkuPvm.text).split("."))))
-
-                    LoppuPvm = membership.find("./LoppuPvm", namespaces)
-                    end_date = "-".join(list(reversed((LoppuPvm.text).split("."))))
-
-                    rows.append(
-                        {
-                            "person_id": person_id,
-                            "pg_id": parliamentary_group,
-                            "start_date": start_date,
-                            "end_date": end_date,
-                        }
-                    )
-
-    with open(csv_path, "w") as f:
-        writer = csv.DictWriter(
-            f, fieldnames=["person_id", "pg_id", "start_date", "end_date"]
+def import_data():
+    manifest = HashManifest("mp_parliamentary_group_memberships")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed parliamentary group memberships waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("mp_parliamentary_group_memberships") as cursor:
+        # Rows of changed persons are replaced as a whole
+        delete_keys(
+            cursor,
+            "mp_parliamentary_group_memberships",
+            "person_id",
+            [int(person_id) for person_id in changed + deleted],
         )
-        writer.writeheader()
-        writer.writerows(rows)
-
 
-def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
+        with open(csv_path) as f:
+            copy_csv(
+                cursor,
+                "mp_parliamentary_group_memberships",
+                ["person_id", "pg_id", "start_date", "end_date"],
+                f,
+            )
 
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY mp_parliamentary_group_memberships(person_id, pg_id, start_date, end_date) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
+        # The rows attributed to the changed persons' groups follow their
+        # memberships
+        reattribute(cursor, [int(person_id) for person_id in changed + deleted])
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -95,11 +53,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", help="import preprocessed data", action="store_true"
     )
+    add_full_argument(parser)
     args = parser.parse_args()
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.full)
         import_data()
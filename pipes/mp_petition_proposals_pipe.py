@@ -3,6 +3,7 @@ import pandas as pd
 from lxml import etree
 from io import StringIO
 from XML_parsing_help_functions import (
+    RENDERER_VERSION,
     AsiaSisaltoKuvaus_parse_to_markdown,
     PerusteluOsa_parse_to_markdown,
     id_parse,
@@ -10,9 +11,14 @@ from XML_parsing_help_functions import (
     Nimeke_parse,
     Saados_parse,
     Allekirjoittaja_parse,
+    DocumentIndex,
     NS,
 )
-from db import get_connection
+from group_attribution import GroupAttribution
+from incremental import HashManifest, add_full_argument
+from db import get_connection, upsert_csv, delete_keys, copy_csv, bulk_load
+from vaski_pipeline import map_documents, read_tsv, add_workers_argument
+from person_resolver import PersonResolver
 
 # Paths
 mp_petition_tsv_path = os.path.join("data", "raw", "vaski", "PetitionaryMotion_fi.tsv")
@@ -25,10 +31,61 @@ handling_tsv_path = os.path.join(
 )
 
 
-def preprocess_data():
-    os.makedirs(os.path.dirname(mp_petitions_csv), exist_ok=True)
-    mpp_df = pd.read_csv(mp_petition_tsv_path, sep="\t")
+# Per process state of the document parser, set up by `init_worker`
+worker_state = {}
+
+
+def init_worker(handled_petitions, eid_counts, resolver):
+    worker_state["resolver"] = resolver
+    worker_state["handled_petitions"] = handled_petitions
+    worker_state["eid_counts"] = eid_counts
+
+
+def parse_document(mpp_xml_str):
+    """Parses one petition document into its proposal row and signature rows"""
+    mpp_root = etree.parse(StringIO(mpp_xml_str)).getroot()
+    doc = DocumentIndex(mpp_root)
 
+    eid = id_parse(doc, NS)
+
+    date = date_parse(doc, NS)
+
+    if eid.lower() in worker_state["handled_petitions"]:
+        status = "handled"
+    else:
+        status = "open"
+
+    proposal = doc.find("eka:EduskuntaAloite")
+    if (
+        proposal is None
+    ):  # Joskus oikean aloitteen lisäksi on tyhjä aloite samalla id:llä
+        if (
+            worker_state["eid_counts"][eid] > 1
+        ):  # Tarkistetaan että samalla id:llä löytyy toinenkin (oikea) aloite
+            return None, []  # Skipataan tämä
+        else:
+            raise Exception
+
+    proposal = doc.scoped(proposal)
+
+    mpp_record = {
+        "id": eid.lower(),
+        "ptype": "mp_petition",
+        "date": date,
+        "title": Nimeke_parse(proposal, NS),
+        "summary": AsiaSisaltoKuvaus_parse_to_markdown(proposal, NS),
+        "reasoning": PerusteluOsa_parse_to_markdown(proposal, NS),
+        "law_changes": Saados_parse(proposal, NS),
+        "status": status,
+    }
+
+    return mpp_record, Allekirjoittaja_parse(
+        proposal, NS, eid, worker_state["resolver"]
+    )
+
+
+def preprocess_data(workers=1, full=False):
+    os.makedirs(os.path.dirname(mp_petitions_csv), exist_ok=True)
     mpp_records = []
     sgn_records = []
 
@@ -40,83 +97,94 @@ def preprocess_data():
                 FROM agenda_items""")
 
     agenda_items = cur.fetchall()
-    handled_petitions = [
+    handled_petitions = {
         petition[0] for petition in agenda_items if petition[0].startswith("tpa")
-    ]
-
-    for mpp_xml_str in mpp_df.get("XmlData", []):
-        mpp_root = etree.parse(StringIO(mpp_xml_str)).getroot()
-
-        eid = id_parse(mpp_root, NS)
-
-        date = date_parse(mpp_root, NS)
+    }
 
-        if eid.lower() in handled_petitions:
-            status = "handled"
-        else:
-            status = "open"
-
-        proposal = mpp_root.find(".//eka:EduskuntaAloite", namespaces=NS)
-        if (
-            proposal is None
-        ):  # Joskus oikean aloitteen lisäksi on tyhjä aloite samalla id:llä
-            if (
-                len(mpp_df.loc[mpp_df["Eduskuntatunnus"] == eid]) > 1
-            ):  # Tarkistetaan että samalla id:llä löytyy toinenkin (oikea) aloite
-                continue  # Skipataan tämä
-            else:
-                raise Exception
-
-        mpp_records.append(
-            {
-                "id": eid.lower(),
-                "ptype": "mp_petition",
-                "date": date,
-                "title": Nimeke_parse(proposal, NS),
-                "summary": AsiaSisaltoKuvaus_parse_to_markdown(proposal, NS),
-                "reasoning": PerusteluOsa_parse_to_markdown(proposal, NS),
-                "law_changes": Saados_parse(proposal, NS),
-                "status": status,
-            }
-        )
-
-        sgn_records.extend(Allekirjoittaja_parse(proposal, NS, eid, cur))
-
-    conn.commit()
     cur.close()
     conn.close()
 
+    # Only the new and changed petitions are parsed
+    manifest = HashManifest("mp_petition_proposals", full, RENDERER_VERSION)
+    changed = manifest.select_changed(
+        read_tsv(mp_petition_tsv_path), lambda eid: eid.lower() in handled_petitions
+    )
+    eid_counts = manifest.row_counts
+
+    groups = GroupAttribution.load()
+    for mpp_record, mpp_sgn_records in map_documents(
+        parse_document,
+        (xml for _, xml in read_tsv(mp_petition_tsv_path, keys=changed)),
+        workers,
+        initializer=init_worker,
+        initargs=(
+            handled_petitions,
+            eid_counts,
+            PersonResolver.from_database(),
+        ),
+        total=sum(eid_counts[eid] for eid in changed),
+    ):
+        if mpp_record is not None:
+            mpp_records.append(mpp_record)
+            # Signers are attributed to their group on the day of the proposal
+            groups.attribute(
+                mpp_sgn_records, [mpp_record["date"]] * len(mpp_sgn_records)
+            )
+        sgn_records.extend(mpp_sgn_records)
+
     pd.DataFrame(mpp_records).to_csv(mp_petitions_csv, index=False, encoding="utf-8")
     pd.DataFrame(sgn_records).drop_duplicates().to_csv(
         mp_petition_signatures_csv, index=False, encoding="utf-8"
     )
+    manifest.save_pending()
 
 
 def import_data():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    with open(mp_petitions_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY proposals(id, ptype, date, title, summary, reasoning, law_changes, status)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
-        )
-
-    with open(mp_petition_signatures_csv, "r", encoding="utf-8") as f:
-        cur.copy_expert(
-            """
-            COPY proposal_signatures(proposal_id, person_id, first)
-            FROM STDIN WITH (FORMAT CSV, HEADER TRUE, QUOTE '\"');
-            """,
-            f,
+    manifest = HashManifest("mp_petition_proposals")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed MP petitions waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("proposals", "proposal_signatures") as cur:
+        # Signatures of changed proposals are replaced as a whole
+        delete_keys(
+            cur,
+            "proposal_signatures",
+            "proposal_id",
+            [eid.lower() for eid in changed + deleted],
         )
-
-    conn.commit()
-    cur.close()
-    conn.close()
+        delete_keys(cur, "proposals", "id", [eid.lower() for eid in deleted])
+
+        if changed:
+            with open(mp_petitions_csv, "r", encoding="utf-8") as f:
+                upsert_csv(
+                    cur,
+                    "proposals",
+                    [
+                        "id",
+                        "ptype",
+                        "date",
+                        "title",
+                        "summary",
+                        "reasoning",
+                        "law_changes",
+                        "status",
+                    ],
+                    f,
+                    ["id"],
+                )
+
+            with open(mp_petition_signatures_csv, "r", encoding="utf-8") as f:
+                copy_csv(
+                    cur,
+                    "proposal_signatures",
+                    ["proposal_id", "person_id", "first", "pg_id"],
+                    f,
+                )
+
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -129,12 +197,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", action="store_true", help="Import CSVs into Postgres"
     )
+    add_workers_argument(parser)
+    add_full_argument(parser)
     args = parser.parse_args()
 
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.workers, args.full)
         import_data()
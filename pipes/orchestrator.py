@@ -0,0 +1,711 @@
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import re
+import time
+from multiprocessing.connection import wait
+
+from instrumentation import instrument, run_dir, run_id
+
+# Stamps of imported pipes and the measurements of earlier runs
+inserted_dir = os.environ.get("INSERTED_DIR", os.path.join("data", ".inserted"))
+preprocessed_dir = os.path.join("data", "preprocessed")
+stats_path = os.path.join("data", ".pipeline_stats.json")
+
+raw_dir = os.path.join("data", "raw")
+vaski_dir = os.path.join(raw_dir, "vaski")
+
+# Estimates for stages that have never been measured
+default_seconds = 10.0
+default_memory_mb = 1024
+
+
+class Stage:
+    """
+    One unit of work of the pipeline: the preprocessing or the import of a pipe.
+
+    `inputs` and `outputs` are files, and a stage whose outputs are all newer
+    than its inputs and the outputs of the stages it runs `after` is skipped.
+    """
+
+    def __init__(
+        self, name, module, function, inputs, outputs, after=(), memory_mb=None
+    ):
+        self.name = name
+        self.module = module
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.memory_mb = memory_mb or default_memory_mb
+
+
+def _pipe_source(module):
+    return os.path.join("pipes", f"{module}.py")
+
+
+def _csv(pipe):
+    return os.path.join(preprocessed_dir, f"{pipe}.csv")
+
+
+def _inserted(pipe):
+    return os.path.join(inserted_dir, pipe)
+
+
+# Inputs of the pipes that attribute their rows to parliamentary groups, which
+# read the memberships from the database
+group_inputs = [_pipe_source("group_attribution")]
+
+# Raw inputs of each pipe
+pipe_inputs = {
+    "ballots": [os.path.join(raw_dir, "SaliDBAanestys.tsv")],
+    "votes": [
+        os.path.join(raw_dir, "SaliDBAanestysEdustaja.tsv"),
+        os.path.join(raw_dir, "SaliDBAanestys.tsv"),
+        *group_inputs,
+    ],
+    "election_seasons": [os.path.join(raw_dir, "election_seasons.tsv")],
+    "topics": [os.path.join(raw_dir, "finto_topics.json")],
+    "lobbies": [os.path.join(raw_dir, "lobby_actions.json")],
+    "lobby_terms": [os.path.join(raw_dir, "lobby_terms.json")],
+    "lobby_actions": [
+        os.path.join(raw_dir, "lobby_actions.json"),
+        os.path.join(raw_dir, "lobby_targets.json"),
+        _pipe_source("matching_help_functions"),
+    ],
+    "election_budgets": [os.path.join(raw_dir, "election23_budgets.csv")],
+    "election_fundings": [os.path.join(raw_dir, "election23_fundings.csv")],
+    "promises": [os.path.join(raw_dir, "promises_2023.json")],
+    "speeches": [os.path.join(vaski_dir, "Record_fi.tsv"), *group_inputs],
+    "absences": [os.path.join(vaski_dir, "RollCallReport_fi.tsv")],
+    "committee_reports": [
+        os.path.join(vaski_dir, "CommitteeReport_fi.tsv"),
+        *group_inputs,
+    ],
+    "government_proposals": [
+        os.path.join(vaski_dir, "GovernmentProposal_fi.tsv"),
+        *group_inputs,
+    ],
+    "mp_law_proposals": [
+        os.path.join(vaski_dir, "LegislativeMotion_fi.tsv"),
+        *group_inputs,
+    ],
+    "mp_petition_proposals": [
+        os.path.join(vaski_dir, "PetitionaryMotion_fi.tsv"),
+        *group_inputs,
+    ],
+    "interpellations": [os.path.join(vaski_dir, "Interpellation_fi.tsv")],
+}
+
+# All tables derived from MemberOfParliament.tsv are extracted in a single stage
+mp_tables = [
+    "mps",
+    "ministers",
+    "mp_committee_memberships",
+    "interests",
+    "assemblies",
+    "parliamentary_groups",
+    "mp_parliamentary_group_memberships",
+]
+
+# Pipes whose preprocessing reads the database or the handling index
+preprocess_after = {
+    "votes": ["import:mp_parliamentary_group_memberships"],
+    "speeches": ["import:mp_parliamentary_group_memberships"],
+    "government_proposals": [
+        "import:mps",
+        "handling_index",
+        "import:mp_parliamentary_group_memberships",
+    ],
+    "mp_law_proposals": [
+        "import:mps",
+        "handling_index",
+        "import:mp_parliamentary_group_memberships",
+    ],
+    "interpellations": ["import:mps", "handling_index"],
+    "committee_reports": ["import:mps", "import:mp_parliamentary_group_memberships"],
+    "mp_petition_proposals": [
+        "import:mps",
+        "import:speeches",
+        "import:mp_parliamentary_group_memberships",
+    ],
+    "lobby_actions": ["import:mps", "import:mp_parliamentary_group_memberships"],
+    "absences": ["import:speeches"],
+    "election_fundings": ["import:mp_parliamentary_group_memberships"],
+    "election_budgets": ["import:mp_parliamentary_group_memberships"],
+    "promises": ["import:mp_parliamentary_group_memberships"],
+}
+
+# Read at import, so resolved from this file rather than the working directory
+schema_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "postgres-init-scripts",
+    "01_create_tables.sql",
+)
+
+# Tables each pipe imports
+pipe_tables = {
+    "mps": ["persons"],
+    "ministers": ["minister_positions", "ministers"],
+    "mp_committee_memberships": ["mp_committee_memberships"],
+    "interests": ["interests"],
+    "assemblies": ["assemblies"],
+    "parliamentary_groups": ["parliamentary_groups"],
+    "mp_parliamentary_group_memberships": ["mp_parliamentary_group_memberships"],
+    "ballots": ["ballots"],
+    "votes": ["votes"],
+    "election_seasons": ["election_seasons"],
+    "topics": ["topics"],
+    "lobbies": ["lobbies"],
+    "lobby_terms": ["lobby_terms"],
+    "lobby_actions": ["lobby_topics", "lobby_actions"],
+    "election_budgets": ["election_budgets"],
+    "election_fundings": ["election_fundings"],
+    "promises": ["promises"],
+    "speeches": ["records", "agenda_items", "speeches"],
+    "absences": ["absences"],
+    "committee_reports": [
+        "committee_reports",
+        "committee_report_signatures",
+        "objections",
+        "objection_signatures",
+    ],
+    "government_proposals": ["proposals", "proposal_signatures"],
+    "mp_law_proposals": ["proposals", "proposal_signatures"],
+    "mp_petition_proposals": ["proposals", "proposal_signatures"],
+    "interpellations": ["interpellations", "interpellation_signatures"],
+}
+
+# Imports that have to wait for others for reasons other than foreign keys.
+# The memberships import re-attributes the rows of the pipes that carry a
+# pg_id, which must not run side by side with their own imports.
+import_after_extra = {
+    "mp_petition_proposals": ["speeches", "mp_parliamentary_group_memberships"],
+    "votes": ["mp_parliamentary_group_memberships"],
+    "speeches": ["mp_parliamentary_group_memberships"],
+    "committee_reports": ["mp_parliamentary_group_memberships"],
+    "government_proposals": ["mp_parliamentary_group_memberships"],
+    "mp_law_proposals": ["mp_parliamentary_group_memberships"],
+}
+
+
+def foreign_keys(path=schema_path):
+    """The tables each table of the schema references, besides itself"""
+    with open(path, encoding="utf-8") as f:
+        schema = f.read()
+    references = {}
+    for table, body in re.findall(
+        r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*?)\n\);", schema, re.DOTALL
+    ):
+        references[table] = set(re.findall(r"REFERENCES (\w+)", body)) - {table}
+    return references
+
+
+def import_dependencies():
+    """
+    The pipes each pipe is imported after: those that load the tables its
+    tables reference, so that the imports of unrelated tables run concurrently
+    """
+    loaded_by = {}
+    for pipe, tables in pipe_tables.items():
+        for table in tables:
+            loaded_by.setdefault(table, set()).add(pipe)
+
+    references = foreign_keys()
+    dependencies = {}
+    for pipe, tables in pipe_tables.items():
+        after = set(import_after_extra.get(pipe, []))
+        for table in tables:
+            for referenced in references.get(table, ()):
+                if referenced not in tables:
+                    after |= loaded_by.get(referenced, set())
+        if after:
+            dependencies[pipe] = sorted(after)
+    return dependencies
+
+
+# Foreign keys between the imported tables
+import_after = import_dependencies()
+
+# Pipes that can stream their rows straight into the database with `load_data`
+direct_load = {"speeches", "votes"}
+
+# First guesses of peak memory until the stages have been measured
+memory_estimates = {
+    "preprocess:speeches": 6144,
+    "preprocess:votes": 4096,
+    "preprocess:committee_reports": 3072,
+    "preprocess:government_proposals": 3072,
+}
+
+
+def build_stages(preprocess_only=False, direct=False):
+    """
+    Declares the stages of the whole pipeline as a dict of name -> Stage. With
+    `direct`, the pipes of `direct_load` are preprocessed and imported in a
+    single stage that skips the preprocessed files.
+    """
+    stages = {}
+
+    def add(stage):
+        stages[stage.name] = stage
+
+    add(
+        Stage(
+            "handling_index",
+            "handling_index",
+            "build_handling_index",
+            [
+                _pipe_source("handling_index"),
+                os.path.join(vaski_dir, "KasittelytiedotValtiopaivaasia_fi.tsv"),
+            ],
+            [_csv("handling_index")],
+        )
+    )
+    add(
+        Stage(
+            "mp_extract",
+            "mp_extractor",
+            "preprocess_data",
+            [
+                _pipe_source("mp_extractor"),
+                _pipe_source("harmonize"),
+                os.path.join(raw_dir, "MemberOfParliament.tsv"),
+                os.path.join("frontend", "src", "assets", ".unzipped"),
+            ],
+            [_csv(table) for table in mp_tables],
+        )
+    )
+
+    for pipe in mp_tables:
+        add(
+            Stage(
+                f"import:{pipe}",
+                f"{pipe}_pipe",
+                "import_data",
+                [_pipe_source(f"{pipe}_pipe")],
+                [_inserted(pipe)],
+                ["mp_extract"]
+                + [f"import:{dep}" for dep in import_after.get(pipe, [])],
+            )
+        )
+
+    for pipe, inputs in pipe_inputs.items():
+        name = f"preprocess:{pipe}"
+        if direct and pipe in direct_load:
+            add(
+                Stage(
+                    f"import:{pipe}",
+                    f"{pipe}_pipe",
+                    "load_data",
+                    [_pipe_source(f"{pipe}_pipe"), *inputs],
+                    [_inserted(pipe)],
+                    preprocess_after.get(pipe, [])
+                    + [f"import:{dep}" for dep in import_after.get(pipe, [])],
+                    memory_estimates.get(name),
+                )
+            )
+            continue
+        add(
+            Stage(
+                name,
+                f"{pipe}_pipe",
+                "preprocess_data",
+                [_pipe_source(f"{pipe}_pipe"), *inputs],
+                [_csv(pipe)],
+                preprocess_after.get(pipe, []),
+                memory_estimates.get(name),
+            )
+        )
+        add(
+            Stage(
+                f"import:{pipe}",
+                f"{pipe}_pipe",
+                "import_data",
+                [_pipe_source(f"{pipe}_pipe")],
+                [_inserted(pipe)],
+                [name] + [f"import:{dep}" for dep in import_after.get(pipe, [])],
+            )
+        )
+
+    # The vote counts follow the votes and the groups they are attributed to
+    add(
+        Stage(
+            "import:ballot_results",
+            "ballot_results_pipe",
+            "import_data",
+            [_pipe_source("ballot_results_pipe")],
+            [_inserted("ballot_results")],
+            ["import:votes", "import:mp_parliamentary_group_memberships"],
+        )
+    )
+
+    if preprocess_only:
+        # Preprocessing that reads the database still needs its imports
+        stages = with_dependencies(
+            stages, [name for name in stages if not name.startswith("import:")]
+        )
+
+    return stages
+
+
+def with_dependencies(stages, names):
+    """The stages of `names` and everything they run after"""
+    needed = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(stages[name].after)
+    return {name: stage for name, stage in stages.items() if name in needed}
+
+
+def load_stats():
+    if not os.path.exists(stats_path):
+        return {}
+    with open(stats_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_stats(stats):
+    os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2, sort_keys=True)
+
+
+def default_memory_budget_mb():
+    """Three quarters of the physical memory of the machine"""
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) // 1024 * 3 // 4
+    return 4 * default_memory_mb
+
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def is_up_to_date(stage, stages):
+    """Tells whether the outputs of `stage` are newer than everything it reads"""
+    output_times = [_mtime(path) for path in stage.outputs]
+    if not output_times or None in output_times:
+        return False
+    inputs = stage.inputs + [
+        path for dep in stage.after for path in stages[dep].outputs
+    ]
+    input_times = [t for t in map(_mtime, inputs) if t is not None]
+    return not input_times or max(input_times) <= min(output_times)
+
+
+def critical_paths(stages, seconds):
+    """
+    Length of the longest chain of durations from each stage to the end of the
+    pipeline, i.e. how long the rest of the pipeline takes at the least once
+    the stage starts
+    """
+    dependents = {name: [] for name in stages}
+    for name, stage in stages.items():
+        for dep in stage.after:
+            dependents[dep].append(name)
+
+    paths = {}
+
+    def path(name):
+        if name not in paths:
+            paths[name] = seconds[name] + max(
+                (path(dependent) for dependent in dependents[name]), default=0.0
+            )
+        return paths[name]
+
+    for name in stages:
+        path(name)
+    return paths
+
+
+def _run_stage(stage, kwargs, profile, conn):
+    """Runs in the forked child process of a stage and reports back over `conn`"""
+    report = {"error": None}
+    try:
+        function = getattr(importlib.import_module(stage.module), stage.function)
+        parameters = inspect.signature(function).parameters
+        with instrument(stage.name, stage.outputs, profile) as metrics:
+            function(
+                **{key: value for key, value in kwargs.items() if key in parameters}
+            )
+        report.update(metrics.report())
+        for path in stage.outputs:
+            if path.startswith(inserted_dir):
+                os.makedirs(inserted_dir, exist_ok=True)
+                with open(path, "w"):
+                    pass
+    except BaseException as e:
+        report["error"] = repr(e)
+        raise
+    finally:
+        conn.send(report)
+        conn.close()
+
+
+def run(
+    stages,
+    kwargs,
+    memory_budget_mb,
+    max_parallel,
+    force=False,
+    profile=(),
+    cpu_budget=None,
+):
+    """
+    Runs the stages in dependency order, each in its own forked process.
+
+    Ready stages are started in the order of their critical path, longest first,
+    as long as the memory they have used before fits in what is left of
+    `memory_budget_mb`. A stage that does not fit waits for the others to
+    finish, unless nothing is running. The stages in `profile` are run under
+    cProfile. Returns the reports of the stages.
+
+    The `cpu_budget` CPUs, all of the machine by default, are shared the same
+    way. A stage that takes `workers` gets an even share of the free CPUs among
+    the stages ready to start, at most `kwargs["workers"]` if that is set, and
+    the others one CPU each, so the stages and their worker processes never
+    outnumber the CPUs.
+    """
+    cpu_budget = cpu_budget or os.cpu_count()
+    stats = load_stats()
+    seconds = {
+        name: stats.get(name, {}).get("seconds", default_seconds) for name in stages
+    }
+    memory_mb = {
+        name: stats.get(name, {}).get("peak_mb", stage.memory_mb)
+        for name, stage in stages.items()
+    }
+    priority = critical_paths(stages, seconds)
+
+    # Children are forked so that the imports of this process are shared, and
+    # report into the same run
+    run_id()
+    context = multiprocessing.get_context("fork")
+    for module in {stage.module for stage in stages.values()}:
+        importlib.import_module(module)
+    takes_workers = {
+        name: "workers"
+        in inspect.signature(
+            getattr(importlib.import_module(stage.module), stage.function)
+        ).parameters
+        for name, stage in stages.items()
+    }
+
+    waiting = set(stages)
+    done = set()
+    running = {}  # sentinel -> (name, process, conn, start, cpus)
+    results = {}
+    failed = []
+    used_mb = 0.0
+    used_cpus = 0
+
+    while waiting or running:
+        ready = sorted(
+            (
+                name
+                for name in waiting
+                if all(dep in done for dep in stages[name].after)
+            ),
+            key=lambda name: -priority[name],
+        )
+        skipped = False
+        # The free CPUs split among the stages that can start now
+        share = max(
+            1,
+            (cpu_budget - used_cpus)
+            // max(1, min(len(ready), max_parallel - len(running))),
+        )
+        for name in ready if not failed else []:
+            if len(running) >= max_parallel:
+                break
+            if not force and is_up_to_date(stages[name], stages):
+                waiting.discard(name)
+                done.add(name)
+                results[name] = {"seconds": 0.0, "skipped": True}
+                print(f"{name} is up to date")
+                skipped = True
+                continue
+            if running and used_mb + memory_mb[name] > memory_budget_mb:
+                continue
+            free_cpus = cpu_budget - used_cpus
+            if running and free_cpus < 1:
+                continue
+
+            stage_kwargs = kwargs
+            cpus = 1
+            if takes_workers[name]:
+                cpus = max(1, min(share, free_cpus, kwargs.get("workers") or share))
+                stage_kwargs = {**kwargs, "workers": cpus}
+
+            print(f"Running {name}...")
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_run_stage,
+                args=(stages[name], stage_kwargs, name in profile, sender),
+                name=name,
+            )
+            process.start()
+            sender.close()
+            running[process.sentinel] = (
+                name,
+                process,
+                receiver,
+                time.monotonic(),
+                cpus,
+            )
+            waiting.discard(name)
+            used_mb += memory_mb[name]
+            used_cpus += cpus
+
+        if not running:
+            if skipped:
+                # Skipped stages may have made others ready
+                continue
+            if waiting and not failed:
+                raise RuntimeError(f"Unreachable stages: {', '.join(sorted(waiting))}")
+            break
+
+        for sentinel in wait(list(running)):
+            name, process, receiver, start, cpus = running.pop(sentinel)
+            process.join()
+            elapsed = time.monotonic() - start
+            used_mb -= memory_mb[name]
+            used_cpus -= cpus
+            report = receiver.recv() if receiver.poll() else {}
+            receiver.close()
+            if process.exitcode != 0:
+                failed.append(name)
+                print(f"{name} failed: {report.get('error') or process.exitcode}")
+                continue
+            done.add(name)
+            results[name] = {**report, "seconds": elapsed}
+            stats[name] = {"seconds": elapsed, "peak_mb": report["peak_rss_mb"]}
+            notes = f", {len(report['notes'])} notes" if report.get("notes") else ""
+            print(f"{name} finished in {elapsed:.1f} s{notes}")
+
+    save_stats(stats)
+    if failed:
+        raise RuntimeError(f"Stages failed: {', '.join(failed)}")
+    return results
+
+
+def report(stages, results, wall_seconds):
+    """Compares the wall clock time of the run with its theoretical minimum"""
+    seconds = {name: results.get(name, {}).get("seconds", 0.0) for name in stages}
+    paths = critical_paths(stages, seconds)
+    roots = [name for name, stage in stages.items() if not stage.after]
+    minimum = max((paths[name] for name in roots), default=0.0)
+    serial = sum(seconds.values())
+
+    # Follow the longest chain from its root to its end
+    chain = []
+    name = max(roots, key=paths.get, default=None)
+    while name is not None:
+        chain.append(name)
+        dependents = [n for n, stage in stages.items() if name in stage.after]
+        name = max(dependents, key=paths.get, default=None)
+
+    print(f"Wall clock: {wall_seconds:.1f} s")
+    print(f"Critical path: {minimum:.1f} s ({' -> '.join(chain)})")
+    print(f"Serial sum: {serial:.1f} s")
+    if wall_seconds > 0:
+        print(f"Efficiency: {minimum / wall_seconds:.0%} of the theoretical minimum")
+
+    summary = {
+        "wall_seconds": wall_seconds,
+        "critical_path_seconds": minimum,
+        "critical_path": chain,
+        "serial_seconds": serial,
+    }
+    with open(os.path.join(run_dir(), "run.json"), "w") as f:
+        json.dump({"summary": summary, "stages": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="runs the preprocessing and imports of all pipes as a DAG"
+    )
+    parser.add_argument(
+        "--preprocess-only",
+        action="store_true",
+        help="only preprocess, importing just what the preprocessing reads",
+    )
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help=f"stream {' and '.join(sorted(direct_load))} straight into the database",
+    )
+    parser.add_argument(
+        "--stages", nargs="+", help="run only these stages and what they depend on"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes per document pipe at most, a share of the CPUs by default",
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=int,
+        default=os.cpu_count(),
+        help="maximum number of stages running at once",
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=int,
+        default=os.cpu_count(),
+        help="CPUs the concurrently running stages and their workers may use in total",
+    )
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=default_memory_budget_mb(),
+        help="memory the concurrently running stages may use in total",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="rerun stages that are up to date"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the hashes of earlier imports and preprocess everything",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="*",
+        metavar="STAGE",
+        help="dump a cProfile of these stages, or of all of them if none are given",
+    )
+    args = parser.parse_args()
+
+    stages = build_stages(args.preprocess_only, args.direct)
+    if args.stages:
+        unknown = set(args.stages) - set(stages)
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+        stages = with_dependencies(stages, args.stages)
+
+    profile = stages.keys() if args.profile == [] else args.profile or ()
+
+    os.makedirs(preprocessed_dir, exist_ok=True)
+    print(f"Reporting to {run_dir()}")
+    start = time.monotonic()
+    results = run(
+        stages,
+        {"workers": args.workers, "full": args.full},
+        args.memory_budget_mb,
+        args.max_parallel,
+        args.force or args.full,
+        profile,
+        args.cpu_budget,
+    )
+    report(stages, results, time.monotonic() - start)
@@ -1,63 +1,26 @@
-import os.path
-import pandas as pd
-import xmltodict
-from harmonize import harmonize_parliamentary_group
-from db import get_connection
+import mp_extractor
 
-csv_path = "data/preprocessed/parliamentary_groups.csv"
+from db import upsert_csv, bulk_load
+from incremental import HashManifest, add_full_argument
 
+csv_path = mp_extractor.csv_paths["parliamentary_groups"]
 
-def preprocess_data():
-    with open(os.path.join("data", "raw", "MemberOfParliament.tsv"), "r") as f:
-        MoP = pd.read_csv(f, sep="\t")
 
-    xml_dicts = MoP.XmlDataFi.apply(xmltodict.parse)
-    parliamentary_groups = []
-    for henkilo in xml_dicts:
-        try:
-            parliamentary_groups.append(
-                henkilo["Henkilo"]["Eduskuntaryhmat"]["NykyinenEduskuntaryhma"]["Nimi"]
-            )
-        except KeyError:
-            pass  # Ei nykyistä puoluetta
-        try:
-            parliamentary_groups.append(
-                henkilo["Henkilo"]["Eduskuntaryhmat"]["EdellisetEduskuntaryhmat"][
-                    "Eduskuntaryhma"
-                ]["Nimi"]
-            )
-        except TypeError:
-            if henkilo["Henkilo"]["Eduskuntaryhmat"]["EdellisetEduskuntaryhmat"]:
-                for ekr in henkilo["Henkilo"]["Eduskuntaryhmat"][
-                    "EdellisetEduskuntaryhmat"
-                ]["Eduskuntaryhma"]:
-                    parliamentary_groups.append(ekr["Nimi"])
-    parliamentary_groups = [p for p in set(parliamentary_groups) if p is not None]
-
-    parliamentary_group_keys = [
-        harmonize_parliamentary_group(parliamentary_group)
-        for parliamentary_group in parliamentary_groups
-    ]
-    parliamentary_groups_df = pd.DataFrame(
-        {"id": parliamentary_group_keys, "name": parliamentary_groups}
-    )
-
-    parliamentary_groups_df.to_csv(csv_path, index=False)
+def preprocess_data(full=False):
+    mp_extractor.preprocess_data(["parliamentary_groups"], full)
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
+    manifest = HashManifest("parliamentary_groups")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed parliamentary groups waiting to be imported")
+        return
 
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY parliamentary_groups(id, name) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
+    with bulk_load("parliamentary_groups") as cursor, open(csv_path) as f:
+        upsert_csv(cursor, "parliamentary_groups", ["id", "name"], f, ["id"])
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -70,11 +33,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", help="import preprocessed data", action="store_true"
     )
+    add_full_argument(parser)
     args = parser.parse_args()
     if args.preprocess_data:
-        preprocess_data()
+        preprocess_data(args.full)
     if args.import_data:
         import_data()
     if not args.preprocess_data and not args.import_data:
-        preprocess_data()
+        preprocess_data(args.full)
         import_data()
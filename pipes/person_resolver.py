@@ -0,0 +1,59 @@
+from db import get_connection
+
+# Signer names sometimes have the signer's party abbreviation appended to the
+# last name, e.g. "Virtanen kok"
+party_abbreviations = ("ps", "kok", "vihr", "sd", "r", "liik", "kesk", "vas")
+
+
+def _normalize(name):
+    """Lower case with all runs of whitespace collapsed to a single space"""
+    return " ".join(name.split()).lower()
+
+
+class PersonResolver:
+    """
+    In-memory index of persons by normalized first and last name, used to
+    resolve signers that have no person id in the VASKI documents.
+
+    The index is a plain dict, so a resolver can be sent to worker processes.
+    """
+
+    def __init__(self, persons):
+        """`persons` is an iterable of `(id, first_name, last_name)` tuples"""
+        self.index = {}
+        for person_id, first_name, last_name in persons:
+            if first_name and last_name:
+                self.index.setdefault(
+                    (_normalize(first_name), _normalize(last_name)), person_id
+                )
+
+    @classmethod
+    def from_database(cls):
+        """Loads all persons from the database in a single query"""
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, first_name, last_name FROM persons ORDER BY id")
+        resolver = cls(cursor.fetchall())
+        cursor.close()
+        conn.close()
+        return resolver
+
+    def resolve(self, first_name, last_name):
+        """
+        Returns the id of the person with the given name, or None if there is
+        no such person (e.g. secretaries signing as presenters). A trailing
+        party abbreviation in the last name is ignored.
+        """
+        first_name = _normalize(first_name)
+        last_name = _normalize(last_name)
+
+        person_id = self.index.get((first_name, last_name))
+        if person_id is not None:
+            return person_id
+
+        last_name_parts = last_name.split()
+        if len(last_name_parts) > 1 and last_name_parts[-1].endswith(
+            party_abbreviations
+        ):
+            return self.index.get((first_name, " ".join(last_name_parts[:-1])))
+        return None
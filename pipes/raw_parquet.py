@@ -0,0 +1,166 @@
+import os
+
+import polars as pl
+
+raw_dir = os.path.join("data", "raw")
+vaski_dir = os.path.join(raw_dir, "vaski")
+
+# Typed and compressed copies of the raw inputs, written once per raw file
+parquet_dir = os.path.join(raw_dir, "parquet")
+
+# The VASKI documents are read a row group at a time, so their row groups are
+# kept small
+vaski_row_group_size = 100
+
+
+def _tsv(types=None):
+    """
+    Reads a tab separated file with every column as text except for `types`.
+    Empty fields stay empty strings, as the csv module reads them.
+    """
+
+    def read(path):
+        frame = pl.scan_csv(path, separator="\t", infer_schema=False)
+        frame = frame.with_columns(
+            pl.col(column).cast(dtype) for column, dtype in (types or {}).items()
+        )
+        return frame.with_columns(pl.col(pl.String).fill_null(""))
+
+    return read
+
+
+def _json(infer_schema_length=100):
+    def read(path):
+        return pl.read_json(path, infer_schema_length=infer_schema_length).lazy()
+
+    return read
+
+
+def _csv(separator):
+    def read(path):
+        return pl.scan_csv(path, separator=separator, infer_schema_length=10000)
+
+    return read
+
+
+# Raw file -> reader giving its typed frame. The types are those the pipes used
+# to parse the files with.
+readers = {
+    os.path.join(raw_dir, "SaliDBAanestys.tsv"): _tsv({"KieliId": pl.Int64}),
+    os.path.join(raw_dir, "SaliDBAanestysEdustaja.tsv"): _tsv(
+        {"EdustajaHenkiloNumero": pl.Int64, "AanestysId": pl.Int64}
+    ),
+    os.path.join(raw_dir, "SaliDBIstunto.tsv"): _tsv(),
+    os.path.join(raw_dir, "MemberOfParliament.tsv"): _tsv(),
+    os.path.join(raw_dir, "lobby_actions.json"): _json(10000),
+    os.path.join(raw_dir, "lobby_terms.json"): _json(10000),
+    os.path.join(raw_dir, "lobby_targets.json"): _json(),
+    os.path.join(raw_dir, "election23_budgets.csv"): _csv(";"),
+    os.path.join(raw_dir, "election23_fundings.csv"): _csv(";"),
+}
+
+
+def _is_vaski(path):
+    return os.path.dirname(path) == vaski_dir and path.endswith(".tsv")
+
+
+def parquet_path(path):
+    """
+    Where the Parquet copy of the raw file `path` is kept. The VASKI files
+    written by vaski_parser.py are partitioned by their doctype.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if _is_vaski(path):
+        return os.path.join(parquet_dir, "vaski", f"doctype={name}", "0.parquet")
+    return os.path.join(parquet_dir, f"{name}.parquet")
+
+
+def _reader(path):
+    if path in readers:
+        return readers[path]
+    if _is_vaski(path):
+        return _tsv()
+    raise KeyError(f"No Parquet conversion for {path}")
+
+
+def is_fresh(path):
+    """
+    Whether the Parquet copy of `path` was written from the current file. The
+    copies get the modification time of their raw file, as unzipping a new dump
+    can leave a raw file older than the copy of the previous one.
+    """
+    target = parquet_path(path)
+    return os.path.exists(target) and os.path.getmtime(target) == os.path.getmtime(path)
+
+
+def convert(path, force=False):
+    """
+    Writes the Parquet copy of the raw file `path`, unless an up to date one
+    exists. The copy is written under a temporary name and moved in place, so
+    pipes converting the same file at the same time do not see partial files.
+    """
+    if not force and is_fresh(path):
+        return parquet_path(path)
+    target = parquet_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    row_group_size = vaski_row_group_size if _is_vaski(path) else None
+    _reader(path)(path).sink_parquet(
+        tmp_path, compression="zstd", row_group_size=row_group_size
+    )
+    mtime = os.path.getmtime(path)
+    os.utime(tmp_path, (mtime, mtime))
+    os.replace(tmp_path, target)
+    return target
+
+
+def scan(path):
+    """
+    A lazy scan of the raw file `path` through its Parquet copy, so that only
+    the columns and rows a pipe asks for are read
+    """
+    return pl.scan_parquet(convert(path))
+
+
+def iter_rows(path, columns, predicate=None, batch_rows=None):
+    """
+    Streams the `columns` of the rows of the raw file `path` that match
+    `predicate` as tuples, reading `batch_rows` rows of its Parquet copy at a
+    time. The VASKI files are read a row group at a time by default.
+    """
+    target = convert(path)
+    if batch_rows is None:
+        batch_rows = vaski_row_group_size if _is_vaski(path) else 100_000
+    rows = pl.scan_parquet(target).select(pl.len()).collect().item()
+    for offset in range(0, rows, batch_rows):
+        batch = pl.scan_parquet(target).slice(offset, batch_rows)
+        if predicate is not None:
+            batch = batch.filter(predicate)
+        yield from batch.select(columns).collect().iter_rows()
+
+
+def convert_all(force=False):
+    """Converts every raw file that is present"""
+    paths = [path for path in readers if os.path.exists(path)]
+    if os.path.isdir(vaski_dir):
+        paths += sorted(
+            os.path.join(vaski_dir, name)
+            for name in os.listdir(vaski_dir)
+            if _is_vaski(os.path.join(vaski_dir, name))
+        )
+    for path in paths:
+        print(f"Converting {path}")
+        convert(path, force)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="writes the Parquet copies of the raw inputs"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="rewrite the up to date copies too"
+    )
+    args = parser.parse_args()
+    convert_all(args.force)
@@ -0,0 +1,159 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from multiprocessing.util import Finalize
+
+from lxml import etree
+
+# Rendered markdown of XML fragments, shared by all pipes and processes. The
+# cache lives in the data directory of the repository whatever the working
+# directory, unless RENDER_CACHE_PATH points elsewhere.
+cache_path = os.environ.get(
+    "RENDER_CACHE_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "data",
+        ".render_cache.sqlite",
+    ),
+)
+max_cache_bytes = int(os.environ.get("RENDER_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+# Writes are buffered and committed in batches of this many
+write_batch_size = 500
+
+
+class RenderCache:
+    """
+    Size bounded on-disk cache of rendered markdown in a single SQLite file.
+
+    Entries are zlib compressed and evicted least recently used first once the
+    cache grows over `max_bytes`. Every process opens its own connection, and
+    the buffered writes are committed when the process exits.
+    """
+
+    def __init__(self, path=cache_path, max_bytes=max_cache_bytes):
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS renders (
+                key TEXT PRIMARY KEY,
+                markdown BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS renders_last_used ON renders(last_used);"
+        )
+        self.conn.commit()
+        self.writes = {}  # key -> compressed markdown
+        self.hits = set()
+        Finalize(self, self.close, exitpriority=10)
+
+    def get(self, key):
+        if key in self.writes:
+            return zlib.decompress(self.writes[key]).decode("utf-8")
+        row = self.conn.execute(
+            "SELECT markdown FROM renders WHERE key = ?;", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.hits.add(key)
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key, markdown):
+        self.writes[key] = zlib.compress(markdown.encode("utf-8"))
+        if len(self.writes) >= write_batch_size:
+            self.flush()
+
+    def flush(self):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO renders(key, markdown, size, last_used)
+                VALUES (?, ?, ?, ?);
+                """,
+                ((key, md, len(md), now) for key, md in self.writes.items()),
+            )
+            self.conn.executemany(
+                "UPDATE renders SET last_used = ? WHERE key = ?;",
+                ((now, key) for key in self.hits),
+            )
+        self.writes.clear()
+        self.hits.clear()
+
+    def evict(self):
+        """Drops the least recently used entries until the cache fits its budget"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM renders;")
+        excess = total.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM renders ORDER BY last_used;"
+        ):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        with self.conn:
+            self.conn.executemany("DELETE FROM renders WHERE key = ?;", evicted)
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.flush()
+        self.evict()
+        self.conn.close()
+        self.conn = None
+
+
+_caches = {}  # pid -> RenderCache, as connections must not cross a fork
+
+
+def get_cache():
+    pid = os.getpid()
+    if pid not in _caches:
+        _caches[pid] = RenderCache()
+    return _caches[pid]
+
+
+def cached_render(version):
+    """
+    Decorates a `render(element, *args)` function that turns an XML fragment
+    into markdown. Results are cached by a hash of the serialized fragment, the
+    other arguments, the name of the function and `version`, which must be
+    bumped whenever the rendered output changes. On a hit nothing is rendered.
+    """
+
+    def decorator(render):
+        @functools.wraps(render)
+        def wrapper(element, *args):
+            if element is None:
+                return render(element, *args)
+
+            digest = hashlib.blake2b(digest_size=20)
+            digest.update(f"{render.__name__}\0{version}\0{args!r}\0".encode())
+            digest.update(etree.tostring(element, with_tail=False))
+            key = digest.hexdigest()
+
+            cache = get_cache()
+            markdown = cache.get(key)
+            if markdown is None:
+                markdown = render(element, *args)
+                if markdown is not None:
+                    cache.put(key, markdown)
+            return markdown
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,330 @@
+import gc
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from lxml import etree
+from XML_parsing_help_functions import (
+    NS,
+    KappaleKooste_parse,
+    Lista_parse,
+    SuppeaLista_parse,
+    saados_to_md,
+    tau_to_md,
+    xml_to_markdown,
+)
+
+baseline_path = os.path.join("data", ".renderer_benchmark_baseline.json")
+
+words = [
+    "eduskunta",
+    "hallitus",
+    "esitys",
+    "laki",
+    "valiokunta",
+    "muutos",
+    "vuosi",
+    "talousarvio",
+    "kunta",
+    "valtio",
+    "sopimus",
+    "asetus",
+    "tuki",
+    "määräraha",
+    "euroa",
+    "ehdotus",
+]
+
+
+def _q(tag):
+    """Clark name of a `prefix:name` tag"""
+    prefix, name = tag.split(":")
+    return f"{{{NS[prefix]}}}{name}"
+
+
+def _el(parent, tag, text=None, **attrib):
+    """A new `tag` element, appended to `parent` unless it is None"""
+    if parent is None:
+        element = etree.Element(_q(tag), attrib)
+    else:
+        element = etree.SubElement(parent, _q(tag), attrib)
+    element.text = text
+    return element
+
+
+def _sentence(rng, length=12):
+    return " ".join(rng.choice(words) for _ in range(length)).capitalize() + ". "
+
+
+class FragmentGenerator:
+    """
+    Builds synthetic VASKI fragments of a given `size`. The same seed always gives
+    the same fragments, so the timings of different runs are comparable.
+    """
+
+    def __init__(self, size=4, seed=0):
+        self.size = size
+        self.rng = random.Random(seed)
+
+    def paragraph(self, parent=None, tag="sis:KappaleKooste"):
+        """A paragraph of plain text mixed with all kinds of inline formatting"""
+        rng = self.rng
+        kappale = _el(parent, tag, _sentence(rng))
+        inline = [
+            ("sis1:KursiiviTeksti", lambda: rng.choice(words)),
+            ("sis1:LihavaTeksti", lambda: rng.choice(words)),
+            ("sis1:LihavaKursiiviTeksti", lambda: rng.choice(words)),
+            ("sis1:YlaindeksiTeksti", lambda: rng.choice(["2", "3", "a"])),
+            ("sis1:AlaindeksiTeksti", lambda: rng.choice(["1", "2", "10", "x"])),
+            ("sis1:AlaviiteTeksti", lambda: _sentence(rng, 6)),
+            ("sis1:Rivivaihto", lambda: None),
+            ("sis1:AsiakirjaViiteTunnus", lambda: "HE 1/2024 vp"),
+        ]
+        for _ in range(2 * self.size):
+            tag, text = rng.choice(inline)
+            _el(kappale, tag, text()).tail = _sentence(rng, 8)
+        return kappale
+
+    def lista(self, parent=None, items=None):
+        """A <Lista> of <Alkio> items, each holding a paragraph"""
+        lista = _el(parent, "sis:Lista")
+        lista.set(_q("ns2:ulkoasuKoodi"), self.rng.choice(["Viiva", "Numerosulku"]))
+        for _ in range(items or 2 * self.size):
+            self.paragraph(_el(lista, "sis:Alkio"))
+        return lista
+
+    def suppea_lista(self, parent=None, lists=None):
+        """Consecutive <SuppeaLista> elements, returning the first one"""
+        parent = _el(None, "sis:Sisalto") if parent is None else parent
+        first = None
+        for _ in range(lists or 2 * self.size):
+            suppea = _el(parent, "sis:SuppeaLista")
+            suppea.set(_q("ns2:ulkoasuKoodi"), "Numeropiste")
+            self.paragraph(suppea)
+            first = suppea if first is None else first
+        return first
+
+    def table(self, parent=None, rows=None, cols=None):
+        """A tau:table grid with a header row and `rows` x `cols` cells"""
+        rows = rows or 8 * self.size
+        cols = cols or 2 + self.size
+        table = _el(parent, "tau:table")
+        tgroup = _el(table, "tau:tgroup", cols=str(cols))
+        for col in range(cols):
+            _el(tgroup, "tau:colspec", colname=f"c{col + 1}")
+        thead = _el(tgroup, "tau:thead")
+        row = _el(thead, "tau:row")
+        for col in range(cols):
+            entry = _el(row, "tau:entry", colname=f"c{col + 1}")
+            _el(entry, "sis:KappaleKooste", f"Sarake {col + 1}")
+        tbody = _el(tgroup, "tau:tbody")
+        for _ in range(rows):
+            row = _el(tbody, "tau:row")
+            for col in range(cols):
+                entry = _el(row, "tau:entry", colname=f"c{col + 1}")
+                _el(entry, "sis:KappaleKooste", f"{self.rng.randint(0, 10**6)} euroa")
+        return table
+
+    def perustelu_osa(self, depth=3):
+        """<PerusteluOsa> with `depth` levels of nested <PerusteluLuku> chapters"""
+        osa = _el(None, "asi:PerusteluOsa")
+
+        def chapter(parent, level):
+            luku = _el(parent, "asi:PerusteluLuku")
+            otsikko = _el(luku, "asi:LukuOtsikko")
+            _el(otsikko, "asi1:OtsikkoNroTeksti", str(level))
+            _el(otsikko, "asi1:OtsikkoTeksti", _sentence(self.rng, 4))
+            for _ in range(self.size):
+                self.paragraph(luku)
+            self.lista(luku, items=self.size)
+            self.suppea_lista(luku, lists=2)
+            if level < depth:
+                for _ in range(2):
+                    chapter(luku, level + 1)
+            else:
+                self.table(luku, rows=self.size, cols=3)
+
+        for _ in range(self.size):
+            chapter(osa, 1)
+        return osa
+
+    def saados(self, pykalat=None):
+        """A <Saados> law with a preamble and `pykalat` sections of moments"""
+        saados = _el(None, "saa:Saados")
+        _el(_el(saados, "saa:LakiehdotusNumeroKooste"), "saa1:Teksti", "1.")
+        _el(_el(saados, "saa:SaadostyyppiKooste"), "saa1:Teksti", "Laki")
+        _el(
+            _el(saados, "saa:SaadosNimekeKooste"),
+            "saa1:Teksti",
+            _sentence(self.rng, 6),
+        )
+        johtolause = _el(saados, "saa:Johtolause")
+        _el(johtolause, "saa:SaadosKappaleKooste", _sentence(self.rng))
+        for number in range(pykalat or 4 * self.size):
+            pykala = _el(saados, "saa:Pykala")
+            _el(pykala, "saa:PykalaTunnusKooste", f"{number + 1} §")
+            _el(pykala, "saa:SaadosOtsikkoKooste", _sentence(self.rng, 3))
+            for _ in range(2):
+                _el(pykala, "saa:MomenttiKooste", _sentence(self.rng, 20))
+            if number % 4 == 0:
+                kohdat = _el(pykala, "saa:KohdatMomentti")
+                _el(kohdat, "saa:MomenttiJohdantoKooste", _sentence(self.rng))
+                for _ in range(3):
+                    _el(kohdat, "saa:MomenttiKohtaKooste", _sentence(self.rng, 6))
+            if number % 8 == 0:
+                self.table(pykala, rows=4, cols=3)
+        return saados
+
+
+def build_cases(size):
+    """The benchmarked functions as `name -> (render, args)`"""
+    generator = FragmentGenerator(size)
+    return {
+        "KappaleKooste_parse": (KappaleKooste_parse, (generator.paragraph(),)),
+        "Lista_parse": (Lista_parse, (generator.lista(),)),
+        "SuppeaLista_parse": (SuppeaLista_parse, (generator.suppea_lista(),)),
+        "tau_to_md": (tau_to_md, (generator.table(),)),
+        "xml_to_markdown": (xml_to_markdown, (generator.perustelu_osa(),)),
+        # The render cache is bypassed to time the renderer itself
+        "saados_to_md": (saados_to_md.__wrapped__, (generator.saados(), NS)),
+    }
+
+
+def measure(render, args, min_seconds=1.0, repeat=20):
+    """
+    Times `render(*args)` in `repeat` rounds taking `min_seconds` in total and
+    returns the ops/sec of the fastest round, which is the least disturbed by
+    other processes, along with the peak memory allocated by one call, the
+    memory blocks one call leaves allocated and a digest of the rendered output.
+    Like timeit, garbage collection is off while timing.
+    """
+    output = render(*args)
+    gc.disable()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            render(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds / repeat:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            render(*args)
+        best = min(best, time.perf_counter() - start)
+
+    # Blocks still allocated after a call, the output among them, with nothing
+    # collected in between
+    before = sys.getallocatedblocks()
+    kept = render(*args)
+    blocks = sys.getallocatedblocks() - before
+    del kept
+    gc.enable()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    render(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ops_per_second": loops / best,
+        "peak_kib": peak / 1024,
+        "blocks": blocks,
+        "output": hashlib.blake2b(output.encode("utf-8"), digest_size=8).hexdigest(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the results against `baseline` and returns the names of the functions
+    that got slower or allocate more by more than `threshold`
+    """
+    regressions = []
+    print(
+        f"{'function':<22}{'ops/sec':>12}{'change':>9}{'peak KiB':>11}{'change':>9}"
+        f"{'blocks':>9}{'change':>9}"
+    )
+    for name, result in results.items():
+        base = baseline.get(name)
+        speed_change = memory_change = blocks_change = ""
+        if base is not None:
+            speed = result["ops_per_second"] / base["ops_per_second"] - 1
+            memory = (
+                result["peak_kib"] / base["peak_kib"] - 1 if base["peak_kib"] else 0
+            )
+            # Baselines saved before the block counts have none
+            blocks = result["blocks"] / base["blocks"] - 1 if base.get("blocks") else 0
+            speed_change, memory_change = f"{speed:+.0%}", f"{memory:+.0%}"
+            blocks_change = f"{blocks:+.0%}" if base.get("blocks") else ""
+            if speed < -threshold or memory > threshold or blocks > threshold:
+                regressions.append(name)
+            if result["output"] != base["output"]:
+                print(f"{name}: the rendered output differs from the baseline")
+        print(
+            f"{name:<22}{result['ops_per_second']:>12.1f}{speed_change:>9}"
+            f"{result['peak_kib']:>11.1f}{memory_change:>9}"
+            f"{result['blocks']:>9}{blocks_change:>9}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="benchmarks the VASKI XML to markdown renderers"
+    )
+    parser.add_argument(
+        "--size", type=int, default=4, help="size of the generated fragments"
+    )
+    parser.add_argument(
+        "--only", nargs="+", metavar="FUNCTION", help="benchmark only these"
+    )
+    parser.add_argument(
+        "--min-seconds", type=float, default=1.0, help="time spent per function"
+    )
+    parser.add_argument("--baseline", default=baseline_path, help="baseline file")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown or allocation growth that fails the run",
+    )
+    args = parser.parse_args()
+
+    cases = build_cases(args.size)
+    results = {
+        name: measure(render, render_args, args.min_seconds)
+        for name, (render, render_args) in cases.items()
+        if not args.only or name in args.only
+    }
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)
+    # Baselines are kept per fragment size
+    baseline = baselines.get(str(args.size), {})
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        baselines[str(args.size)] = {**baseline, **results}
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+    elif regressions:
+        print(f"Regressed over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
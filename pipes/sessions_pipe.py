@@ -1,34 +1,23 @@
 import os.path
-import pandas as pd
+import polars as pl
 
-from db import get_connection
+from db import copy_csv, bulk_load
+from raw_parquet import scan
 
 csv_path = "data/preprocessed/sessions.csv"
 
 
 def preprocess_data():
-    with open(os.path.join("data", "raw", "SaliDBIstunto.tsv"), "r") as f:
-        sessions = pd.read_csv(f, sep="\t")
-
-    sessions = sessions[["TekninenAvain", "IstuntoPvm"]]
-    sessions.columns = ["id", "date"]
+    sessions = scan(os.path.join("data", "raw", "SaliDBIstunto.tsv")).select(
+        pl.col("TekninenAvain").alias("id"), pl.col("IstuntoPvm").alias("date")
+    )
 
-    sessions.to_csv(csv_path, index=False)
+    sessions.collect().write_csv(csv_path)
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY sessions(id, date) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with bulk_load("sessions") as cursor, open(csv_path) as f:
+        copy_csv(cursor, "sessions", ["id", "date"], f)
 
 
 if __name__ == "__main__":
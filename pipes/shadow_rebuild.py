@@ -0,0 +1,196 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+from db import get_connection
+from incremental import hashes_dir
+from instrumentation import progress
+from orchestrator import inserted_dir
+
+# The database is rebuilt into `shadow_schema` and swapped in for public, which
+# is kept as `previous_schema` for a rollback
+shadow_schema = "shadow"
+previous_schema = "previous"
+swap_schema = "swapping"  # Temporary name of public during a rollback
+
+schema_path = os.path.join("postgres-init-scripts", "01_create_tables.sql")
+# Search vectors, GIN indexes and views, built on the loaded tables
+post_load_scripts = [
+    os.path.join("sql", "proposal_search.sql"),
+    os.path.join("sql", "person_search.sql"),
+    os.path.join("sql", "views.sql"),
+]
+
+# Pipeline state that belongs to the schema it describes. The shadow load keeps
+# its own, which the swap moves in place of the live one.
+state_dirs = {"HASHES_DIR": hashes_dir, "INSERTED_DIR": inserted_dir}
+
+
+def _suffixed(path, suffix):
+    return f"{path.rstrip(os.sep)}.{suffix}"
+
+
+def _connect():
+    conn = get_connection()
+    conn.autocommit = True  # The SQL scripts manage their own transactions
+    return conn
+
+
+def _run_script(cursor, path):
+    with open(path, encoding="utf-8") as f:
+        cursor.execute(f.read())
+
+
+def create_shadow():
+    """Creates the tables in an empty shadow schema, UNLOGGED for the load"""
+    with open(schema_path, encoding="utf-8") as f:
+        schema = re.sub(r"\bCREATE TABLE\b", "CREATE UNLOGGED TABLE", f.read())
+    with _connect() as conn, conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {shadow_schema} CASCADE;")
+        cursor.execute(f"CREATE SCHEMA {shadow_schema};")
+        cursor.execute(f"SET search_path = {shadow_schema};")
+        cursor.execute(schema)
+    conn.close()
+
+    for path in state_dirs.values():
+        shutil.rmtree(_suffixed(path, shadow_schema), ignore_errors=True)
+
+
+def load(orchestrator_args=()):
+    """Runs every pipe into the shadow schema with its own pipeline state"""
+    env = dict(os.environ, DATABASE_SCHEMA=shadow_schema)
+    for name, path in state_dirs.items():
+        env[name] = _suffixed(path, shadow_schema)
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join("pipes", "orchestrator.py"),
+            "--force",
+            *orchestrator_args,
+        ],
+        env=env,
+        check=True,
+    )
+
+
+def _tables_by_dependency(cursor, schema):
+    """The tables of `schema`, each after the tables its foreign keys point to"""
+    cursor.execute(
+        """
+        SELECT c.relname, ARRAY(
+            SELECT DISTINCT r.relname
+            FROM pg_constraint k JOIN pg_class r ON r.oid = k.confrelid
+            WHERE k.conrelid = c.oid AND k.contype = 'f' AND k.confrelid <> c.oid
+        )
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'r'
+        ORDER BY c.relname;
+        """,
+        (schema,),
+    )
+    references = dict(cursor.fetchall())
+    ordered = []
+
+    def visit(table):
+        if table not in ordered:
+            for referenced in references[table]:
+                visit(referenced)
+            ordered.append(table)
+
+    for table in references:
+        visit(table)
+    return ordered
+
+
+def finish_shadow():
+    """
+    Builds the search vectors, indexes and views in the shadow schema and makes
+    its tables logged, which writes them to the WAL once
+    """
+    with _connect() as conn, conn.cursor() as cursor:
+        cursor.execute(f"SET search_path = {shadow_schema};")
+        for path in progress(
+            post_load_scripts, desc="post-load scripts", unit="script"
+        ):
+            _run_script(cursor, path)
+        # A logged table can not reference an unlogged one
+        for table in _tables_by_dependency(cursor, shadow_schema):
+            cursor.execute(f"ALTER TABLE {shadow_schema}.{table} SET LOGGED;")
+    conn.close()
+
+
+def _grant_public(cursor):
+    cursor.execute("GRANT ALL ON SCHEMA public TO postgres;")
+    cursor.execute("GRANT ALL ON SCHEMA public TO public;")
+
+
+def _move_state(source, target):
+    """Moves the pipeline state of the schema `source` to `target`, None being public"""
+    for path in state_dirs.values():
+        source_path = _suffixed(path, source) if source else path
+        target_path = _suffixed(path, target) if target else path
+        shutil.rmtree(target_path, ignore_errors=True)
+        if os.path.exists(source_path):
+            os.replace(source_path, target_path)
+
+
+def swap():
+    """
+    Makes the shadow schema public in one transaction. Readers see either the
+    old or the new database, never a partial one. The old public schema is kept
+    as `previous_schema`.
+    """
+    conn = get_connection()
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {previous_schema} CASCADE;")
+        cursor.execute(f"ALTER SCHEMA public RENAME TO {previous_schema};")
+        cursor.execute(f"ALTER SCHEMA {shadow_schema} RENAME TO public;")
+        _grant_public(cursor)
+    conn.close()
+    _move_state(None, previous_schema)
+    _move_state(shadow_schema, None)
+
+
+def rollback():
+    """Swaps the previous schema and its pipeline state back in"""
+    conn = get_connection()
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f"ALTER SCHEMA public RENAME TO {swap_schema};")
+        cursor.execute(f"ALTER SCHEMA {previous_schema} RENAME TO public;")
+        cursor.execute(f"ALTER SCHEMA {swap_schema} RENAME TO {previous_schema};")
+        _grant_public(cursor)
+    conn.close()
+    _move_state(None, swap_schema)
+    _move_state(previous_schema, None)
+    _move_state(swap_schema, previous_schema)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="rebuilds the database in a shadow schema and swaps it in",
+        epilog="other arguments are passed on to orchestrator.py",
+    )
+    parser.add_argument(
+        "--no-swap", action="store_true", help="build the shadow schema only"
+    )
+    parser.add_argument(
+        "--swap-only", action="store_true", help="swap in a built shadow schema"
+    )
+    parser.add_argument(
+        "--rollback", action="store_true", help="swap the previous schema back in"
+    )
+    args, orchestrator_args = parser.parse_known_args()
+
+    if args.rollback:
+        rollback()
+    else:
+        if not args.swap_only:
+            create_shadow()
+            load(orchestrator_args)
+            finish_shadow()
+        if not args.no_swap:
+            swap()
@@ -0,0 +1,493 @@
+import abc
+import csv
+import glob
+import io
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import binary_copy
+import polars as pl
+import psycopg2
+from db import (
+    BulkLoad,
+    column_types,
+    copy_binary,
+    copy_csv,
+    create_staging,
+    get_connection,
+    merge_staging,
+    upsert_csv,
+)
+
+try:
+    from compression import zstd  # Python 3.14
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# Rows a sink holds before writing them out
+default_chunk_rows = int(os.environ.get("SINK_CHUNK_ROWS", "50000"))
+# Concurrent COPY streams of `copy_parallel`
+copy_streams = int(os.environ.get("COPY_STREAMS", "4"))
+# Bytes COPY sends to the server at a time
+copy_buffer_bytes = 1 << 20
+
+
+class Sink(abc.ABC):
+    """
+    Where a pipe writes the rows it produces. Rows are sequences in the order of
+    `columns`, or dicts keyed by them, and are buffered and written out
+    `chunk_rows` at a time, so a pipe holds at most one chunk of its output.
+
+    `after` are the sinks of the rows these rows reference. They are flushed
+    first, so a row never reaches the database before what it points to.
+    Sinks are context managers that write the rest of the rows on exit.
+    """
+
+    def __init__(self, columns, chunk_rows=default_chunk_rows, after=()):
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.after = list(after)
+        self.rows = []
+        self.written = 0
+
+    def write(self, row):
+        if isinstance(row, dict):
+            row = [row.get(column) for column in self.columns]
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        for sink in self.after:
+            sink.flush()
+        if self.rows:
+            self._write(self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    @abc.abstractmethod
+    def _write(self, rows):
+        """Writes out a chunk of rows"""
+
+    @abc.abstractmethod
+    def _close(self):
+        """Releases what the sink writes to, after the last chunk or an error"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.rows = []
+            self._close()
+
+
+class CsvSink(Sink):
+    """A CSV file with a header, written as pandas' to_csv writes it"""
+
+    def __init__(self, path, columns, chunk_rows=default_chunk_rows, after=()):
+        super().__init__(columns, chunk_rows, after)
+        self.file = self._open(path)
+        self.writer = csv.writer(self.file, lineterminator="\n")
+        self.writer.writerow(self.columns)
+
+    def _open(self, path):
+        return open(path, "w", encoding="utf-8", newline="")
+
+    def _write(self, rows):
+        self.writer.writerows(rows)
+
+    def _close(self):
+        self.file.close()
+
+
+def _require_zstd():
+    if zstd is None:
+        raise ModuleNotFoundError(
+            ".csv.zst files need the zstandard package, or Python 3.14"
+        )
+
+
+class ZstdCsvSink(CsvSink):
+    """A zstd compressed CSV file"""
+
+    def _open(self, path):
+        _require_zstd()
+        return zstd.open(path, "wt", encoding="utf-8", newline="")
+
+
+class ParquetSink(Sink):
+    """
+    A directory of Parquet files, one per chunk. The values are stored as text
+    unless a polars `schema` is given.
+    """
+
+    def __init__(
+        self, path, columns, chunk_rows=default_chunk_rows, after=(), schema=None
+    ):
+        super().__init__(columns, chunk_rows, after)
+        self.path = path
+        self.schema = schema or {column: pl.String for column in self.columns}
+        self.parts = 0
+        os.makedirs(path, exist_ok=True)
+        for part in glob.glob(os.path.join(path, "*.parquet")):
+            os.remove(part)
+
+    def _write(self, rows):
+        if all(dtype == pl.String for dtype in self.schema.values()):
+            rows = [[None if v is None else str(v) for v in row] for row in rows]
+        frame = pl.DataFrame(rows, schema=self.schema, orient="row")
+        frame.write_parquet(
+            os.path.join(self.path, f"part-{self.parts:05}.parquet"),
+            compression="zstd",
+        )
+        self.parts += 1
+
+    def _close(self):
+        if not self.parts:  # Keeps the columns of an empty output
+            pl.DataFrame(schema=self.schema).write_parquet(
+                os.path.join(self.path, "part-00000.parquet")
+            )
+
+
+class CopySink(Sink):
+    """
+    Streams the rows into `table` with a COPY FROM STDIN per chunk, skipping
+    the preprocessed files. `table_columns` are the names of the columns in the
+    table, when they differ from `columns`.
+
+    With `binary`, the chunks are sent in the binary format of COPY, encoded by
+    the types of the table columns, which spares both ends the CSV quoting and
+    parsing.
+    """
+
+    def __init__(
+        self,
+        cursor,
+        table,
+        columns,
+        chunk_rows=default_chunk_rows,
+        after=(),
+        table_columns=None,
+        binary=False,
+    ):
+        super().__init__(columns, chunk_rows, after)
+        self.cursor = cursor
+        self.table = table
+        self.table_columns = list(table_columns or columns)
+        self.binary = binary
+        self.encode = None
+
+    def _copy(self, table, rows):
+        if self.binary:
+            # The values as text, which the encoder converts by column type
+            frame = pl.DataFrame(
+                [[None if v is None else str(v) for v in row] for row in rows],
+                schema={column: pl.String for column in self.table_columns},
+                orient="row",
+            )
+            if self.encode is None:
+                self.encode = binary_copy.frame_encoder(
+                    self.table_columns, column_types(self.cursor, self.table)
+                )
+            _copy_encoded(self.cursor, table, self.table_columns, [self.encode(frame)])
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        buffer.seek(0)
+        copy_csv(self.cursor, table, self.table_columns, buffer, header=False)
+
+    def _write(self, rows):
+        self._copy(self.table, rows)
+
+    def _close(self):
+        pass  # The cursor belongs to the caller
+
+
+class UpsertSink(CopySink):
+    """
+    Like CopySink, but merges every chunk into `table` through a staging table,
+    updating the rows that already exist by `key_columns`
+    """
+
+    def __init__(
+        self,
+        cursor,
+        table,
+        columns,
+        key_columns,
+        chunk_rows=default_chunk_rows,
+        after=(),
+        table_columns=None,
+        binary=False,
+    ):
+        super().__init__(
+            cursor, table, columns, chunk_rows, after, table_columns, binary
+        )
+        self.key_columns = list(key_columns)
+        self.staging = None
+
+    def _write(self, rows):
+        if self.staging is None:
+            self.staging = create_staging(self.cursor, self.table)
+        self._copy(self.staging, rows)
+        merge_staging(self.cursor, self.table, self.table_columns, self.key_columns)
+        self.cursor.execute(f"TRUNCATE {self.staging};")
+
+    def _close(self):
+        if self.staging is not None:
+            self.cursor.execute(f"DROP TABLE {self.staging};")
+            self.staging = None
+
+
+class _Pipeline:
+    """
+    The binary COPY file of the encoded `chunks`, which are made on a thread
+    of their own while COPY sends the ones before them, so that encoding on
+    the client and parsing on the server overlap
+    """
+
+    def __init__(self, chunks, depth=2):
+        self.queue = queue.Queue(depth)
+        self.closed = threading.Event()
+        self.buffer = memoryview(binary_copy.header)
+        self.done = False
+        self.error = None  # What failed the encoding
+        self.thread = threading.Thread(target=self._produce, args=(chunks,))
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, chunks):
+        try:
+            for chunk in chunks:
+                if not self._put(memoryview(chunk)):
+                    return
+            self._put(memoryview(binary_copy.trailer))
+            self._put(None)
+        except BaseException as e:
+            self._put(e)
+
+    def read(self, size=-1):
+        while not self.buffer and not self.done:
+            item = self.queue.get()
+            if isinstance(item, BaseException):
+                self.error = item
+                raise item
+            if item is None:
+                self.done = True
+            else:
+                self.buffer = item
+        data = self.buffer if size < 0 else self.buffer[:size]
+        self.buffer = self.buffer[len(data) :]
+        return bytes(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.closed.set()
+        self.thread.join()
+
+
+def _copy_encoded(cursor, table, columns, chunks):
+    with _Pipeline(chunks) as f:
+        try:
+            copy_binary(cursor, table, columns, f, copy_buffer_bytes)
+        except psycopg2.Error:
+            # psycopg2 cancels the COPY with the message of a failed read
+            if f.error is not None:
+                raise f.error from None
+            raise
+
+
+def copy_frames(cursor, table, columns, frames, key_columns=None):
+    """
+    Copies the polars `frames`, one after the other, into the `columns` of
+    `table` in a single COPY in the binary format, merging them by
+    `key_columns` if they are given. The values are encoded by the types of
+    the table columns, from strings or typed columns. Encoding a frame
+    overlaps with sending the ones before it.
+    """
+    encode = binary_copy.frame_encoder(columns, column_types(cursor, table))
+    chunks = (encode(frame) for frame in frames)
+    if key_columns is None:
+        _copy_encoded(cursor, table, columns, chunks)
+        return
+    staging = create_staging(cursor, table)
+    _copy_encoded(cursor, staging, columns, chunks)
+    merge_staging(cursor, table, columns, key_columns)
+    cursor.execute(f"DROP TABLE {staging};")
+
+
+def frame_chunks(frame, rows=default_chunk_rows):
+    """The polars `frame` in slices of `rows` rows"""
+    return (frame.slice(offset, rows) for offset in range(0, frame.height, rows))
+
+
+def copy_parallel(table, columns, parts):
+    """
+    Copies `parts`, polars frames, into the empty `table` concurrently, each
+    straight into the table over a connection of its own in binary COPY. Returns False without
+    copying anything if the table is not empty, for the caller to load it in a
+    single transaction instead.
+
+    The connections can not share a transaction, so the bulk load of the table
+    is split in three. BulkLoad prepares the table and commits, the streams
+    commit together once every part has been copied, and a last transaction
+    checks the foreign keys and rebuilds the indexes. If any of it fails, the
+    table is emptied again and its indexes and triggers are put back.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        load = BulkLoad(cursor, [table])
+        if table not in load.loaded:
+            conn.rollback()
+            return False
+        conn.commit()
+        try:
+            _copy_streams(table, columns, parts)
+            load.configure()
+            load.finish()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            load.configure()
+            load.empty(table)
+            load.validate = False
+            load.finish()
+            conn.commit()
+            raise
+        return True
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _copy_streams(table, columns, parts):
+    """Copies every part over a connection of its own, committing all or none"""
+
+    def copy(conn, frame):
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL synchronous_commit = off;")
+            copy_frames(cursor, table, columns, frame_chunks(frame))
+
+    connections = []
+    try:
+        for _ in parts:
+            connections.append(get_connection())
+        with ThreadPoolExecutor(max(1, len(connections))) as pool:
+            copies = [
+                pool.submit(copy, conn, frame)
+                for conn, frame in zip(connections, parts, strict=True)
+            ]
+            for result in copies:
+                result.result()
+        for conn in connections:
+            conn.commit()
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+def read_rows(path):
+    """The rows of a file written by `open_sink` as a polars frame"""
+    if path.endswith(".parquet"):
+        return pl.read_parquet(os.path.join(path, "*.parquet"))
+    if path.endswith(".zst"):
+        _require_zstd()
+        with zstd.open(path, "rb") as f:
+            return pl.read_csv(f.read(), infer_schema=False)
+    return pl.read_csv(path, infer_schema=False)
+
+
+def read_frames(path, rows=default_chunk_rows, has_header=True):
+    """
+    The rows of a file written by `open_sink`, or of a CSV file without a
+    header, as polars frames of strings of about `rows` rows, read one at a time
+    """
+    if path.endswith(".parquet"):
+        for part in sorted(glob.glob(os.path.join(path, "*.parquet"))):
+            yield from frame_chunks(pl.read_parquet(part), rows)
+        return
+    if path.endswith(".zst"):
+        yield from frame_chunks(read_rows(path), rows)
+        return
+    if os.path.getsize(path) == 0:
+        return
+    if hasattr(pl, "read_csv_batched"):
+        reader = pl.read_csv_batched(
+            path, has_header=has_header, infer_schema_length=0, batch_size=rows
+        )
+        while batches := reader.next_batches(1):
+            yield from batches
+    else:  # Polars 2 reads batches through a lazy frame
+        yield from pl.scan_csv(
+            path, has_header=has_header, infer_schema=False
+        ).collect_batches(chunk_size=rows)
+
+
+def open_sink(path, columns, chunk_rows=default_chunk_rows, after=()):
+    """The file sink of `path` by its extension: .csv, .csv.zst or .parquet"""
+    if path.endswith(".parquet"):
+        return ParquetSink(path, columns, chunk_rows, after)
+    if path.endswith(".zst"):
+        return ZstdCsvSink(path, columns, chunk_rows, after)
+    return CsvSink(path, columns, chunk_rows, after)
+
+
+def _open_csv(path):
+    if path.endswith(".zst"):
+        _require_zstd()
+        return zstd.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def copy_into(cursor, path, table, columns, key_columns=None, binary=False):
+    """
+    Loads a file written by `open_sink` into the `columns` of `table`, merging
+    it by `key_columns` if they are given. With `binary`, the file is read
+    into typed columns on the client and sent in the binary format of COPY.
+    """
+    if binary:
+        copy_frames(cursor, table, columns, read_frames(path), key_columns)
+        return
+
+    if path.endswith(".parquet"):
+        if key_columns is None:
+            sink = CopySink(cursor, table, columns)
+        else:
+            sink = UpsertSink(cursor, table, columns, key_columns)
+        with sink:
+            for part in sorted(glob.glob(os.path.join(path, "*.parquet"))):
+                sink.write_many(pl.read_parquet(part).iter_rows())
+        return
+
+    with _open_csv(path) as f:
+        if key_columns is None:
+            copy_csv(cursor, table, columns, f)
+        else:
+            upsert_csv(cursor, table, columns, f, key_columns)
@@ -1,237 +1,475 @@
 import os.path
-import pandas as pd
 from lxml import etree
-from io import StringIO
-from XML_parsing_help_functions import date_parse, rollcall_id_parse, NS
+from XML_parsing_help_functions import NS
 
-from db import get_connection
+from db import delete_keys, bulk_load
+from group_attribution import GroupAttribution
+from incremental import HashManifest, add_full_argument
+from sinks import CopySink, UpsertSink, copy_into, open_sink
+from vaski_pipeline import map_documents, read_tsv, add_workers_argument
 
 
 class IncompleteDecisionTreeException(Exception):
     pass
 
 
+records_tsv_path = os.path.join("data", "raw", "vaski", "Record_fi.tsv")
 speeches_csv_path = os.path.join("data", "preprocessed", "speeches.csv")
 records_csv_path = os.path.join("data", "preprocessed", "records.csv")
 agenda_items_csv_path = os.path.join("data", "preprocessed", "agenda_items.csv")
 
-
-def preprocess_data():
-    # Load the TSV file
-    df_tsv = pd.read_csv(
-        os.path.join("data", "raw", "vaski", "Record_fi.tsv"), sep="\t"
+record_key_columns = ("record_assembly_code", "record_number", "record_year")
+
+
+def record_key(eid):
+    """
+    The (assembly_code, number, year) key of a record from its Eduskuntatunnus,
+    e.g. "PTK 12/2020 vp" -> ("EK", 12, 2020) and "HaVP 5/2020 vp" -> ("HaV", 5, 2020)
+    """
+    p_type, p_id = eid.split()[:2]
+    p_number, p_year = p_id.split("/")
+    p_type = p_type[:-1] if p_type.endswith("P") else "EK"
+    return p_type, int(p_number), int(p_year)
+
+
+def _tag(tag):
+    prefix, name = tag.split(":")
+    return f"{{{NS[prefix]}}}{name}"
+
+
+ASIAKOHTA = _tag("vsk:Asiakohta")
+MUU_ASIAKOHTA = _tag("vsk:MuuAsiakohta")
+KOHTA_ASIAKIRJA = _tag("vsk:KohtaAsiakirja")
+PUHEENVUORO = _tag("vsk:PuheenvuoroToimenpide")
+EDUSKUNTA_TUNNISTE = _tag("asi:EduskuntaTunniste")
+JULKAISU_METATIETO = _tag("jme:JulkaisuMetatieto")
+KOKOUS_POYTAKIRJA = _tag("ptk:KokousPoytakirja")
+POYTAKIRJA = _tag("ptk:Poytakirja")
+
+# Characters of the record string handed to the XML parser at a time
+read_chunk_size = 1 << 16
+
+
+class _EncodedReader:
+    """
+    File-like view of an XML string that iterparse reads as UTF-8 bytes, one
+    chunk at a time, so the record is never held twice in memory
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.position = 0
+
+    def read(self, size=read_chunk_size):
+        size = read_chunk_size if size is None or size < 0 else size
+        chunk = self.text[self.position : self.position + size]
+        self.position += len(chunk)
+        return chunk.encode("utf-8")
+
+
+def _release(element):
+    """Frees a processed element and the already processed siblings before it"""
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def _rollcall_id(kohta_asiakirja):
+    """The rollcall id if the document linked from an agenda item is one"""
+    rollcall_id = kohta_asiakirja.get(f"{{{NS['vsk1']}}}hyperlinkkiKoodi")
+    if rollcall_id is None:
+        return None
+    for type_name in kohta_asiakirja.iterchildren(_tag("met1:AsiakirjatyyppiNimi")):
+        if "Nimenhuutoraportti" in "".join(type_name.itertext()):
+            return rollcall_id
+    return None
+
+
+def parse_agenda_item(asiakohta, root_id):
+    """
+    Parses one <Asiakohta> into its agenda item row and the rows of the speeches
+    in it. The rows lack the key of the record, which the caller fills in.
+    `root_id` is the speech that the responses at the start of the agenda item
+    reply to, and the one for the next agenda item is returned.
+    """
+    asiakohta_otsikko = asiakohta.find(
+        ".//vsk:KohtaNimeke/met1:NimekeTeksti", namespaces=NS
+    ).text
+    agenda_item_parliament_id = asiakohta.get(
+        "{http://www.vn.fi/skeemat/metatietoelementit/2010/04/27}eduskuntaTunnus"
     )
+    if agenda_item_parliament_id is None:
+        agenda_item_parliament_id = asiakohta.get(
+            "{http://www.vn.fi/skeemat/metatietoelementit/2010/04/27}muuTunnus"
+        )
+    agenda_item_parliament_id = agenda_item_parliament_id.lower()
+    agenda_item = {
+        "parliament_id": agenda_item_parliament_id,
+        "title": asiakohta_otsikko,
+    }
 
-    records = []
-    agenda_items = []
     speeches_list = []
-
-    for xml_str in df_tsv["XmlData"]:
-        root = etree.parse(StringIO(xml_str)).getroot()
-
-        # Get parliament_id
-        p_id = root.xpath(".//asi:EduskuntaTunniste", namespaces=NS)
-        p_type = p_id[0].findtext("met1:AsiakirjaTyyppiTeksti", namespaces=NS)
-        if p_type is None:
-            p_type = p_id[0].findtext("met1:AsiakirjatyyppiKoodi", namespaces=NS)
-        # The general assembly code is PTK, committees have committee abbreviation + P
-        p_type = p_type[:-1] if p_type.endswith("P") else "EK"
-        p_number = p_id[0].findtext("asi1:AsiakirjaNroTeksti", namespaces=NS)
-        p_year = p_id[0].findtext("asi1:ValtiopaivavuosiTeksti", namespaces=NS)
-
-        laadinta_pvm = date_parse(root, NS)
-        ptk_element = root.find(".//ptk:KokousPoytakirja", namespaces=NS)
-        if ptk_element is None:
-            ptk_element = root.find(".//ptk:Poytakirja", namespaces=NS)
-        if ptk_element is None:  # Should never be None after that
-            raise IncompleteDecisionTreeException(
-                msg="ptk_element is None when it should not be None"
-            )
-        try:
-            kokous_pvm = ptk_element.attrib.get(f"{{{NS['vsk1']}}}kokousAloitusHetki")[
-                :10
-            ]
-        except TypeError:
-            if p_number == "107" and p_year == "2018":
-                # The data has a row that falls to this due to improper document structure.
-                kokous_pvm = laadinta_pvm
-            else:
-                raise IncompleteDecisionTreeException
-
-        # In case the meeting was a parliament plenary session, fetch the rollcall of the meeting
-        if p_type == "EK":
-            rollcall_id = rollcall_id_parse(root)
-        else:
-            rollcall_id = None
-
-        records.append(
-            {
-                "assembly_code": p_type,
-                "number": p_number,
-                "year": p_year,
-                "meeting_date": kokous_pvm,
-                "creation_date": laadinta_pvm,
-                "rollcall_id": rollcall_id,
-            }
+    for speech in asiakohta.iter(PUHEENVUORO):
+        speaker = speech.find(".//org:Henkilo", namespaces=NS)
+        speaker_id = (
+            speaker.get(f"{{{NS['met1']}}}muuTunnus") if speaker is not None else None
         )
+        speech_type = speech.get(f"{{{NS['vsk1']}}}puheenvuoroLuokitusKoodi")
+        speech_id_tag = speech.find(".//vsk:PuheenvuoroOsa", namespaces=NS)
+        speech_id = (
+            speech_id_tag.get(f"{{{NS['met1']}}}muuTunnus")
+            if speech_id_tag is not None
+            else None
+        )
+
+        start_time = speech.get(f"{{{NS['vsk1']}}}puheenvuoroAloitusHetki")
+        if start_time:
+            start_time = start_time.replace("T", " ") + " Europe/Helsinki"
 
-        # Find speeches
-        asiakohdat = root.xpath(".//vsk:Asiakohta", namespaces=NS)
-        for asiakohta in asiakohdat:
-            asiakohta_otsikko = asiakohta.find(
-                ".//vsk:KohtaNimeke/met1:NimekeTeksti", namespaces=NS
-            ).text
-            agenda_item_parliament_id = asiakohta.get(
-                "{http://www.vn.fi/skeemat/metatietoelementit/2010/04/27}eduskuntaTunnus"
+        # Build speech text
+        body_parts = []
+        # Extract regular speech paragraphs
+        paragraphs = speech.xpath(
+            ".//vsk:PuheenvuoroOsa//sis:KappaleKooste", namespaces=NS
+        )
+        for para in paragraphs:
+            text = para.text.strip() if para.text else ""
+            if text:
+                body_parts.append(text)
+
+        # Append puhemies interventions (separately)
+        interventions = speech.xpath(".//vsk:PuheenjohtajaRepliikki", namespaces=NS)
+        for intervention in interventions:
+            chair_text = intervention.findtext(
+                ".//vsk1:PuheenjohtajaTeksti", namespaces=NS
             )
-            if agenda_item_parliament_id is None:
-                agenda_item_parliament_id = asiakohta.get(
-                    "{http://www.vn.fi/skeemat/metatietoelementit/2010/04/27}muuTunnus"
-                )
-            agenda_item_parliament_id = agenda_item_parliament_id.lower()
-            agenda_items.append(
-                {
-                    "record_assembly_code": p_type,
-                    "record_year": p_year,
-                    "record_number": p_number,
-                    "parliament_id": agenda_item_parliament_id,
-                    "title": asiakohta_otsikko,
-                }
+            chair_paragraphs = intervention.findall(
+                ".//sis:KappaleKooste", namespaces=NS
             )
-            speeches = asiakohta.xpath(".//vsk:PuheenvuoroToimenpide", namespaces=NS)
-            for speech in speeches:
-                speaker = speech.find(".//org:Henkilo", namespaces=NS)
-                speaker_id = (
-                    speaker.get(f"{{{NS['met1']}}}muuTunnus")
-                    if speaker is not None
-                    else None
+            for para in chair_paragraphs:
+                ptext = para.text.strip() if para.text else ""
+                if chair_text and ptext:
+                    body_parts.remove(ptext)  # Remove duplicate chair text
+                    body_parts.append(f"**{chair_text}**: {ptext}")
+
+        full_text = "\n\n".join(body_parts)
+
+        if speaker_id:
+            if speaker_id.strip():
+                role = speech.find(".//org1:AsemaTeksti", namespaces=NS)
+                if role is not None:
+                    if "ministeri" not in role.text:
+                        continue
+
+                # There are duplicates in speech ids.
+                # Add year to the front of speech id to fix issue
+                speech_id = start_time[:4] + "/" + speech_id
+                if (
+                    speech.find(".//vsk1:TarkenneTeksti", namespaces=NS) is None
+                    or speech.find(".//vsk1:TarkenneTeksti", namespaces=NS).text
+                    != "(vastauspuheenvuoro)"
+                ):
+                    response_to = speech_id
+                    root_id = speech_id
+                else:
+                    response_to = root_id
+                speeches_list.append(
+                    {
+                        "speech_id": speech_id,
+                        "speaker_id": speaker_id,
+                        "agenda_item_parliament_id": agenda_item_parliament_id,
+                        "start_time": start_time,
+                        "speech_text": full_text,
+                        "speech_type": speech_type,
+                        "response_to": response_to,
+                    }
                 )
-                speech_type = speech.get(f"{{{NS['vsk1']}}}puheenvuoroLuokitusKoodi")
-                speech_id_tag = speech.find(".//vsk:PuheenvuoroOsa", namespaces=NS)
-                speech_id = (
-                    speech_id_tag.get(f"{{{NS['met1']}}}muuTunnus")
-                    if speech_id_tag is not None
-                    else None
-                )
-
-                start_time = speech.get(f"{{{NS['vsk1']}}}puheenvuoroAloitusHetki")
-                if start_time:
-                    start_time = start_time.replace("T", " ") + " Europe/Helsinki"
 
-                # Build speech text
-                body_parts = []
-                # Extract regular speech paragraphs
-                paragraphs = speech.xpath(
-                    ".//vsk:PuheenvuoroOsa//sis:KappaleKooste", namespaces=NS
-                )
-                for para in paragraphs:
-                    text = para.text.strip() if para.text else ""
-                    if text:
-                        body_parts.append(text)
-
-                # Append puhemies interventions (separately)
-                interventions = speech.xpath(
-                    ".//vsk:PuheenjohtajaRepliikki", namespaces=NS
-                )
-                for intervention in interventions:
-                    chair_text = intervention.findtext(
-                        ".//vsk1:PuheenjohtajaTeksti", namespaces=NS
-                    )
-                    chair_paragraphs = intervention.findall(
-                        ".//sis:KappaleKooste", namespaces=NS
-                    )
-                    for para in chair_paragraphs:
-                        ptext = para.text.strip() if para.text else ""
-                        if chair_text and ptext:
-                            body_parts.remove(ptext)  # Remove duplicate chair text
-                            body_parts.append(f"**{chair_text}**: {ptext}")
-
-                full_text = "\n\n".join(body_parts)
-
-                if speaker_id:
-                    if speaker_id.strip():
-                        role = speech.find(".//org1:AsemaTeksti", namespaces=NS)
-                        if role is not None:
-                            if "ministeri" not in role.text:
-                                continue
-
-                        # There are duplicates in speech ids.
-                        # Add year to the front of speech id to fix issue
-                        speech_id = start_time[:4] + "/" + speech_id
-                        if (
-                            speech.find(".//vsk1:TarkenneTeksti", namespaces=NS) is None
-                            or speech.find(".//vsk1:TarkenneTeksti", namespaces=NS).text
-                            != "(vastauspuheenvuoro)"
-                        ):
-                            response_to = speech_id
-                            root_id = speech_id
-                        else:
-                            response_to = root_id
-                        speeches_list.append(
-                            {
-                                "speech_id": speech_id,
-                                "speaker_id": speaker_id,
-                                "record_assembly_code": p_type,
-                                "record_number": p_number,
-                                "record_year": p_year,
-                                "agenda_item_parliament_id": agenda_item_parliament_id,
-                                "start_time": start_time,
-                                "speech_text": full_text,
-                                "speech_type": speech_type,
-                                "response_to": response_to,
-                            }
-                        )
-
-    # Convert to DataFrame
-    df_speeches = pd.DataFrame(speeches_list)
-    df_agenda_items = pd.DataFrame(agenda_items)
-    df_records = pd.DataFrame(records)
-
-    # Optional: Save to CSV
-    df_speeches.to_csv(speeches_csv_path, index=False, encoding="utf-8")
-
-    # records
-    df_records.drop_duplicates(inplace=True)
-    df_records.to_csv(records_csv_path, index=False)
-
-    # For unknown reasons, the agenda items are presented multiple times.
-    # It doesn't matter as long as the references are to the correct title
-    df_agenda_items.title = df_agenda_items.title.str.strip()
-    df_agenda_items.title = df_agenda_items.title.apply(lambda x: " ".join(x.split()))
-    df_agenda_items.title = df_agenda_items.title.str.replace("-—", "-")
-    df_agenda_items.drop_duplicates(inplace=True)
-    # Datassa on yksi rivi, jossa otsikko on eri kuin koodien antaisi ymmärtää. Pudotetaan tämä
-    df_agenda_items = df_agenda_items[
-        ~(df_agenda_items.title == "Tilapäisen puheenjohtajan valinta")
-    ]
-    df_agenda_items.to_csv(agenda_items_csv_path, index=False)
+    return agenda_item, speeches_list, root_id
 
 
-def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
+def parse_document(xml_str):
+    """
+    Parses one plenary or committee record into its record row and the rows of
+    its agenda items and speeches.
 
-    with open(records_csv_path) as f:
-        cursor.copy_expert(
-            "COPY records(assembly_code, number, year, meeting_date, creation_date, rollcall_id) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
+    The record is streamed with iterparse: every agenda item is parsed as soon
+    as it is complete and then freed, so the memory needed is bounded by the
+    largest agenda item instead of the whole sitting.
+    """
+    metadata = None
+    p_id = None
+    ptk_attrib = {}  # tag -> attributes of the first <KokousPoytakirja>/<Poytakirja>
+    rollcall_id = None
+    agenda_items = []
+    speeches_list = []
+    root_id = None
+
+    events = etree.iterparse(
+        _EncodedReader(xml_str),
+        events=("start", "end"),
+        tag=(
+            JULKAISU_METATIETO,
+            KOKOUS_POYTAKIRJA,
+            POYTAKIRJA,
+            EDUSKUNTA_TUNNISTE,
+            KOHTA_ASIAKIRJA,
+            ASIAKOHTA,
+            MUU_ASIAKOHTA,
+        ),
+        encoding="utf-8",
+    )
+    for event, element in events:
+        # The attributes of the headers are complete already at their start
+        if event == "start":
+            if element.tag == JULKAISU_METATIETO and metadata is None:
+                metadata = dict(element.attrib)
+            elif element.tag in (KOKOUS_POYTAKIRJA, POYTAKIRJA):
+                ptk_attrib.setdefault(element.tag, dict(element.attrib))
+            continue
+
+        if element.tag == EDUSKUNTA_TUNNISTE and p_id is None:
+            p_id = {
+                "type": element.findtext("met1:AsiakirjaTyyppiTeksti", namespaces=NS),
+                "type_code": element.findtext(
+                    "met1:AsiakirjatyyppiKoodi", namespaces=NS
+                ),
+                "number": element.findtext("asi1:AsiakirjaNroTeksti", namespaces=NS),
+                "year": element.findtext("asi1:ValtiopaivavuosiTeksti", namespaces=NS),
+            }
+        elif element.tag == KOHTA_ASIAKIRJA and rollcall_id is None:
+            if any(True for _ in element.iterancestors(MUU_ASIAKOHTA)):
+                rollcall_id = _rollcall_id(element)
+        elif any(True for _ in element.iterancestors(ASIAKOHTA)):
+            # Nested agenda items are parsed along with the outermost one
+            continue
+        elif element.tag == ASIAKOHTA:
+            for asiakohta in element.iter(ASIAKOHTA):
+                agenda_item, speeches, root_id = parse_agenda_item(asiakohta, root_id)
+                agenda_items.append(agenda_item)
+                speeches_list.extend(speeches)
+            _release(element)
+        elif element.tag == MUU_ASIAKOHTA:
+            _release(element)
+    del events
+
+    # Get parliament_id
+    if p_id is None:
+        raise IncompleteDecisionTreeException("The record has no EduskuntaTunniste")
+    p_type = p_id["type"]
+    if p_type is None:
+        p_type = p_id["type_code"]
+    # The general assembly code is PTK, committees have committee abbreviation + P
+    p_type = p_type[:-1] if p_type.endswith("P") else "EK"
+    p_number = p_id["number"]
+    p_year = p_id["year"]
+
+    laadinta_pvm = metadata.get(f"{{{NS['met1']}}}laadintaPvm", "").strip()
+    ptk_element = ptk_attrib.get(KOKOUS_POYTAKIRJA, ptk_attrib.get(POYTAKIRJA))
+    if ptk_element is None:  # Should never be None after that
+        raise IncompleteDecisionTreeException(
+            msg="ptk_element is None when it should not be None"
         )
-
-    with open(agenda_items_csv_path) as f:
-        cursor.copy_expert(
-            "COPY agenda_items(record_assembly_code, record_year, record_number, parliament_id, title) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
+    try:
+        kokous_pvm = ptk_element.get(f"{{{NS['vsk1']}}}kokousAloitusHetki")[:10]
+    except TypeError:
+        if p_number == "107" and p_year == "2018":
+            # The data has a row that falls to this due to improper document structure.
+            kokous_pvm = laadinta_pvm
+        else:
+            raise IncompleteDecisionTreeException
+
+    # In case the meeting was a parliament plenary session, the rollcall of the meeting
+    # is kept
+    if p_type != "EK":
+        rollcall_id = None
+
+    record = {
+        "assembly_code": p_type,
+        "number": p_number,
+        "year": p_year,
+        "meeting_date": kokous_pvm,
+        "creation_date": laadinta_pvm,
+        "rollcall_id": rollcall_id,
+    }
+
+    key = {
+        "record_assembly_code": p_type,
+        "record_number": p_number,
+        "record_year": p_year,
+    }
+    agenda_items = [{**key, **agenda_item} for agenda_item in agenda_items]
+    speeches_list = [{**key, **speech} for speech in speeches_list]
+
+    return record, agenda_items, speeches_list
+
+
+record_columns = [
+    "assembly_code",
+    "number",
+    "year",
+    "meeting_date",
+    "creation_date",
+    "rollcall_id",
+]
+agenda_item_columns = [
+    "record_assembly_code",
+    "record_year",
+    "record_number",
+    "parliament_id",
+    "title",
+]
+speech_columns = [
+    "speech_id",
+    "speaker_id",
+    "record_assembly_code",
+    "record_number",
+    "record_year",
+    "agenda_item_parliament_id",
+    "start_time",
+    "speech_text",
+    "speech_type",
+    "response_to",
+    "pg_id",
+]
+# The columns of the speeches table, in the order of speech_columns
+speech_table_columns = [
+    "id",
+    "person_id",
+    "record_assembly_code",
+    "record_number",
+    "record_year",
+    "agenda_item_parliament_id",
+    "start_time",
+    "speech",
+    "speech_type",
+    "response_to",
+    "pg_id",
+]
+
+
+def extract(changed, manifest, workers, records, agenda_items, speeches):
+    """
+    Parses the `changed` records and writes their rows into the sinks
+    `records`, `agenda_items` and `speeches` as soon as each record is parsed
+    """
+    groups = GroupAttribution.load()
+    seen_records = set()
+    seen_agenda_items = set()
+    for record, record_agenda_items, record_speeches in map_documents(
+        parse_document,
+        (xml for _, xml in read_tsv(records_tsv_path, keys=changed)),
+        workers,
+        total=sum(manifest.row_counts[eid] for eid in changed),
+    ):
+        row = tuple(record[column] for column in record_columns)
+        if row not in seen_records:
+            seen_records.add(row)
+            records.write(row)
+
+        # For unknown reasons, the agenda items are presented multiple times.
+        # It doesn't matter as long as the references are to the correct title
+        for agenda_item in record_agenda_items:
+            title = " ".join(agenda_item["title"].split()).replace("-—", "-")
+            row = tuple(agenda_item[column] for column in agenda_item_columns[:-1])
+            row += (title,)
+            # Datassa on yksi rivi, jossa otsikko on eri kuin koodien antaisi ymmärtää. Pudotetaan tämä
+            if row in seen_agenda_items or title == "Tilapäisen puheenjohtajan valinta":
+                continue
+            seen_agenda_items.add(row)
+            agenda_items.write(row)
+
+        groups.attribute(
+            record_speeches,
+            [speech["start_time"] for speech in record_speeches],
+            "speaker_id",
         )
+        speeches.write_many(record_speeches)
+
+
+def preprocess_data(workers=1, full=False):
+    # Only the new and changed records are parsed
+    manifest = HashManifest("speeches", full)
+    changed = manifest.select_changed(read_tsv(records_tsv_path))
+
+    with (
+        open_sink(records_csv_path, record_columns) as records,
+        open_sink(agenda_items_csv_path, agenda_item_columns) as agenda_items,
+        open_sink(speeches_csv_path, speech_columns) as speeches,
+    ):
+        extract(changed, manifest, workers, records, agenda_items, speeches)
+    manifest.save_pending()
 
-    with open(speeches_csv_path) as f:
-        cursor.copy_expert(
-            "COPY speeches(id, person_id, record_assembly_code, record_number, record_year, agenda_item_parliament_id, start_time, speech, speech_type, response_to) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
+
+def delete_records(cursor, changed, deleted):
+    """Deletes what is replaced of the `changed` and `deleted` records"""
+    record_keys = [record_key(eid) for eid in changed + deleted]
+    deleted_record_keys = [record_key(eid) for eid in deleted]
+
+    # Agenda items and speeches of changed records are replaced as a whole
+    delete_keys(cursor, "speeches", record_key_columns, record_keys)
+    delete_keys(cursor, "agenda_items", record_key_columns, record_keys)
+    delete_keys(cursor, "absences", record_key_columns, deleted_record_keys)
+    delete_keys(cursor, "records", record_columns[:3], deleted_record_keys)
+
+
+def import_data():
+    manifest = HashManifest("speeches")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed records waiting to be imported")
+        return
+    changed, deleted = pending
+
+    with bulk_load("records", "agenda_items", "speeches") as cursor:
+        delete_records(cursor, changed, deleted)
+        copy_into(
+            cursor, records_csv_path, "records", record_columns, record_columns[:3]
+        )
+        copy_into(cursor, agenda_items_csv_path, "agenda_items", agenda_item_columns)
+        copy_into(
+            cursor, speeches_csv_path, "speeches", speech_table_columns, binary=True
         )
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+    manifest.commit()
+
+
+def load_data(workers=1, full=False):
+    """
+    Parses the new and changed records and streams their rows straight into
+    the database in one transaction, without the preprocessed CSV files
+    """
+    manifest = HashManifest("speeches", full)
+    changed = manifest.select_changed(read_tsv(records_tsv_path))
+
+    with bulk_load("records", "agenda_items", "speeches") as cursor:
+        delete_records(cursor, *manifest.delta())
+        with (
+            UpsertSink(
+                cursor, "records", record_columns, record_columns[:3], binary=True
+            ) as records,
+            CopySink(
+                cursor,
+                "agenda_items",
+                agenda_item_columns,
+                after=[records],
+                binary=True,
+            ) as agenda_items,
+            CopySink(
+                cursor,
+                "speeches",
+                speech_columns,
+                after=[agenda_items],
+                table_columns=speech_table_columns,
+                binary=True,
+            ) as speeches,
+        ):
+            extract(changed, manifest, workers, records, agenda_items, speeches)
+
+    manifest.save_pending()
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -244,11 +482,21 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", help="import preprocessed data", action="store_true"
     )
+    parser.add_argument(
+        "--direct",
+        help="stream the rows straight into the database without the CSV files",
+        action="store_true",
+    )
+    add_workers_argument(parser)
+    add_full_argument(parser)
     args = parser.parse_args()
-    if args.preprocess_data:
-        preprocess_data()
-    if args.import_data:
-        import_data()
-    if not args.preprocess_data and not args.import_data:
-        preprocess_data()
-        import_data()
+    if args.direct:
+        load_data(args.workers, args.full)
+    else:
+        if args.preprocess_data:
+            preprocess_data(args.workers, args.full)
+        if args.import_data:
+            import_data()
+        if not args.preprocess_data and not args.import_data:
+            preprocess_data(args.workers, args.full)
+            import_data()
@@ -1,7 +1,7 @@
 import os
 import polars as pl
 
-from db import get_connection
+from db import upsert_csv, bulk_load
 
 json_path = os.path.join("data", "raw", "finto_topics.json")
 csv_path = "data/preprocessed/topics.csv"
@@ -14,18 +14,8 @@ def preprocess_data():
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    with open(csv_path) as f:
-        cursor.copy_expert(
-            "COPY topics(topic_id, term) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with bulk_load("topics") as cursor, open(csv_path) as f:
+        upsert_csv(cursor, "topics", ["topic_id", "term"], f, ["topic_id"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+import json
+import mmap
+import os
+import re
+import sys
+
+# Byte offsets of the documents of each VASKI TSV, rebuilt when the TSV changes
+index_dir = os.path.join("data", "raw", "vaski", ".index")
+
+# A TSV field as polars writes it: quoted with doubled quotes inside, or bare
+_field = re.compile(rb'"(?:[^"]+|"")*"|[^\t\r\n]*')
+
+
+def _unquote(field):
+    if field[:1] == b'"':
+        return field[1:-1].replace(b'""', b'"')
+    return field
+
+
+def _rows(data):
+    """Yields the `(start, end)` spans of the fields of every row of a TSV"""
+    position, size = 0, len(data)
+    while position < size:
+        fields = []
+        while True:
+            match = _field.match(data, position)
+            fields.append(match.span())
+            position = match.end()
+            if data[position : position + 1] != b"\t":
+                break
+            position += 1
+        # Skips the line break, \r\n as well
+        if data[position : position + 1] == b"\r":
+            position += 1
+        position += 1
+        yield fields
+
+
+class VaskiIndex:
+    """
+    Random access to the documents of one VASKI TSV by their Eduskuntatunnus.
+
+    The byte offsets of every XmlData field are indexed once per version of the
+    file and stored in `data/raw/vaski/.index`. Documents are then served from
+    a memory map of the TSV, so looking one up reads only that document.
+    Indexes are picklable, and reopen the file in the worker processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(
+            index_dir, f"{os.path.splitext(os.path.basename(path))[0]}.json"
+        )
+        stat = os.stat(path)
+        self.version = [stat.st_size, stat.st_mtime]
+        self.offsets = self._load() or self._build()
+        self._open()
+
+    def _open(self):
+        if not self.version[0]:
+            self.data = b""  # An empty file can not be mapped
+            return
+        with open(self.path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key != "data"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return None
+        with open(self.index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        return index["offsets"] if index["version"] == self.version else None
+
+    def _build(self):
+        offsets = {}  # Eduskuntatunnus -> [[start, end], ...] of its XmlData fields
+        if not self.version[0]:
+            return offsets
+        with open(self.path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            rows = _rows(data)
+            header = [_unquote(data[s:e]).decode("utf-8") for s, e in next(rows)]
+            key_column = header.index("Eduskuntatunnus")
+            xml_column = header.index("XmlData")
+            for fields in rows:
+                if len(fields) < len(header):
+                    continue  # Trailing empty line
+                start, end = fields[key_column]
+                key = _unquote(data[start:end]).decode("utf-8")
+                offsets.setdefault(key, []).append(list(fields[xml_column]))
+            data.close()
+
+        os.makedirs(index_dir, exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "offsets": offsets}, f)
+        os.replace(tmp_path, self.index_path)
+        return offsets
+
+    def __contains__(self, eid):
+        return eid in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def keys(self):
+        return self.offsets.keys()
+
+    def count(self, eid):
+        """Number of documents with the Eduskuntatunnus `eid`"""
+        return len(self.offsets.get(eid, ()))
+
+    def raw(self, eid):
+        """
+        The XmlData bytes of the documents of `eid`. Unquoted fields are views
+        into the memory map, quoted ones are unescaped copies.
+        """
+        view = memoryview(self.data)
+        documents = []
+        for start, end in self.offsets.get(eid, ()):
+            if self.data[start : start + 1] == b'"':
+                documents.append(_unquote(self.data[start:end]))
+            else:
+                documents.append(view[start:end])
+        return documents
+
+    def get(self, eid):
+        """The XmlData of the documents of `eid` as strings, in file order"""
+        return [bytes(document).decode("utf-8") for document in self.raw(eid)]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="prints the documents of a VASKI TSV by their Eduskuntatunnus"
+    )
+    parser.add_argument("tsv", help="VASKI TSV file, e.g. data/raw/vaski/Record_fi.tsv")
+    parser.add_argument("eid", nargs="+", help="Eduskuntatunnus, e.g. 'HE 1/2024 vp'")
+    args = parser.parse_args()
+
+    index = VaskiIndex(args.tsv)
+    for eid in args.eid:
+        documents = index.get(eid)
+        if not documents:
+            print(f"{eid}: not found", file=sys.stderr)
+        for document in documents:
+            print(document)
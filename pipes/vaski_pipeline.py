@@ -0,0 +1,118 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+from instrumentation import progress
+from raw_parquet import iter_rows
+
+# Ceiling for the XML of one batch of documents, which is what a worker process
+# gets at a time. At most two batches per worker are in flight.
+batch_bytes = int(os.environ.get("VASKI_BATCH_MB", "64")) * 1024 * 1024
+
+
+def read_tsv(path, columns=("Eduskuntatunnus", "XmlData"), keys=None):
+    """
+    Streams the `columns` of a VASKI TSV file row by row as tuples, so only the
+    documents being worked on are in memory instead of the whole file. With
+    `keys`, only the rows whose Eduskuntatunnus is in `keys` are yielded.
+
+    The rows are read from the Parquet copy of the file, which is written on the
+    first read.
+    """
+    predicate = None
+    if keys is not None:
+        predicate = pl.col("Eduskuntatunnus").is_in(list(keys))
+    yield from iter_rows(path, list(columns), predicate)
+
+
+def _size(document):
+    if isinstance(document, str):
+        return len(document)
+    return sum(len(part) for part in document if isinstance(part, str))
+
+
+def batches(documents, chunksize=50, max_bytes=None):
+    """
+    Shards an iterable of documents into lists of at most `chunksize` documents
+    holding at most `max_bytes` (`batch_bytes` by default) of text. A document
+    larger than that makes a batch of its own.
+    """
+    max_bytes = batch_bytes if max_bytes is None else max_bytes
+    chunk, size = [], 0
+    for document in documents:
+        document_size = _size(document)
+        if chunk and (len(chunk) >= chunksize or size + document_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(document)
+        size += document_size
+    if chunk:
+        yield chunk
+
+
+def _parse_chunk(parse, chunk):
+    return [parse(document) for document in chunk]
+
+
+def map_documents(
+    parse,
+    documents,
+    workers=1,
+    chunksize=50,
+    initializer=None,
+    initargs=(),
+    total=None,
+):
+    """
+    Runs the per-document extraction function `parse` on every document and
+    yields the results in the same order as the documents came in.
+
+    With more than one worker the document stream is sharded into `batches`
+    that are parsed in a process pool. `parse` and `initializer` must then be
+    module level functions so that they can be sent to the worker processes.
+    `initializer(*initargs)` is called once in every process doing the parsing,
+    which is where per-process state such as database connections or lookup
+    tables should be set up.
+
+    At most two batches per worker are in flight at any time, so the documents
+    are consumed lazily and results are merged back as soon as they are ready.
+    Memory is then bounded by the batch size rather than the number of
+    documents, when `documents` is a stream such as `read_tsv`. `total` is the
+    number of documents for the progress bar, if known in advance.
+    """
+    if total is None and hasattr(documents, "__len__"):
+        total = len(documents)
+    yield from progress(
+        _map_documents(parse, documents, workers, chunksize, initializer, initargs),
+        total,
+    )
+
+
+def _map_documents(parse, documents, workers, chunksize, initializer, initargs):
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(parse, documents)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as pool:
+        pending = deque()
+        for chunk in batches(documents, chunksize):
+            pending.append(pool.submit(_parse_chunk, parse, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def add_workers_argument(parser):
+    """Adds the `--workers N` flag shared by all VASKI document pipes"""
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes parsing the documents in parallel",
+    )
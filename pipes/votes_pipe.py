@@ -1,43 +1,137 @@
 import os.path
-import pandas as pd
+import polars as pl
 
-from db import get_connection
+from db import delete_keys, bulk_load
+from group_attribution import GroupAttribution
+from incremental import HashManifest, add_full_argument
+from raw_parquet import scan
+from sinks import (
+    copy_frames,
+    copy_parallel,
+    copy_streams,
+    frame_chunks,
+    open_sink,
+    read_rows,
+)
 
 csv_path = "data/preprocessed/votes.csv"
+ballots_tsv_path = os.path.join("data", "raw", "SaliDBAanestys.tsv")
 
 vote_dict = {"Jaa": "yes", "Ei": "no", "Poissa": "absent", "Tyhjää": "abstain"}
 
 
-def preprocess_data():
-    with open(os.path.join("data", "raw", "SaliDBAanestysEdustaja.tsv")) as f:
-        vote_data = pd.read_csv(f, sep="\t")[
-            ["EdustajaHenkiloNumero", "AanestysId", "EdustajaAanestys"]
-        ]
+columns = ["person_id", "ballot_id", "vote", "pg_id"]
 
-    vote_data = vote_data[
-        vote_data["EdustajaAanestys"].str.strip().isin(vote_dict.keys())
+
+def changed_votes(manifest):
+    """The votes of the ballots that are new or have changed since the last import"""
+    # Only the three columns needed are read from the millions of vote rows
+    votes = (
+        scan(os.path.join("data", "raw", "SaliDBAanestysEdustaja.tsv"))
+        .select(
+            pl.col("EdustajaHenkiloNumero").alias("person_id"),
+            pl.col("AanestysId").alias("ballot_id"),
+            pl.col("EdustajaAanestys").str.strip_chars().alias("vote"),
+        )
+        .filter(pl.col("vote").is_in(list(vote_dict)))
+        .with_columns(pl.col("vote").replace_strict(vote_dict))
+    )
+
+    # The votes are hashed per ballot within the scan, and only the votes of
+    # the changed ballots are collected. The row hashes are summed, so the
+    # order of the rows does not matter.
+    ballot_hashes = (
+        votes.group_by("ballot_id")
+        .agg(pl.struct("person_id", "vote").hash().sum().alias("digest"))
+        .collect()
+    )
+    changed_ballots = [
+        ballot_id
+        for ballot_id, digest in ballot_hashes.iter_rows()
+        if manifest.changed(ballot_id, str(digest))
     ]
-    vote_data["EdustajaAanestys"] = (
-        vote_data["EdustajaAanestys"].str.strip().apply(lambda x: vote_dict[x])
+    return votes.filter(pl.col("ballot_id").is_in(changed_ballots)).collect()
+
+
+def attribute_groups(votes):
+    """Adds the parliamentary group each voter belonged to on the day of the ballot"""
+    # Both language versions of a ballot share its start time
+    days = (
+        scan(ballots_tsv_path)
+        .select(
+            pl.col("AanestysId").alias("ballot_id"),
+            pl.col("AanestysAlkuaika").alias("day"),
+        )
+        .unique("ballot_id")
+        .collect()
+    )
+    return (
+        GroupAttribution.load()
+        .attribute_frame(votes.join(days, on="ballot_id", how="left"), day_column="day")
+        .select(columns)
+    )
+
+
+def preprocess_data(full=False):
+    # Only the votes of new and changed ballots are written
+    manifest = HashManifest("votes", full)
+    votes = attribute_groups(changed_votes(manifest))
+    with open_sink(csv_path, columns) as sink:
+        sink.write_many(votes.iter_rows())
+    manifest.save_pending()
+
+
+def delete_ballots(cursor, changed, deleted):
+    # Votes of changed ballots are replaced as a whole
+    delete_keys(
+        cursor,
+        "votes",
+        "ballot_id",
+        [int(ballot_id) for ballot_id in changed + deleted],
     )
 
-    vote_data.columns = ["person_id", "ballot_id", "vote"]
-    vote_data.to_csv(csv_path, index=False)
+
+def copy_votes(votes, changed, deleted):
+    """
+    Replaces the votes of the changed and deleted ballots with `votes`. An
+    empty table is filled in `copy_streams` concurrent streams, which the
+    single COPY of millions of rows can not keep the server busy with.
+    """
+    streams = max(1, min(copy_streams, votes.height))
+    size = -(-votes.height // streams)
+    parts = [votes.slice(i * size, size) for i in range(streams)]
+    if copy_parallel("votes", columns, parts):
+        return
+
+    # The ballots are deleted and copied in one transaction, and a failed copy
+    # leaves them pending, so the next import retries them
+    with bulk_load("votes") as cursor:
+        delete_ballots(cursor, changed, deleted)
+        copy_frames(cursor, "votes", columns, frame_chunks(votes))
 
 
 def import_data():
-    conn = get_connection()
-    cursor = conn.cursor()
-    with open(csv_path) as f:
-        cursor.execute("ALTER TABLE votes DISABLE TRIGGER ALL;")
-        cursor.copy_expert(
-            "COPY votes(person_id, ballot_id, vote) FROM stdin DELIMITERS ',' CSV HEADER QUOTE '\"';",
-            f,
-        )
-        cursor.execute("ALTER TABLE votes ENABLE TRIGGER ALL;")
-    conn.commit()
-    cursor.close()
-    conn.close()
+    manifest = HashManifest("votes")
+    pending = manifest.pending()
+    if pending is None:
+        print("No preprocessed votes waiting to be imported")
+        return
+    changed, deleted = pending
+    copy_votes(read_rows(csv_path), changed, deleted)
+    manifest.commit()
+
+
+def load_data(full=False):
+    """
+    Streams the votes of the new and changed ballots straight into the
+    database, without the preprocessed CSV file
+    """
+    manifest = HashManifest("votes", full)
+    votes = attribute_groups(changed_votes(manifest))
+
+    manifest.save_pending()
+    copy_votes(votes, *manifest.delta())
+    manifest.commit()
 
 
 if __name__ == "__main__":
@@ -50,11 +144,20 @@ if __name__ == "__main__":
     parser.add_argument(
         "--import-data", help="import preprocessed data", action="store_true"
     )
+    parser.add_argument(
+        "--direct",
+        help="stream the votes straight into the database without the CSV file",
+        action="store_true",
+    )
+    add_full_argument(parser)
     args = parser.parse_args()
-    if args.preprocess_data:
-        preprocess_data()
-    if args.import_data:
-        import_data()
-    if not args.preprocess_data and not args.import_data:
-        preprocess_data()
-        import_data()
+    if args.direct:
+        load_data(args.full)
+    else:
+        if args.preprocess_data:
+            preprocess_data(args.full)
+        if args.import_data:
+            import_data()
+        if not args.preprocess_data and not args.import_data:
+            preprocess_data(args.full)
+            import_data()
@@ -59,21 +59,54 @@ EXCEPTION
     WHEN duplicate_object THEN NULL;
 END $$;
 
+-- Parliamentary groups (eduskuntaryhmät)
+CREATE TABLE IF NOT EXISTS parliamentary_groups (
+    id VARCHAR(100) PRIMARY KEY,
+    name VARCHAR(100)
+);
+
 -- Votes (äänet)
 -- Junction table between person and ballot to illustrate a single cast vote.
 CREATE TABLE IF NOT EXISTS votes (
     ballot_id INT REFERENCES ballots(id),
     person_id INT REFERENCES persons(id),
     vote vote,
+    pg_id VARCHAR(100) REFERENCES parliamentary_groups(id), -- group of the person on the day of the ballot
     PRIMARY KEY(ballot_id, person_id)
 );
 
--- Parliamentary groups (eduskuntaryhmät)
-CREATE TABLE IF NOT EXISTS parliamentary_groups (
-    id VARCHAR(100) PRIMARY KEY,
-    name VARCHAR(100)
+-- For databases created before the column
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS pg_id VARCHAR(100) REFERENCES parliamentary_groups(id);
+
+-- Group level vote counts
+CREATE INDEX IF NOT EXISTS votes_pg_id_idx ON votes(pg_id, ballot_id, vote);
+
+-- Ballot results (äänestysten tulokset)
+-- Vote totals of every ballot, counted from votes by the pipeline
+CREATE TABLE IF NOT EXISTS ballot_results (
+    ballot_id INT PRIMARY KEY REFERENCES ballots(id),
+    yes INT NOT NULL,
+    no INT NOT NULL,
+    abstain INT NOT NULL,
+    absent INT NOT NULL,
+    outcome vote    -- the more popular of yes and no, NULL on a tie
 );
 
+-- Ballot group results (eduskuntaryhmien äänet)
+-- Vote counts of every parliamentary group in every ballot
+CREATE TABLE IF NOT EXISTS ballot_group_results (
+    ballot_id INT REFERENCES ballots(id),
+    pg_id VARCHAR(100) REFERENCES parliamentary_groups(id),
+    yes INT NOT NULL,
+    no INT NOT NULL,
+    abstain INT NOT NULL,
+    absent INT NOT NULL,
+    mode_vote vote NOT NULL,    -- the most popular vote of the group
+    PRIMARY KEY(ballot_id, pg_id)
+);
+
+CREATE INDEX IF NOT EXISTS ballot_group_results_pg_id_idx ON ballot_group_results(pg_id, ballot_id);
+
 -- Mp parliamentary group memberships
 CREATE TABLE IF NOT EXISTS mp_parliamentary_group_memberships (
     pg_id VARCHAR(100) REFERENCES parliamentary_groups(id),
@@ -83,6 +116,23 @@ CREATE TABLE IF NOT EXISTS mp_parliamentary_group_memberships (
     PRIMARY KEY(pg_id, person_id, start_date)
 );
 
+-- The memberships of a person by start date, for looking up their group on a day
+CREATE INDEX IF NOT EXISTS mp_parliamentary_group_memberships_person_id_idx ON mp_parliamentary_group_memberships(person_id, start_date);
+
+-- The group of a person on a day: the membership that started last by then, if
+-- it had not ended. Every pg_id of votes, speeches and signatures comes from here.
+-- It returns a set, a single row at most, so that postgres inlines it into a
+-- LATERAL join instead of calling it for every row.
+CREATE OR REPLACE FUNCTION group_on_day(person INT, day DATE)
+RETURNS SETOF VARCHAR(100)
+LANGUAGE sql STABLE AS $$
+    SELECT CASE WHEN end_date IS NULL OR day <= end_date THEN pg_id END
+    FROM mp_parliamentary_group_memberships
+    WHERE person_id = person AND start_date <= day
+    ORDER BY start_date DESC
+    LIMIT 1;
+$$;
+
 -- Assemblies (kokoonpano)
 -- Different kinds of assemblies that gather within the parliament.
 -- Includes committees (valiokunta) and other groups such as 
@@ -162,9 +212,13 @@ CREATE TABLE IF NOT EXISTS speeches (
     start_time TIMESTAMP WITH TIME ZONE NOT NULL,
     speech TEXT NOT NULL,
     speech_type CHAR(1) NOT NULL,
-    response_to VARCHAR(15) REFERENCES speeches(id)
+    response_to VARCHAR(15) REFERENCES speeches(id),
+    pg_id VARCHAR(100) REFERENCES parliamentary_groups(id) -- group of the speaker at the time of the speech
 );
 
+-- For databases created before the column
+ALTER TABLE speeches ADD COLUMN IF NOT EXISTS pg_id VARCHAR(100) REFERENCES parliamentary_groups(id);
+
 -- data type for different types of proposals
 DO $$ BEGIN  
     CREATE TYPE proposal_type AS ENUM ('government', 'citizen', 'mp_law', 'mp_petition', 'mp_debate');
@@ -196,9 +250,13 @@ CREATE TABLE IF NOT EXISTS proposal_signatures (
     proposal_id VARCHAR(20) REFERENCES proposals(id),
     person_id INT REFERENCES persons(id),
     first BOOLEAN,      -- First signature denotes the creator of the proposal. Government proposals have no first signer.
+    pg_id VARCHAR(100) REFERENCES parliamentary_groups(id), -- group of the signer on the day of the proposal
     PRIMARY KEY(proposal_id, person_id)
 );
 
+-- For databases created before the column
+ALTER TABLE proposal_signatures ADD COLUMN IF NOT EXISTS pg_id VARCHAR(100) REFERENCES parliamentary_groups(id);
+
 -- Topics (aiheet)
 -- Topic terms, that Vaski data uses to convey topics relevant to a proposal, report etc.
 CREATE TABLE IF NOT EXISTS topics (
@@ -229,15 +287,21 @@ CREATE TABLE IF NOT EXISTS committee_budget_reports (
 CREATE TABLE IF NOT EXISTS committee_report_signatures (
     committee_report_id VARCHAR(20) REFERENCES committee_reports(id),
     person_id INT REFERENCES persons(id),
+    pg_id VARCHAR(100) REFERENCES parliamentary_groups(id), -- group of the signer on the day of the report
     PRIMARY KEY(committee_report_id, person_id)
 );
 
+-- For databases created before the column
+ALTER TABLE committee_report_signatures ADD COLUMN IF NOT EXISTS pg_id VARCHAR(100) REFERENCES parliamentary_groups(id);
+
 -- Objections (vastalauseet)
 CREATE TABLE IF NOT EXISTS objections (
     id SERIAL PRIMARY KEY,
     committee_report_id VARCHAR(20) REFERENCES committee_reports(id),
+    objection_index INT NOT NULL, -- 1-based order of the objection in its report
     reasoning TEXT,
-    motion TEXT
+    motion TEXT,
+    UNIQUE(committee_report_id, objection_index)
 );
 
 -- Objection signatures (vastalauseiden allekirjoitusket)
@@ -359,3 +423,81 @@ CREATE TABLE IF NOT EXISTS promises (
     election_year INT NOT NULL
 );
 
+-- Attributes the rows of the persons `person_ids`, or of everyone if NULL, in
+-- every table with a pg_id to their group on the day of the row. The group is
+-- looked up once per person and day, and only the rows whose group changes are
+-- updated.
+CREATE OR REPLACE FUNCTION reattribute_groups(person_ids INT[])
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE votes SET pg_id = days.pg_id
+    FROM ballots, (
+        SELECT person_id, day, g.pg_id
+        FROM (
+            SELECT DISTINCT v.person_id, (b.start_time AT TIME ZONE 'Europe/Helsinki')::date AS day
+            FROM votes v JOIN ballots b ON b.id = v.ballot_id
+            WHERE person_ids IS NULL OR v.person_id = ANY(person_ids)
+        ) distinct_days
+        LEFT JOIN LATERAL group_on_day(person_id, day) AS g(pg_id) ON true
+    ) days
+    WHERE ballots.id = votes.ballot_id
+    AND votes.person_id = days.person_id
+    AND (ballots.start_time AT TIME ZONE 'Europe/Helsinki')::date = days.day
+    AND votes.pg_id IS DISTINCT FROM days.pg_id;
+
+    UPDATE speeches SET pg_id = days.pg_id
+    FROM (
+        SELECT person_id, day, g.pg_id
+        FROM (
+            SELECT DISTINCT person_id, (start_time AT TIME ZONE 'Europe/Helsinki')::date AS day
+            FROM speeches
+            WHERE person_ids IS NULL OR person_id = ANY(person_ids)
+        ) distinct_days
+        LEFT JOIN LATERAL group_on_day(person_id, day) AS g(pg_id) ON true
+    ) days
+    WHERE speeches.person_id = days.person_id
+    AND (speeches.start_time AT TIME ZONE 'Europe/Helsinki')::date = days.day
+    AND speeches.pg_id IS DISTINCT FROM days.pg_id;
+
+    UPDATE proposal_signatures SET pg_id = days.pg_id
+    FROM proposals, (
+        SELECT person_id, day, g.pg_id
+        FROM (
+            SELECT DISTINCT s.person_id, p.date AS day
+            FROM proposal_signatures s JOIN proposals p ON p.id = s.proposal_id
+            WHERE person_ids IS NULL OR s.person_id = ANY(person_ids)
+        ) distinct_days
+        LEFT JOIN LATERAL group_on_day(person_id, day) AS g(pg_id) ON true
+    ) days
+    WHERE proposals.id = proposal_signatures.proposal_id
+    AND proposal_signatures.person_id = days.person_id
+    AND proposals.date = days.day
+    AND proposal_signatures.pg_id IS DISTINCT FROM days.pg_id;
+
+    UPDATE committee_report_signatures SET pg_id = days.pg_id
+    FROM committee_reports, (
+        SELECT person_id, day, g.pg_id
+        FROM (
+            SELECT DISTINCT s.person_id, r.date AS day
+            FROM committee_report_signatures s
+            JOIN committee_reports r ON r.id = s.committee_report_id
+            WHERE person_ids IS NULL OR s.person_id = ANY(person_ids)
+        ) distinct_days
+        LEFT JOIN LATERAL group_on_day(person_id, day) AS g(pg_id) ON true
+    ) days
+    WHERE committee_reports.id = committee_report_signatures.committee_report_id
+    AND committee_report_signatures.person_id = days.person_id
+    AND committee_reports.date = days.day
+    AND committee_report_signatures.pg_id IS DISTINCT FROM days.pg_id;
+END $$;
+
+-- Databases that got the pg_id columns above have rows from before them. They
+-- are attributed once, while none of the votes has a group.
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM mp_parliamentary_group_memberships)
+    AND EXISTS (SELECT 1 FROM votes)
+    AND NOT EXISTS (SELECT 1 FROM votes WHERE pg_id IS NOT NULL) THEN
+        PERFORM reattribute_groups(NULL);
+    END IF;
+END $$;
@@ -1,36 +1,30 @@
 -- Vote counts by pg and ballot
+-- Read from the counts the pipeline keeps in ballot_group_results
 CREATE VIEW pg_vote_count_view AS
-WITH vote_counts AS (
-    SELECT
-        mp_parliamentary_group_memberships.pg_id AS pg_id,
-        votes.ballot_id AS ballot_id,
-        votes.vote AS vote,
-        COUNT(*) AS count
-    FROM
-        mp_parliamentary_group_memberships
-    INNER JOIN votes 
-        ON mp_parliamentary_group_memberships.person_id = votes.person_id
-    GROUP BY
-        mp_parliamentary_group_memberships.pg_id, votes.ballot_id, votes.vote
-)
 SELECT
-    pg_id,
-    ballot_id,
-    vote,
-    count
-FROM vote_counts
+    results.pg_id,
+    results.ballot_id,
+    counts.vote,
+    counts.count
+FROM ballot_group_results AS results
+CROSS JOIN LATERAL (VALUES
+    ('yes'::vote, results.yes::BIGINT),
+    ('no'::vote, results.no::BIGINT),
+    ('abstain'::vote, results.abstain::BIGINT),
+    ('absent'::vote, results.absent::BIGINT)
+) AS counts(vote, count)
+WHERE counts.count > 0
 ORDER BY pg_id, ballot_id, count DESC;
 
 
 -- Most popular vote by pg and ballot
 CREATE VIEW pg_mode_vote_view AS
-SELECT DISTINCT ON (pg_id, ballot_id) -- Takes first unique pair of each combination
+SELECT
     pg_id,
     ballot_id,
-    vote AS mode_vote,
-    count
-FROM pg_vote_count_view
-ORDER BY pg_id, ballot_id, count DESC;
+    mode_vote,
+    GREATEST(yes, no, abstain, absent)::BIGINT AS count
+FROM ballot_group_results;
 
 
 --Contra vote score by mp
@@ -38,16 +32,12 @@ CREATE MATERIALIZED VIEW contra_vote_scores_view AS
 WITH pg_mode_and_person_vote AS (
     SELECT 
         pg_modes.mode_vote,
-        pg_modes.pg_id,
-        pg_modes.ballot_id,
         votes.vote,
-        mp_parliamentary_group_memberships.person_id
-    FROM ((pg_mode_vote_view AS pg_modes
-    INNER JOIN mp_parliamentary_group_memberships 
-        ON mp_parliamentary_group_memberships.pg_id=pg_modes.pg_id)    -- Join pg_memberships and mode_vote in order to 
-    INNER JOIN votes                                                -- Join individual votes
+        votes.person_id
+    FROM pg_mode_vote_view AS pg_modes
+    INNER JOIN votes                                                -- Votes of the group the person belonged to at the ballot
         ON pg_modes.ballot_id=votes.ballot_id 
-        AND votes.person_id = mp_parliamentary_group_memberships.person_id) 
+        AND pg_modes.pg_id=votes.pg_id
 )
 SELECT 
     person_id, 
@@ -0,0 +1,60 @@
+import os
+import uuid
+
+import psycopg2
+import pytest
+from db import get_connection
+from orchestrator import schema_path
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """
+    A schema of its own with the tables of the pipes, which every connection of
+    the test uses. Skips the test when no database can be reached.
+    """
+    try:
+        conn = get_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no database: {e}")
+    conn.autocommit = True
+    # The schema has non-ASCII comments, which a SQL_ASCII server takes as is
+    conn.set_client_encoding("UTF8")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with open(schema_path, encoding="utf-8") as f, conn.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {schema};")
+        cursor.execute(f"SET search_path = {schema};")
+        cursor.execute(f.read())
+    monkeypatch.setenv("DATABASE_SCHEMA", schema)
+    try:
+        yield schema
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE;")
+        conn.close()
+
+
+@pytest.fixture
+def query(database):
+    """Runs a query in the test schema and returns its rows"""
+
+    def run(sql, args=None):
+        conn = get_connection()
+        try:
+            with conn, conn.cursor() as cursor:
+                cursor.execute(sql, args)
+                return cursor.fetchall() if cursor.description else None
+        finally:
+            conn.close()
+
+    return run
+
+
+@pytest.fixture
+def hashes_dir(tmp_path, monkeypatch):
+    """Keeps the hash manifests of the test in a temporary directory"""
+    import incremental
+
+    path = os.path.join(tmp_path, "hashes")
+    monkeypatch.setattr(incremental, "hashes_dir", path)
+    return path
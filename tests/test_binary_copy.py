@@ -0,0 +1,192 @@
+import struct
+from datetime import UTC, date, datetime, timedelta
+
+import binary_copy
+import polars as pl
+import pytest
+
+types = {
+    "id": ("int4", False),
+    "big": ("int8", False),
+    "small": ("int2", False),
+    "flag": ("bool", False),
+    "name": ("varchar", False),
+    "vote": ("vote", True),
+    "day": ("date", False),
+    "at": ("timestamptz", False),
+}
+columns = list(types)
+
+
+def decode(data, row_columns=None):
+    """Reads the rows of the binary COPY format back, as postgres would"""
+    data = bytes(data)
+    row_columns = row_columns or columns
+    rows = []
+    offset = 0
+    while offset < len(data):
+        (count,) = struct.unpack_from("!h", data, offset)
+        assert count == len(row_columns)
+        offset += 2
+        values = []
+        for column in row_columns:
+            (length,) = struct.unpack_from("!i", data, offset)
+            offset += 4
+            if length == -1:
+                values.append(None)
+                continue
+            field = data[offset : offset + length]
+            offset += length
+            type_name, is_enum = types[column]
+            if is_enum or type_name in ("text", "varchar"):
+                values.append(field.decode("utf-8"))
+            elif type_name == "bool":
+                values.append(struct.unpack("!?", field)[0])
+            elif type_name == "date":
+                days = struct.unpack("!i", field)[0]
+                values.append(binary_copy.epoch_date + timedelta(days=days))
+            elif type_name == "timestamptz":
+                micros = struct.unpack("!q", field)[0]
+                values.append(binary_copy.epoch + timedelta(microseconds=micros))
+            else:
+                format = {2: "!h", 4: "!i", 8: "!q"}[length]
+                values.append(struct.unpack(format, field)[0])
+        rows.append(values)
+    return rows
+
+
+def strings(*rows, row_columns=None):
+    """A frame of strings, as read from the CSV files of the pipes"""
+    return pl.DataFrame(
+        list(rows),
+        schema={column: pl.String for column in row_columns or columns},
+        orient="row",
+    )
+
+
+def test_round_trip():
+    encode = binary_copy.frame_encoder(columns, types)
+    frame = strings(
+        [
+            "42",
+            str(2**40),
+            "-3",
+            "true",
+            "Äänestys ✓",
+            "yes",
+            "2015-02-10",
+            "2015-02-10 14:03:17 Europe/Helsinki",
+        ],
+        ["7", "0", "0", "f", "x" * 100, "no", "2015-02-11", "2015-02-11T10:00:00Z"],
+    )
+    assert decode(encode(frame)) == [
+        [
+            42,
+            2**40,
+            -3,
+            True,
+            "Äänestys ✓",
+            "yes",
+            date(2015, 2, 10),
+            datetime(2015, 2, 10, 12, 3, 17, tzinfo=UTC),
+        ],
+        [
+            7,
+            0,
+            0,
+            False,
+            "x" * 100,
+            "no",
+            date(2015, 2, 11),
+            datetime(2015, 2, 11, 10, tzinfo=UTC),
+        ],
+    ]
+
+
+def test_typed_columns():
+    encode = binary_copy.frame_encoder(columns, types)
+    frame = pl.DataFrame(
+        {
+            "id": [1, None],
+            "big": [2**40, None],
+            "small": [3, None],
+            "flag": [True, None],
+            "name": ["a", None],
+            "vote": ["absent", None],
+            "day": [date(2015, 2, 10), None],
+            "at": [datetime(2015, 2, 10, 12, tzinfo=UTC), None],
+        }
+    )
+    assert decode(encode(frame)) == [
+        [
+            1,
+            2**40,
+            3,
+            True,
+            "a",
+            "absent",
+            date(2015, 2, 10),
+            datetime(2015, 2, 10, 12, tzinfo=UTC),
+        ],
+        [None] * 8,
+    ]
+
+
+def test_empty_values_are_null():
+    encode = binary_copy.frame_encoder(columns, types)
+    frame = strings([None, "", None, "", "", None, "", None])
+    assert decode(encode(frame)) == [[None] * 8]
+
+
+def test_long_texts():
+    # Long texts are copied row by row instead of scattered byte by byte
+    encode = binary_copy.frame_encoder(["name"], types)
+    texts = ["ä" * 1000, None, "", "b" * 10]
+    frame = strings(*([text] for text in texts), row_columns=["name"])
+    assert decode(encode(frame), ["name"]) == [["ä" * 1000], [None], [None], ["b" * 10]]
+
+
+def test_empty_frame():
+    encode = binary_copy.frame_encoder(columns, types)
+    assert bytes(encode(strings())) == b""
+
+
+def test_frame_must_match_columns():
+    encode = binary_copy.frame_encoder(columns, types)
+    with pytest.raises(ValueError):
+        encode(strings(["1"], row_columns=["id"]))
+
+
+def test_out_of_range():
+    encode = binary_copy.frame_encoder(["small"], types)
+    with pytest.raises(ValueError, match="small"):
+        encode(strings(["40000"], row_columns=["small"]))
+
+
+def test_unknown_type():
+    with pytest.raises(ValueError, match="jsonb"):
+        binary_copy.frame_encoder(["data"], {"data": ("jsonb", False)})
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2015-02-10T14:03:17+02:00", datetime(2015, 2, 10, 12, 3, 17, tzinfo=UTC)),
+        ("2015-02-10 14:03:17", datetime(2015, 2, 10, 14, 3, 17, tzinfo=UTC)),
+        # Ambiguous at the end of summer time: the later offset, as in postgres
+        (
+            "2015-10-25 03:30:00 Europe/Helsinki",
+            datetime(2015, 10, 25, 1, 30, tzinfo=UTC),
+        ),
+        # Skipped at the start of summer time: the offset before the shift
+        (
+            "2015-03-29 03:30:00 Europe/Helsinki",
+            datetime(2015, 3, 29, 1, 30, tzinfo=UTC),
+        ),
+    ],
+)
+def test_parse_timestamp(value, expected):
+    # Times of different zones with fold=1 never compare equal, so in UTC
+    assert binary_copy.parse_timestamp(value).astimezone(UTC) == expected
+    encode = binary_copy.frame_encoder(["at"], types)
+    assert decode(encode(strings([value], row_columns=["at"])), ["at"]) == [[expected]]
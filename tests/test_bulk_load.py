@@ -0,0 +1,81 @@
+import psycopg2
+import pytest
+import votes_pipe
+from db import bulk_load, copy_csv
+
+
+@pytest.fixture
+def ballots(query):
+    query("INSERT INTO persons (id) VALUES (1), (2);")
+    query("INSERT INTO parliamentary_groups (id) VALUES ('kesk'), ('sd');")
+    query("INSERT INTO ballots (id) VALUES (1), (2);")
+
+
+indexes_query = (
+    "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+    "AND tablename = 'votes';"
+)
+triggers_query = (
+    "SELECT bool_and(tgenabled = 'O') FROM pg_trigger "
+    "WHERE tgrelid = 'votes'::regclass;"
+)
+
+
+def _indexes(cursor):
+    cursor.execute(indexes_query)
+    return {name for (name,) in cursor}
+
+
+def _triggers_enabled(cursor):
+    cursor.execute(triggers_query)
+    return cursor.fetchone()[0]
+
+
+def _copy_votes(cursor, path, rows):
+    path.write_text("".join(f"{row}\n" for row in rows), encoding="utf-8")
+    with open(path, encoding="utf-8") as f:
+        copy_csv(cursor, "votes", votes_pipe.columns, f, header=False)
+
+
+def test_an_empty_table_is_loaded_without_its_indexes_and_triggers(
+    query, ballots, tmp_path
+):
+    with bulk_load("votes") as cursor:
+        assert _indexes(cursor) == {"votes_pkey"}
+        assert not _triggers_enabled(cursor)
+        assert "votes" in cursor.freezable
+        _copy_votes(cursor, tmp_path / "votes.csv", ["1,1,yes,kesk", "2,1,no,sd"])
+
+    assert "votes_pg_id_idx" in {name for (name,) in query(indexes_query)}
+    assert query(triggers_query) == [(True,)]
+    assert query(
+        "SELECT ballot_id, person_id, vote::text, pg_id FROM votes ORDER BY 1, 2;"
+    ) == [(1, 1, "yes", "kesk"), (1, 2, "no", "sd")]
+
+
+def test_a_table_with_rows_keeps_its_indexes(query, ballots, tmp_path):
+    query("INSERT INTO votes (ballot_id, person_id, vote) VALUES (1, 1, 'yes');")
+    with bulk_load("votes") as cursor:
+        assert "votes_pg_id_idx" in _indexes(cursor)
+        assert _triggers_enabled(cursor)
+        _copy_votes(cursor, tmp_path / "votes.csv", ["2,1,no,sd"])
+    assert query("SELECT count(*) FROM votes;") == [(2,)]
+
+
+def test_foreign_keys_are_validated(query, ballots, tmp_path):
+    with (
+        pytest.raises(psycopg2.IntegrityError, match="votes_person_id_fkey"),
+        bulk_load("votes") as cursor,
+    ):
+        _copy_votes(cursor, tmp_path / "votes.csv", ["1,1,yes,kesk", "3,1,no,sd"])
+
+    # The failed load is rolled back along with the indexes it dropped
+    assert query("SELECT count(*) FROM votes;") == [(0,)]
+    assert "votes_pg_id_idx" in {name for (name,) in query(indexes_query)}
+
+
+def test_replaced_tables_are_emptied(query, ballots, tmp_path):
+    query("INSERT INTO votes (ballot_id, person_id, vote) VALUES (1, 1, 'yes');")
+    with bulk_load("votes", replace=["votes"]) as cursor:
+        _copy_votes(cursor, tmp_path / "votes.csv", ["2,2,absent,kesk"])
+    assert query("SELECT ballot_id, person_id FROM votes;") == [(2, 2)]
@@ -0,0 +1,134 @@
+import polars as pl
+import pytest
+from db import get_connection
+from group_attribution import GroupAttribution, reattribute
+from orchestrator import schema_path
+
+
+@pytest.fixture
+def memberships(query):
+    query("INSERT INTO persons (id) VALUES (1), (2), (3);")
+    query("INSERT INTO parliamentary_groups (id) VALUES ('kesk'), ('sd'), ('vas');")
+    # Person 1 switched from kesk to sd, person 2 left vas for good
+    query(
+        """
+        INSERT INTO mp_parliamentary_group_memberships
+            (person_id, pg_id, start_date, end_date)
+        VALUES
+            (1, 'kesk', '2011-04-20', '2015-06-30'),
+            (1, 'sd', '2015-07-01', NULL),
+            (2, 'vas', '2011-04-20', '2014-12-31');
+        """
+    )
+
+
+@pytest.fixture
+def groups(memberships):
+    conn = get_connection()
+    conn.autocommit = True
+    yield GroupAttribution(conn)
+    conn.close()
+
+
+def test_group_of_the_day(groups):
+    assert groups.groups(
+        [
+            (1, "2011-04-19"),
+            (1, "2011-04-20"),
+            (1, "2015-06-30"),
+            (1, "2015-07-01"),
+            (2, "2014-12-31"),
+            (2, "2015-01-01"),
+            (3, "2015-01-01"),
+        ]
+    ) == {
+        (1, "2011-04-19"): None,
+        (1, "2011-04-20"): "kesk",
+        (1, "2015-06-30"): "kesk",
+        (1, "2015-07-01"): "sd",
+        (2, "2014-12-31"): "vas",
+        (2, "2015-01-01"): None,
+        (3, "2015-01-01"): None,
+    }
+
+
+def test_attribute_rows(groups):
+    rows = [{"speaker_id": "1"}, {"speaker_id": "2"}, {"speaker_id": None}]
+    groups.attribute(
+        rows,
+        [
+            "2015-07-01 09:00:00 Europe/Helsinki",
+            "2013-02-10 14:03:17 Europe/Helsinki",
+            "2013-02-10 14:03:17 Europe/Helsinki",
+        ],
+        "speaker_id",
+    )
+    assert [row["pg_id"] for row in rows] == ["sd", "vas", None]
+
+
+def test_attribute_frame(groups):
+    frame = pl.DataFrame(
+        {
+            "person_id": ["2", "1", "1", "3"],
+            "day": ["2013-02-10 14:03", "2015-07-01 09:00", "2015-06-30", None],
+        }
+    )
+    assert groups.attribute_frame(frame, day_column="day").rows() == [
+        ("2", "2013-02-10 14:03", "vas"),
+        ("1", "2015-07-01 09:00", "sd"),
+        ("1", "2015-06-30", "kesk"),
+        ("3", None, None),
+    ]
+
+
+def _votes(query):
+    query("INSERT INTO ballots (id, start_time) VALUES (1, '2015-06-30 23:30+03');")
+    query(
+        "INSERT INTO votes (ballot_id, person_id, vote) VALUES "
+        "(1, 1, 'yes'), (1, 2, 'no');"
+    )
+
+
+def test_reattribute(query, memberships):
+    _votes(query)
+    # The ballot is on the last day of person 1 in kesk, Helsinki time
+    conn = get_connection()
+    with conn, conn.cursor() as cursor:
+        reattribute(cursor, [1])
+    conn.close()
+    assert query("SELECT person_id, pg_id FROM votes ORDER BY 1;") == [
+        (1, "kesk"),
+        (2, None),
+    ]
+
+
+def _apply_schema():
+    conn = get_connection()
+    conn.set_client_encoding("UTF8")  # As in conftest.py
+    with conn, conn.cursor() as cursor, open(schema_path, encoding="utf-8") as f:
+        cursor.execute(f.read())
+    conn.close()
+
+
+def test_the_schema_migrates_a_database_without_groups(query, memberships):
+    _votes(query)
+    for table in [
+        "votes",
+        "speeches",
+        "proposal_signatures",
+        "committee_report_signatures",
+    ]:
+        query(f"ALTER TABLE {table} DROP COLUMN pg_id CASCADE;")
+
+    _apply_schema()
+    assert query("SELECT person_id, pg_id FROM votes ORDER BY 1;") == [
+        (1, "kesk"),
+        (2, None),
+    ]
+
+    # Applying it again adds nothing
+    _apply_schema()
+    assert query(
+        "SELECT count(*) FROM pg_constraint WHERE conrelid = 'votes'::regclass "
+        "AND contype = 'f';"
+    ) == [(3,)]
@@ -0,0 +1,26 @@
+import json
+import os
+
+import instrumentation
+from instrumentation import instrument
+
+
+def test_the_rows_of_csv_outputs_are_counted_without_their_header(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(instrumentation, "reports_dir", str(tmp_path / "reports"))
+    monkeypatch.setenv("PIPELINE_RUN_ID", "run")
+    votes = tmp_path / "votes.csv"
+    speeches = tmp_path / "speeches.csv"
+    empty = tmp_path / "empty.csv"
+    votes.write_text("ballot_id,vote\n1,yes\n2,no\n", encoding="utf-8")
+    speeches.write_text('id,text\n1,"two\nlines"\n', encoding="utf-8")
+    empty.write_text("id,text\n", encoding="utf-8")
+
+    with instrument("stage", [str(votes), str(speeches), str(empty)]):
+        pass
+
+    with open(os.path.join(tmp_path, "reports", "run", "stage.json")) as f:
+        report = json.load(f)
+    assert report["rows_by_target"] == {"votes.csv": 2, "speeches.csv": 1}
+    assert report["rows"] == 3
@@ -0,0 +1,69 @@
+import graphlib
+
+import orchestrator
+
+schema = """
+CREATE TABLE IF NOT EXISTS persons (
+    id INT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS ballots (
+    id INT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS votes (
+    ballot_id INT REFERENCES ballots(id),
+    person_id INT REFERENCES persons(id),
+    PRIMARY KEY(ballot_id, person_id)
+);
+
+CREATE TABLE IF NOT EXISTS speeches (
+    id VARCHAR(15) PRIMARY KEY,
+    person_id INT REFERENCES persons(id),
+    response_to VARCHAR(15) REFERENCES speeches(id)
+);
+"""
+
+
+def test_foreign_keys(tmp_path):
+    path = tmp_path / "schema.sql"
+    path.write_text(schema, encoding="utf-8")
+    assert orchestrator.foreign_keys(path) == {
+        "persons": set(),
+        "ballots": set(),
+        "votes": {"ballots", "persons"},
+        # References of a table to itself do not order imports
+        "speeches": {"persons"},
+    }
+
+
+def test_foreign_keys_of_the_schema():
+    references = orchestrator.foreign_keys()
+    assert references["votes"] == {"ballots", "persons", "parliamentary_groups"}
+    assert "speeches" not in references["speeches"]
+
+
+def test_imports_follow_the_tables_they_reference():
+    loaded_by = {}
+    for pipe, tables in orchestrator.pipe_tables.items():
+        for table in tables:
+            loaded_by.setdefault(table, set()).add(pipe)
+    references = orchestrator.foreign_keys()
+
+    for direct in (False, True):
+        stages = orchestrator.build_stages(direct=direct)
+        graph = {name: stage.after for name, stage in stages.items()}
+        order = list(graphlib.TopologicalSorter(graph).static_order())
+        position = {name: i for i, name in enumerate(order)}
+        for pipe, tables in orchestrator.pipe_tables.items():
+            for table in tables:
+                for referenced in references.get(table, ()):
+                    if referenced in tables:
+                        continue
+                    for loader in loaded_by.get(referenced, ()):
+                        assert position[f"import:{loader}"] < position[f"import:{pipe}"]
+
+
+def test_unrelated_imports_do_not_wait_for_each_other():
+    assert "ballots" not in orchestrator.import_after.get("speeches", [])
+    assert "speeches" not in orchestrator.import_after.get("votes", [])
@@ -0,0 +1,112 @@
+import polars as pl
+import psycopg2
+import pytest
+from db import bulk_load
+from sinks import copy_frames, copy_into, copy_parallel
+
+columns = ["ballot_id", "person_id", "vote", "pg_id"]
+
+
+def frames(*parts):
+    return [pl.DataFrame(rows, schema=columns, orient="row") for rows in parts]
+
+
+@pytest.fixture
+def ballots(query):
+    query("INSERT INTO persons (id) VALUES (1), (2), (3);")
+    query("INSERT INTO parliamentary_groups (id) VALUES ('kesk'), ('sd');")
+    query("INSERT INTO ballots (id) VALUES (1), (2);")
+
+
+def _state(query):
+    """The votes, the secondary indexes and whether every trigger is enabled"""
+    votes = query(
+        "SELECT ballot_id, person_id, vote::text, pg_id FROM votes ORDER BY 1, 2;"
+    )
+    indexes = query(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+        "AND tablename = 'votes' AND indexname <> 'votes_pkey';"
+    )
+    triggers = query(
+        "SELECT bool_and(tgenabled = 'O') FROM pg_trigger "
+        "WHERE tgrelid = 'votes'::regclass;"
+    )
+    return votes, [name for (name,) in indexes], triggers[0][0]
+
+
+def test_parts_are_copied_into_the_empty_table(query, ballots):
+    parts = frames(
+        [(1, 1, "yes", "kesk"), (1, 2, "no", "sd")],
+        [(1, 3, "absent", None)],
+        [(2, 1, "abstain", "kesk")],
+    )
+    assert copy_parallel("votes", columns, parts)
+    assert _state(query) == (
+        [
+            (1, 1, "yes", "kesk"),
+            (1, 2, "no", "sd"),
+            (1, 3, "absent", None),
+            (2, 1, "abstain", "kesk"),
+        ],
+        ["votes_pg_id_idx"],
+        True,
+    )
+
+
+def test_a_table_with_rows_is_left_to_the_caller(query, ballots):
+    query("INSERT INTO votes VALUES (1, 1, 'yes', 'kesk');")
+    assert not copy_parallel("votes", columns, frames([(2, 1, "no", "kesk")]))
+    assert _state(query)[0] == [(1, 1, "yes", "kesk")]
+
+
+def test_a_failed_copy_leaves_the_table_empty(query, ballots):
+    # Person 4 does not exist, which the check of the foreign keys finds
+    parts = frames([(1, 1, "yes", "kesk")], [(1, 4, "no", "sd")])
+    with pytest.raises(psycopg2.IntegrityError, match="votes_person_id_fkey"):
+        copy_parallel("votes", columns, parts)
+    assert _state(query) == ([], ["votes_pg_id_idx"], True)
+
+    with pytest.raises(psycopg2.DataError):
+        copy_parallel("votes", columns, frames([(1, 1, "maybe", "kesk")]))
+    assert _state(query) == ([], ["votes_pg_id_idx"], True)
+
+
+def test_binary_copy_into(query, tmp_path):
+    # Quoted line breaks and commas, a timestamp in a zone and an empty value
+    path = tmp_path / "ballots.csv"
+    path.write_text(
+        "id,title,start_time\n"
+        '1,"Line\nbreak, and ""quotes""",2015-02-10 14:03:17 Europe/Helsinki\n'
+        "2,,2015-02-10T12:00:00+00:00\n",
+        encoding="utf-8",
+    )
+    columns = ["id", "title", "start_time"]
+    with bulk_load("ballots") as cursor:
+        copy_into(cursor, str(path), "ballots", columns, binary=True)
+    rows = "SELECT id, title, start_time::text FROM ballots ORDER BY id;"
+    assert query(rows) == [
+        (1, 'Line\nbreak, and "quotes"', "2015-02-10 12:03:17+00"),
+        (2, None, "2015-02-10 12:00:00+00"),
+    ]
+
+    # Merged by id, over several frames
+    frames = [
+        pl.DataFrame({"id": ["2"], "title": ["New"], "start_time": [None]}),
+        pl.DataFrame({"id": ["3"], "title": ["Third"], "start_time": [None]}),
+    ]
+    with bulk_load("ballots") as cursor:
+        copy_frames(cursor, "ballots", columns, frames, ["id"])
+    assert query(rows)[1:] == [(2, "New", None), (3, "Third", None)]
+
+
+def test_a_failed_encoding_stops_the_copy(query):
+    def frames():
+        yield pl.DataFrame({"id": ["1"]})
+        yield pl.DataFrame({"id": ["not a number"]})
+
+    with (
+        pytest.raises(pl.exceptions.InvalidOperationError),
+        bulk_load("ballots") as cursor,
+    ):
+        copy_frames(cursor, "ballots", ["id"], frames())
+    assert query("SELECT count(*) FROM ballots;") == [(0,)]
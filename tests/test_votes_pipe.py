@@ -0,0 +1,109 @@
+import json
+import os
+
+import polars as pl
+import psycopg2
+import pytest
+import votes_pipe
+from incremental import HashManifest
+
+
+@pytest.fixture
+def ballots(query):
+    query("INSERT INTO persons (id) VALUES (1), (2);")
+    query("INSERT INTO parliamentary_groups (id) VALUES ('kesk'), ('sd');")
+    query("INSERT INTO ballots (id) VALUES (1), (2);")
+
+
+def _import_votes(tmp_path, monkeypatch, rows, changed, deleted=()):
+    """Imports `rows` as the preprocessed votes of the `changed` ballots"""
+    path = tmp_path / "votes.csv"
+    path.write_text(
+        "person_id,ballot_id,vote,pg_id\n" + "".join(f"{row}\n" for row in rows),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(votes_pipe, "csv_path", str(path))
+    manifest = HashManifest("votes")
+    os.makedirs(os.path.dirname(manifest.pending_path), exist_ok=True)
+    with open(manifest.pending_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "hashes": {key: key for key in changed},
+                "changed": list(changed),
+                "deleted": list(deleted),
+            },
+            f,
+        )
+    votes_pipe.import_data()
+    return manifest
+
+
+def _votes(query):
+    return query(
+        "SELECT ballot_id, person_id, vote::text, pg_id FROM votes ORDER BY 1, 2;"
+    )
+
+
+def test_import(query, ballots, hashes_dir, tmp_path, monkeypatch):
+    manifest = _import_votes(
+        tmp_path,
+        monkeypatch,
+        ["1,1,yes,kesk", "2,1,no,sd", "1,2,absent,kesk", "2,2,yes,"],
+        ["1", "2"],
+    )
+    assert _votes(query) == [
+        (1, 1, "yes", "kesk"),
+        (1, 2, "no", "sd"),
+        (2, 1, "absent", "kesk"),
+        (2, 2, "yes", None),
+    ]
+    assert manifest.pending() is None
+
+    # A changed ballot is replaced as a whole, the others are kept
+    _import_votes(tmp_path, monkeypatch, ["1,2,abstain,kesk"], ["2"])
+    assert _votes(query) == [
+        (1, 1, "yes", "kesk"),
+        (1, 2, "no", "sd"),
+        (2, 1, "abstain", "kesk"),
+    ]
+
+
+def test_a_failed_import_keeps_the_ballots(
+    query, ballots, hashes_dir, tmp_path, monkeypatch
+):
+    _import_votes(tmp_path, monkeypatch, ["1,1,yes,kesk", "1,2,no,sd"], ["1", "2"])
+
+    with pytest.raises(psycopg2.DataError):
+        _import_votes(tmp_path, monkeypatch, ["1,2,maybe,sd"], ["2"])
+    # Neither the deletion nor the copy went through
+    assert _votes(query) == [(1, 1, "yes", "kesk"), (2, 1, "no", "sd")]
+    assert HashManifest("votes").pending() == (["2"], [])
+
+
+def _changed_votes(monkeypatch, rows):
+    """The changed votes of the raw `(person, ballot, vote)` rows"""
+    raw = pl.LazyFrame(
+        rows,
+        schema=["EdustajaHenkiloNumero", "AanestysId", "EdustajaAanestys"],
+        orient="row",
+    )
+    monkeypatch.setattr(votes_pipe, "scan", lambda path: raw)
+    manifest = HashManifest("votes")
+    votes = votes_pipe.changed_votes(manifest)
+    manifest.save_pending()
+    manifest.commit()
+    return votes.rows()
+
+
+def test_only_the_votes_of_changed_ballots_are_preprocessed(hashes_dir, monkeypatch):
+    rows = [(1, 1, "Jaa"), (2, 1, "Ei "), (1, 2, "Poissa"), (2, 2, "Tyhjää")]
+    assert _changed_votes(monkeypatch, rows) == [
+        (1, 1, "yes"),
+        (2, 1, "no"),
+        (1, 2, "absent"),
+        (2, 2, "abstain"),
+    ]
+    # Reordered rows are the same ballots, a changed vote changes its ballot
+    assert _changed_votes(monkeypatch, rows[::-1]) == []
+    rows[3] = (2, 2, "Jaa")
+    assert _changed_votes(monkeypatch, rows) == [(1, 2, "absent"), (2, 2, "yes")]
@@ -0,0 +1,263 @@
+import os
+import re
+
+import pytest
+import render_cache
+from lxml import etree
+from XML_parsing_help_functions import (
+    NS,
+    Allekirjoittaja_parse,
+    AsiaSisaltoKuvaus_parse_to_markdown,
+    DocumentIndex,
+    KappaleKooste_parse,
+    MarkdownRenderer,
+    Nimeke_parse,
+    Osallistuja_parse,
+    PaatosOsa_parse_to_markdown,
+    ParserError,
+    PerusteluOsa_parse_to_markdown,
+    Ponsi_parse_to_markdown,
+    Saados_parse,
+    absentee_parse,
+    date_parse,
+    id_parse,
+    rollcall_id_parse,
+    saados_to_md,
+    tau_to_md,
+    xml_to_markdown,
+)
+
+# Vaski XML fragments, and the markdown the parsers rendered of them before
+# they were rewritten, which the current parsers are held to
+fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _fixture(name):
+    return etree.parse(os.path.join(fixtures_dir, name)).getroot()
+
+
+def _expected(name):
+    with open(os.path.join(fixtures_dir, name), encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+@pytest.fixture(autouse=True)
+def renders(tmp_path, monkeypatch):
+    """Keeps the renders of the test in a cache of its own"""
+    cache = render_cache.RenderCache(os.path.join(tmp_path, "renders.sqlite"))
+    monkeypatch.setattr(render_cache, "_caches", {os.getpid(): cache})
+    yield
+    cache.close()
+
+
+def _tables():
+    return _fixture("tables.xml").findall("tau:table", NS)
+
+
+def test_plain_tables_render_as_with_pandas():
+    # As rendered by DataFrame.to_markdown, title blocks with a single column
+    # left out
+    grid, header_only, _ = _tables()
+    assert tau_to_md(grid) == (
+        "| Tulolaji                       | Nykyinen        | Ehdotettu   |\n"
+        "|:-------------------------------|:----------------|:------------|\n"
+        "| Ansiotulo                      | progressiivinen | ennallaan   |\n"
+        "| Pääomatulo <br> yli raja-arvon |                 | suora kanta |"
+    )
+    assert tau_to_md(header_only) == "| Liite   |    |\n|---------|----|"
+
+
+def test_spanning_entries_keep_the_entries_after_them_in_place():
+    # pandas put every entry without a colname into one column, and the
+    # columns of c2 and c3 below the spanning heading
+    *_, spans = _tables()
+    assert tau_to_md(spans) == (
+        "| Ryhmä        | Vaikutus   |            |\n"
+        "|:-------------|:-----------|:-----------|\n"
+        "| Kotitaloudet | tulot      | kasvavat   |\n"
+        "|              | menot      | pienenevät |\n"
+        "| Yritykset    | voitot     | a \\| b     |"
+    )
+
+
+@pytest.mark.parametrize(
+    ("section", "parse"),
+    [
+        ("PerusteluOsa", PerusteluOsa_parse_to_markdown),
+        ("SisaltoKuvaus", AsiaSisaltoKuvaus_parse_to_markdown),
+        ("PonsiOsa", Ponsi_parse_to_markdown),
+    ],
+)
+def test_sections_render_as_with_the_match_based_parser(section, parse):
+    # Except for the footnote ids, which were made unique after the rewrite
+    root = _fixture("government_proposal.xml")
+    assert parse(root, NS) == _expected(f"government_proposal.{section}.md")
+
+
+def _element(xml, tag="sis:KappaleKooste"):
+    namespaces = " ".join(
+        f'xmlns:{prefix}="{NS[prefix]}"' for prefix in ("asi", "sis", "sis1")
+    )
+    return etree.fromstring(f'<{tag} {namespaces} xmlns:x="urn:x">{xml}</{tag}>')
+
+
+def test_tags_of_other_namespaces_are_rendered_by_their_local_name():
+    paragraph = _element("a <x:LihavaTeksti>b</x:LihavaTeksti><x:LihavaTeksti/>c")
+    assert KappaleKooste_parse(paragraph) == "a **b** c\n\n"
+
+
+def test_footnotes_get_ids_of_their_own():
+    footnote = "<sis1:AlaviiteTeksti>Ibid.</sis1:AlaviiteTeksti>"
+    paragraphs = [
+        _element(f"a{footnote} b{footnote}"),
+        _element(f"c{footnote}"),
+    ]
+    rendered = [KappaleKooste_parse(paragraph) for paragraph in paragraphs]
+    ids = [i for md in rendered for i in re.findall(r"^\[\^(\w+)\]:", md, re.M)]
+    assert len(ids) == len(set(ids)) == 3
+    # and the same ones every time
+    assert [KappaleKooste_parse(paragraph) for paragraph in paragraphs] == rendered
+
+
+def test_unknown_tags_raise_parser_errors():
+    with pytest.raises(ParserError, match="Unknown tag: Vilkkuva"):
+        KappaleKooste_parse(_element("<sis1:Vilkkuva>a</sis1:Vilkkuva>"))
+    with pytest.raises(ParserError, match="Unknown tag: KappaleKooste2"):
+        xml_to_markdown(_element("<sis:KappaleKooste2/>", "asi:PerusteluOsa"))
+    with pytest.raises(ParserError, match="Unknown tag: Outo"):
+        xml_to_markdown(_element("<x:Outo/>", "asi:PerusteluOsa"))
+
+
+def test_the_handler_tables_are_built_with_the_class():
+    italic = f"{{{NS['sis1']}}}KursiiviTeksti"
+    assert (
+        MarkdownRenderer.INLINE_TAGS[italic]
+        == MarkdownRenderer.INLINE["KursiiviTeksti"]
+    )
+    renderer = MarkdownRenderer()
+    renderer.render(_fixture("government_proposal.xml").find(".//asi:PerusteluOsa", NS))
+    assert vars(renderer) == {}
+
+
+def test_laws_without_tables_render_as_with_the_repeated_searches():
+    root = _fixture("government_proposal.xml")
+    assert Saados_parse(root, NS) == _expected("government_proposal.Saados.md")
+
+
+def test_the_tables_of_a_law_are_rendered_once_where_they_occur():
+    # The repeated searches put every table of the law after each preamble
+    # paragraph, introduction and item, and their text into the moments
+    law = _fixture("law_with_tables.xml")
+    assert saados_to_md(law, NS) == _expected("law_with_tables.md")
+
+
+# The lookups of the extractors, as arguments of DocumentIndex.findall, and the
+# searches they made before the index
+lookups = [
+    (("asi:PerusteluOsa",), None, ".//asi:PerusteluOsa"),
+    (
+        ("vsk:AsiaKuvaus", "asi:SisaltoKuvaus", "asi:AsiaKuvaus"),
+        None,
+        ".//vsk:AsiaKuvaus | .//asi:SisaltoKuvaus | .//asi:AsiaKuvaus",
+    ),
+    (("vsk:PaatosOsa", "asi:PaatosOsa"), None, ".//vsk:PaatosOsa | .//asi:PaatosOsa"),
+    (("asi:PonsiOsa",), None, ".//asi:PonsiOsa"),
+    (("jme:JulkaisuMetatieto",), None, ".//jme:JulkaisuMetatieto"),
+    (("asi:Allekirjoittaja",), None, ".//asi:Allekirjoittaja"),
+    (("met1:NimekeTeksti",), "met:Nimeke", ".//met:Nimeke//met1:NimekeTeksti"),
+    (("org:Henkilo",), "vsk:OsallistujaOsa", ".//vsk:OsallistujaOsa//org:Henkilo"),
+    (
+        ("vsk:KohtaAsiakirja",),
+        "vsk:MuuAsiakohta",
+        ".//vsk:MuuAsiakohta//vsk:KohtaAsiakirja",
+    ),
+]
+children_lookups = [
+    ("saa:Saados", "saa:SaadosOsa", ".//saa:SaadosOsa/saa:Saados"),
+    ("org:Henkilo", "met:Toimija", ".//met:Toimija/org:Henkilo"),
+]
+
+
+@pytest.mark.parametrize(
+    "name", ["government_proposal.xml", "committee_report.xml", "minutes.xml"]
+)
+def test_index_lookups_find_what_the_searches_found(name):
+    root = _fixture(name)
+    doc = DocumentIndex(root)
+    scopes = [doc] + [
+        doc.scoped(element)
+        for element in root.iterdescendants()
+        if isinstance(element.tag, str)
+    ]
+    for scope in scopes:
+        for tags, inside, search in lookups:
+            found = scope.root.xpath(search, namespaces=NS)
+            assert scope.findall(*tags, inside=inside) == found
+            if len(tags) == 1 and inside is None:
+                assert scope.find(tags[0]) == (found[0] if found else None)
+        for tag, parent, search in children_lookups:
+            found = scope.root.xpath(search, namespaces=NS)
+            assert scope.children(tag, parent) == found
+
+
+def test_elements_are_grouped_by_their_ancestors():
+    root = _fixture("committee_report.xml")
+    objections = root.findall(".//vas:JasenMielipideOsa", NS)
+    assert DocumentIndex(root).group_by_ancestor(
+        "asi:Allekirjoittaja", "vas:JasenMielipideOsa"
+    ) == {
+        objection: objection.findall(".//asi:Allekirjoittaja", NS)
+        for objection in objections
+    }
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_extractors_return_what_they_did_with_the_searches(indexed):
+    # As returned by the extractors from plain elements before DocumentIndex
+    root = _fixture("committee_report.xml")
+    document = DocumentIndex(root) if indexed else root
+    report = root.find(".//vml:Mietinto", NS)
+    first, second = report.findall(".//vas:JasenMielipideOsa", NS)
+    if indexed:
+        report, first, second = map(document.scoped, (report, first, second))
+    eid = "VaVM 5/2024 vp"
+    assert id_parse(document, NS) == eid
+    assert date_parse(document, NS) == "2024-05-02"
+    assert Nimeke_parse(document, NS) == (
+        "Valtiovarainvaliokunnan mietintö\n\n"
+        "Hallituksen esitys tuloverolain muuttamisesta"
+    )
+    assert AsiaSisaltoKuvaus_parse_to_markdown(report, NS) == (
+        "Eduskunta lähetti asian valiokuntaan.\n\n\n\n"
+        "Esityksessä muutetaan tuloverolakia.\n\n"
+    )
+    assert PerusteluOsa_parse_to_markdown(report, NS) == (
+        "Valiokunta puoltaa esitystä.\n\n"
+    )
+    assert PaatosOsa_parse_to_markdown(document, NS) == (
+        "Eduskunta hyväksyy lakiehdotuksen.\n\n\n\n"
+        "Eduskunta hyväksyy lakiehdotuksen muutettuna.\n\n"
+    )
+    assert Saados_parse(document, NS) == "# Laki\n\n\nValiokunnan muuttama momentti."
+    assert Osallistuja_parse(document, NS, eid) == [
+        {"committee_report_id": "vavm 5/2024 vp", "person_id": 1001},
+        {"committee_report_id": "vavm 5/2024 vp", "person_id": 1002},
+    ]
+    assert [
+        record["person_id"] for record in Allekirjoittaja_parse(document, NS, eid, None)
+    ] == [1001, 1002, 1003]
+    assert PerusteluOsa_parse_to_markdown(first, NS) == "Esitys on hylättävä.\n\n"
+    assert Ponsi_parse_to_markdown(first, NS) == (
+        "Ehdotamme, että lakiehdotus hylätään.\n\n"
+    )
+    assert PaatosOsa_parse_to_markdown(first, NS) == ""
+    assert Ponsi_parse_to_markdown(second, NS) == "Ehdotamme, että 1 § muutetaan.\n\n"
+
+    minutes = _fixture("minutes.xml")
+    if indexed:
+        minutes = DocumentIndex(minutes)
+    assert rollcall_id_parse(minutes) == "EDK-2024-AK-3"
+    assert absentee_parse(minutes) == [
+        {"person_id": 1001, "work_related": True},
+        {"person_id": 1002, "work_related": False},
+    ]